@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import asyncio
+from urllib.parse import parse_qs
+# serve with: uvicorn asgi:app --workers <n>
+
+from gadvi.serving import MicroBatcher, authorized, parse_k
+from gadvi.utils import StageTimer
+from server import admin_token, cache, holder, metrics, start_background_threads
+
+# the predict requests that arrive within the window are scored together
+batch_window = float(os.getenv('GADVI_BATCH_WINDOW_MS', 2)) / 1000
+batch_size = int(os.getenv('GADVI_BATCH_SIZE', 256))
+batcher = MicroBatcher(holder, window=batch_window, max_batch=batch_size, cache=cache)
+
+
+# the routes of the latency metrics, the rest are counted as unmatched
+routes = {('GET', '/predict'), ('POST', '/predict/batch'), ('POST', '/reload'), ('GET', '/metrics'), ('GET', '/')}
+
+
+async def send_json(send, data, message, status_code, is_error, **extra):
+    with StageTimer('server.encode'):
+        body = json.dumps(dict(data=data, **extra, message=message, statusCode=status_code, isError=is_error)).encode()
+    await send({'type': 'http.response.start', 'status': status_code,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def read_header(scope, name):
+    for key, value in scope['headers']:
+        if key.decode('latin-1').lower() == name.lower():
+            return value.decode('latin-1')
+    return None
+
+
+async def read_json(receive):
+    body = b''
+    more = True
+    while more:
+        message = await receive()
+        body += message.get('body', b'')
+        more = message.get('more_body', False)
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
+
+
+async def app(scope, receive, send):
+    """ ASGI application with the same routes as server.py, with micro-batching of /predict """
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                start_background_threads()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    route = (scope['method'], scope['path'].rstrip('/') or '/')
+    start = time.perf_counter()
+    status = [500]
+
+    async def observed_send(message):
+        if message['type'] == 'http.response.start':
+            status[0] = message['status']
+        await send(message)
+
+    try:
+        await handle(route, scope, receive, observed_send)
+    finally:
+        metrics.observe(route[1] if route in routes else 'unmatched', status[0], time.perf_counter() - start)
+
+
+async def handle(route, scope, receive, send):
+    """ Answer a request of the routes """
+    try:
+        # Predict route takes one argument: player id, and optionally the country and the operator of the player
+        if route == ('GET', '/predict'):
+            query = parse_qs(scope['query_string'].decode())
+            player = query.get('playerid')
+            if player is None:
+                await send_json(send, None, "Required parameter is missing", 400, True)
+            else:
+                model = holder.model
+                country, operator = query.get('country', [None])[0], query.get('operator', [None])[0]
+                predictions = await batcher.predict(player[0], country=country, operator=operator)
+                await send_json(send, predictions, "Success", 200, False, source=model.source(player[0]))
+
+        # Batch predict route takes a json body: {"playerids": [...], "k": 3}, k is optional, from 1 to MAX_K
+        elif route == ('POST', '/predict/batch'):
+            body = await read_json(receive)
+            if not isinstance(body, dict) or not isinstance(body.get('playerids'), list):
+                await send_json(send, None, "Required parameter is missing", 400, True)
+                return
+            try:
+                k = parse_k(body.get('k'))
+            except ValueError as e:
+                await send_json(send, None, str(e), 400, True)
+            else:
+                model = holder.model
+                predictions = await asyncio.get_running_loop().run_in_executor(
+                    None, model.predict_batch, [str(p) for p in body['playerids']], k)
+                await send_json(send, predictions, "Success", 200, False,
+                                sources={p: model.source(p) for p in predictions})
+
+        # Reload route reloads the configured model in the background, with the same token as server.py. It only
+        # reaches the worker process that handles it, GADVI_WATCH_INTERVAL reloads every worker
+        elif route == ('POST', '/reload'):
+            if not authorized(admin_token, read_header(scope, 'X-Admin-Token')):
+                await send_json(send, None, "Forbidden", 403, True)
+            elif not holder.reload():
+                await send_json(send, None, "A reload is already in progress", 409, True)
+            else:
+                await send_json(send, {'path': holder.path, 'pid': os.getpid()}, "Reload started", 202, False)
+
+        # Prometheus metrics of all the worker processes if GADVI_METRICS_DIR is set, else of this one
+        elif route == ('GET', '/metrics'):
+            body = metrics.render().encode()
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(b'content-type', b'text/plain; version=0.0.4'),
+                                    (b'content-length', str(len(body)).encode())]})
+            await send({'type': 'http.response.body', 'body': body})
+
+        elif route == ('GET', '/'):
+            info = holder.model.get_info()
+            info['path'] = holder.path
+            if holder.last_error:
+                info['last_reload_error'] = holder.last_error
+            if cache is not None:
+                info['cache'] = cache.backend.stats()
+            await send_json(send, info, "Success", 200, False)
+
+        else:
+            await send_json(send, None, f"{scope['method']} {scope['path']} not found", 404, True)
+    except Exception as e:
+        await send_json(send, None, str(e), 500, True)
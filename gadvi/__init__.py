@@ -3,4 +3,6 @@ import logging
 logging.basicConfig(format="%(asctime)s - %(message)s", level=logging.INFO)
 DATA_DIR = "../data"
 PLOTS_DIR = "../results/plots"
+STATISTICS_DIR = "../results/statistics"
+BENCHMARKS_DIR = "../results/benchmarks"
 RECOMMENDERS_DIR = "../results/recommenders"
@@ -0,0 +1,126 @@
+import numpy as np
+from typing import Dict, Optional
+
+
+class IVFIndex:
+    """
+        Inverted file index for approximate maximum inner product search, in pure numpy.
+        The vectors are clustered with k-means and a query only scores the vectors of the clusters whose centroids
+        score best, probing more clusters until enough candidates survive the exclusions.
+        Usage:
+            index = IVFIndex(n_probe=8).build(vectors, ids)
+            best = index.search(query, k=3, exclude=seen_ids)
+    """
+
+    def __init__(self, n_lists: Optional[int] = None, n_probe: int = 8, overfetch: int = 2, n_iter: int = 10):
+        """
+            Initialization
+            :param n_lists: the number of clusters, by default the square root of the number of vectors
+            :param n_probe: the minimum number of clusters to score per query
+            :param overfetch: how many candidates per requested result must survive the exclusions
+            :param n_iter: the k-means iterations
+        """
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.overfetch = overfetch
+        self.n_iter = n_iter
+
+        self.centroids: np.ndarray = np.empty((0, 0), dtype=np.float32)
+        self.offsets: np.ndarray = np.zeros(1, dtype=np.int64)
+        self.ids: np.ndarray = np.empty(0, dtype=np.int32)
+        self.vectors: np.ndarray = np.empty((0, 0), dtype=np.float32)
+        self.clusters: np.ndarray = np.empty(0, dtype=np.int32)
+
+    def build(self, vectors: np.ndarray, ids: np.ndarray, seed: int = 10) -> "IVFIndex":
+        """
+            Cluster the vectors and store them grouped by cluster
+            :param vectors: the (n x d) vectors to index
+            :param ids: the ids the searches return for each vector
+            :param seed: the seed of the k-means initialization
+            :return: the index itself
+        """
+        n_lists = self.n_lists or max(1, int(np.sqrt(vectors.shape[0])))
+        n_lists = min(n_lists, max(1, vectors.shape[0]))
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(vectors.shape[0], n_lists, replace=False)].astype(np.float32)
+
+        assignment = np.zeros(vectors.shape[0], dtype=np.int64)
+        for _ in range(self.n_iter):
+            # nearest centroid by euclidean distance, without the constant norm of the vector
+            assignment = np.argmax(2 * vectors @ centroids.T - (centroids ** 2).sum(axis=1), axis=1)
+            counts = np.bincount(assignment, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, vectors)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+
+        order = np.argsort(assignment, kind="stable")
+        self.centroids = centroids
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))]).astype(np.int64)
+        self.ids = ids[order].astype(np.int32)
+        self.vectors = np.ascontiguousarray(vectors[order], dtype=np.float32)
+
+        # the cluster of every id, -1 for the ids that are not indexed
+        self.clusters = np.full(ids.max() + 1 if ids.shape[0] else 0, -1, dtype=np.int32)
+        self.clusters[ids] = assignment
+        return self
+
+    def search(self, query: np.ndarray, k: int, exclude: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+            Find the ids of the vectors with the highest inner product with the query
+            :param query: the query vector
+            :param k: the number of results
+            :param exclude: the ids that must not be returned (optional)
+            :return: the k best ids, best first, padded with -1
+        """
+        exclude = np.empty(0, dtype=np.int32) if exclude is None else exclude
+        wanted = k * self.overfetch
+
+        # probe the clusters by the score of their centroid until enough candidates survive the exclusions
+        order = np.argsort(-(self.centroids @ query))
+        excluded = self.clusters[exclude[exclude < self.clusters.shape[0]]]
+        excluded = np.bincount(excluded[excluded >= 0], minlength=self.centroids.shape[0])
+        eligible = np.cumsum((np.diff(self.offsets) - excluded)[order])
+        n_probe = min(max(self.n_probe, int(np.searchsorted(eligible, wanted)) + 1), order.shape[0])
+
+        probed = order[:n_probe]
+        sizes = self.offsets[probed + 1] - self.offsets[probed]
+        candidates = np.repeat(self.offsets[probed] - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+        scores = self.vectors[candidates] @ query
+        scores[np.isin(self.ids[candidates], exclude)] = -np.inf
+
+        top = np.full(k, -1, dtype=np.int32)
+        kk = min(k, candidates.shape[0])
+        if kk == 0:
+            return top
+        best = np.argpartition(-scores, kk - 1)[:kk]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        top[:kk] = np.where(scores[best] == -np.inf, -1, self.ids[candidates[best]])
+        return top
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+            The arrays of the index, to be saved
+            :return: a dictionary of arrays, with the search parameters as well
+        """
+        return {
+            "centroids": self.centroids,
+            "offsets": self.offsets,
+            "ids": self.ids,
+            "vectors": self.vectors,
+            "clusters": self.clusters,
+            "params": np.array([self.n_probe, self.overfetch], dtype=np.int64),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "IVFIndex":
+        """
+            Restore an index from its arrays, which can be memory-mapped
+            :param arrays: the arrays created with to_arrays
+            :return: the index
+        """
+        index = cls(n_lists=arrays["centroids"].shape[0], n_probe=int(arrays["params"][0]))
+        index.overfetch = int(arrays["params"][1])
+        index.centroids, index.offsets = arrays["centroids"], arrays["offsets"]
+        index.ids, index.vectors, index.clusters = arrays["ids"], arrays["vectors"], arrays["clusters"]
+        return index
@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from .brain import COLUMNS, DATASETS, DataBrain
+from .recommenders import LightFMBased
+from .synthetic import SEED, SCALES, sqlite_connector, write_sqlite
+from .utils import load_dataset
+
+# the latency percentiles of predict
+PERCENTILES = [50, 90, 99]
+
+
+@contextmanager
+def _workspace() -> Iterator[str]:
+    """ A temporary working directory, the data and the results directories relative to it are inside it too """
+    cwd = os.getcwd()
+    root = tempfile.mkdtemp(prefix="gadvi-benchmark-")
+    os.makedirs(f"{root}/scripts")
+    os.chdir(f"{root}/scripts")
+    try:
+        yield root
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def _result(name: str, seconds: float, count: int, unit: str, **extra) -> Dict:
+    """ A row of the results: the seconds of a benchmark and its throughput """
+    row = {"name": name, "seconds": round(seconds, 6), "count": int(count), "unit": unit}
+    row["per_second"] = round(count / seconds, 3) if seconds > 0 else None
+    row.update(extra)
+    logging.info(f"\t{row}")
+    return row
+
+
+def _commit() -> Optional[str]:
+    """ The git commit of the code, if it is in a repository """
+    try:
+        directory = os.path.dirname(os.path.abspath(__file__))
+        output = subprocess.run(["git", "rev-parse", "HEAD"], cwd=directory, capture_output=True, text=True)
+        return output.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmarks(
+    scale: str = "tiny",
+    seed: int = SEED,
+    dimensions: int = 32,
+    epochs: int = 5,
+    num_threads: int = 1,
+    players: int = 1000,
+    k: int = 3,
+    connections: int = 4,
+) -> Dict:
+    """
+        Benchmark the hot paths on synthetic data in a temporary directory: the extraction, loading, splitting and
+        statistics of DataBrain, the matrices, the fit and the evaluation of LightFMBased, and the latency of predict
+        :param scale: the size of the synthetic data, one of SCALES
+        :param seed: the seed of the synthetic data and of the sampled players
+        :param dimensions: the dimensions of the model
+        :param epochs: the epochs of the model
+        :param num_threads: the threads of the fit
+        :param players: the number of players whose predictions are timed
+        :param k: the number of recommendations
+        :param connections: the connections of the extraction
+        :return: the parameters, the environment and the results of the benchmarks
+    """
+    if scale not in SCALES:
+        raise ValueError(f"The scale should be one of {list(SCALES)}")
+
+    results: List[Dict] = []
+    with _workspace() as root:
+        # data
+        start = time.perf_counter()
+        rows = write_sqlite(f"{root}/synthetic.sqlite", scale, seed)
+        results.append(_result("generate", time.perf_counter() - start, rows, "rows"))
+
+        brain = DataBrain(
+            os.devnull,
+            True,
+            "full",
+            connector=sqlite_connector(f"{root}/synthetic.sqlite"),
+            connections=connections,
+            plots=False,
+        )
+        start = time.perf_counter()
+        brain.start_analysis()
+        results.append(_result("create_datasets", time.perf_counter() - start, rows, "rows"))
+
+        path = f"../data/{DATASETS['full']}"
+        start = time.perf_counter()
+        brain.analysis_report["data"]["full"] = load_dataset(path, columns=COLUMNS)
+        results.append(_result("load", time.perf_counter() - start, rows, "rows"))
+
+        start = time.perf_counter()
+        train, test = brain._train_test_split(path)
+        results.append(_result("split", time.perf_counter() - start, rows, "rows"))
+
+        start = time.perf_counter()
+        brain._get_statistics()
+        results.append(_result("statistics", time.perf_counter() - start, rows, "rows"))
+
+        # training
+        model = LightFMBased(
+            dataset="benchmark",
+            dimensions=dimensions,
+            epochs=epochs,
+            user_features=False,
+            item_featres=False,
+            num_threads=num_threads,
+        )
+        start = time.perf_counter()
+        matrices = model.build_matrices(train, cache=False)
+        results.append(_result("build_matrices", time.perf_counter() - start, train.shape[0], "rows"))
+
+        start = time.perf_counter()
+        model.fit(matrices)
+        interactions = matrices["interactions"].nnz * epochs
+        results.append(_result("fit", time.perf_counter() - start, interactions, "interactions"))
+        model.set_train_data(matrices, train)
+
+        start = time.perf_counter()
+        model.evaluate(test)
+        results.append(_result("evaluate", time.perf_counter() - start, test.shape[0], "rows"))
+
+        # serving
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(model.user_names, min(players, model.user_names.shape[0]), replace=False).tolist()
+        latencies = []
+        for player in sample:
+            start = time.perf_counter()
+            model.predict(player, k=k)
+            latencies.append(time.perf_counter() - start)
+        milliseconds = {f"p{p}_ms": round(float(np.percentile(latencies, p)) * 1000, 4) for p in PERCENTILES}
+        results.append(_result("predict", sum(latencies), len(sample), "players", **milliseconds))
+
+        start = time.perf_counter()
+        model.predict_batch(sample, k=k)
+        results.append(_result("predict_batch", time.perf_counter() - start, len(sample), "players"))
+
+    return {
+        "parameters": {
+            "scale": scale,
+            "seed": seed,
+            "dimensions": dimensions,
+            "epochs": epochs,
+            "num_threads": num_threads,
+            "players": players,
+            "k": k,
+            "connections": connections,
+        },
+        "environment": {
+            "commit": _commit(),
+            "created_at": datetime.now().strftime("%Y%m%d%H%M%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def save_results(report: Dict, path: str) -> None:
+    """
+        Save the report of the benchmarks as json
+        :param report: the report of run_benchmarks
+        :param path: the path of the json file
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=4)
+
+
+def compare_results(report: Dict, baseline: Dict) -> pd.DataFrame:
+    """
+        Compare the seconds of the benchmarks with the ones of a baseline, e.g. of an older commit
+        :param report: the report of run_benchmarks
+        :param baseline: the report of the baseline
+        :return: the seconds of every benchmark and their ratio to the baseline, above 1 when slower
+    """
+    current = pd.DataFrame(report["results"]).set_index("name")["seconds"]
+    previous = pd.DataFrame(baseline["results"]).set_index("name")["seconds"]
+    comparison = pd.DataFrame({"seconds": current, "baseline": previous}).dropna()
+    comparison["ratio"] = (comparison["seconds"] / comparison["baseline"]).round(3)
+    return comparison
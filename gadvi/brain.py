@@ -1,34 +1,126 @@
 import os
+import json
+import time
 import logging
 import pyodbc
-import random
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-import seaborn as sns
-from typing import Dict, List, Tuple
-from datetime import datetime
-
-from . import DATA_DIR, PLOTS_DIR
-from .utils import DBConnector, Timer
-
-random.seed(10)
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from . import DATA_DIR
+from .plots import TOP, render_plots, save_statistics
+from .utils import (
+    ConnectionPool,
+    DBConnector,
+    DatasetWriter,
+    GroupAggregator,
+    IdDictionary,
+    StageTimer,
+    dataset_exists,
+    is_first_party,
+    iter_dataset,
+    load_dataset,
+    partition_path,
+    remove_dataset,
+    save_dataset,
+    to_dates,
+)
+
+# the stored dataset of each dataset type
+DATASETS = {
+    "full": "full_simplified",
+    "sample_big": "subset_500000users",
+    "sample_small": "subset_100000users",
+    "sample_tiny": "subset_5000users",
+}
+
+# the number of players of each sample dataset
+SUBSETS = {
+    "sample_big": 500000,
+    "sample_small": 100000,
+    "sample_tiny": 5000,
+}
+
+# the latest BeginDate_DWID of every stored dataset
+WATERMARKS = "watermarks.json"
+
+# the smallest subset of every player, the subsets are nested (tiny in small in big)
+BUCKETS = "player_buckets"
+
+# the dictionary of the int32 codes of the id columns, shared by the datasets and the models
+DICTIONARY = "ids"
+
+# the seed of the order in which the players enter the subsets
+SEED = 10
+
+# the columns of the join that are not needed
+REDUNDANT_COLUMNS = [
+    "Currency",
+    "TurnoverLocalCurr",
+    "GGRLocalCurr",
+    "Game_DWID.1",
+    "Player_DWID.1",
+    "Operator_DWID.1",
+    "Operator_DWID",
+    "Game_DWID",
+    "Player_DWID",
+    "GameProvider_DWID",
+    "GameProviderId",
+    "GameID",
+]
+
+# the columns used by the analysis and the models
+COLUMNS = [
+    "playerid",
+    "GameName",
+    "IsSGDContent",
+    "CountryPlayer",
+    "BeginDate_DWID",
+    "RoundCount",
+    "Turnover",
+    "GGR",
+    "GameProviderName",
+    "OperatorName",
+]
 
 
 class DataBrain:
     """ Class responsible for the data analysis."""
 
-    def __init__(self, credentials: str, online: bool, dataset: str):
+    def __init__(
+        self,
+        credentials: str,
+        online: bool,
+        dataset: str,
+        export_tsv: bool = False,
+        chunksize: int = 100000,
+        connector: Optional[Callable[[], Any]] = None,
+        connections: int = 4,
+        partitions: Optional[int] = None,
+        incremental: bool = False,
+        precision: Optional[int] = None,
+        plots: bool = True,
+    ):
         self.credentials: str = credentials
         self.online: bool = online
         self.dataset: str = dataset
+        self.export_tsv: bool = export_tsv
+        self.chunksize: int = chunksize
+        self.connector = connector
+        self.connections: int = connections
+        self.partitions: int = partitions if partitions is not None else connections * 4
+        self.incremental: bool = incremental
+        self.precision: Optional[int] = precision
+        self.plots: bool = plots
 
         self.analysis_report: Dict = dict()
-        self.tables: List = ["dimGameProvider", "dimPlayer", "dimGame", "dimOperator", "FactTablePlayer"]
+        # the fact table is not fetched on its own, its columns are streamed to disk with the join
+        self.tables: List = ["dimGameProvider", "dimPlayer", "dimGame", "dimOperator"]
 
         if not os.path.exists(DATA_DIR):
             os.makedirs(DATA_DIR)
-        if not os.path.exists(f"{PLOTS_DIR}/{self.dataset}"):
-            os.makedirs(f"{PLOTS_DIR}/{self.dataset}")
 
     def start_analysis(self) -> Dict:
         """
@@ -40,119 +132,349 @@ class DataBrain:
             Since the data size is big, we remove from the resulting dataframe any redundant column.
             More over random subsets of the dataset are being created keeping all (full), 500K (sample_big),
             100K (sample_small) and 5K (sample_tiny) players. (Small subsets of the dataset facilitate the development
-            process.)
+            process.) The subsets are nested and drawn from one seeded permutation of the players, and only the
+            requested one is materialized, the others are materialized when they are requested.
+            The datasets are stored as parquet files, with the string columns as categoricals, and optionally
+            exported as tsv files as well.
+            The extraction runs over a pool of connections: the dimension tables are fetched concurrently, while the
+            join is split in BeginDate_DWID ranges that are pulled by parallel workers. The fact table is never held
+            in memory, its rows are only streamed to disk as part of the join.
+            In INCREMENTAL MODE only the facts past the latest BeginDate_DWID of the stored full dataset are fetched.
+            They are appended as a new partition of the full dataset and of the subsets that have some of their
+            players, and the train/test split is regenerated only if the requested dataset has changed.
+            The ids of the players, games, countries, operators and providers are encoded as int32 codes in a
+            persistent, versioned dictionary, which is extended with the new ids of every extraction.
         """
 
         self.analysis_report["data"] = dict()
+        if self.dataset not in DATASETS:
+            raise ValueError("Dataset type is not supported.")
+        path = DATASETS[self.dataset]
+
+        changed: Set[str] = self._extract() if self.online else set()
+
+        # the requested subset is materialized from the stored dataset, if it does not exist
+        if self.dataset in SUBSETS and not dataset_exists(f"{DATA_DIR}/{path}"):
+            logging.info(f"\tMaterializing {path}")
+            with StageTimer("data.materialize") as t:
+                full_data = load_dataset(f"{DATA_DIR}/full_simplified", columns=COLUMNS)
+                self.analysis_report["data"][self.dataset] = self._create_subset(self.dataset, full_data)
+            logging.info(f"{path} materialized in {t.elapsed}s.")
+
+            watermarks = self._load_watermarks()
+            if DATASETS["full"] in watermarks:
+                watermarks[path] = watermarks[DATASETS["full"]]
+                self._save_watermarks(watermarks)
+            changed.add(self.dataset)
+        else:
+            # Load the data from the Data directory, only the columns that are used
+            logging.info("\tLoading the data")
+            with StageTimer("data.load") as t:
+                self.analysis_report["data"][self.dataset] = load_dataset(f"{DATA_DIR}/{path}", columns=COLUMNS)
+            logging.info(f"Data loaded in {t.elapsed}s.")
 
-        if self.online:
-
-            # connect to the database, only if you are in online mode
-            dbc, connection = self._connect_to_db()
+        # in offline mode the dictionary is created once from the stored data
+        if not IdDictionary.exists(f"{DATA_DIR}/{DICTIONARY}"):
+            source = "full_simplified" if dataset_exists(f"{DATA_DIR}/full_simplified") else path
+            self._update_dictionary(f"{DATA_DIR}/{source}")
 
-            # connect to the database and fetch all the data after join
-            full_data = pd.read_sql_query(dbc.query_templates["join_and_get"], connection)
+        # in online mode the train/test split is regenerated only if the dataset has changed
+        if not self.online or self.dataset in changed or not dataset_exists(f"{DATA_DIR}/{path}_train"):
+            _, _ = self._train_test_split(f"{DATA_DIR}/{path}")
+        self._get_statistics()
 
-            # save the joined tables as a singe dataset
-            full_data.to_csv(f"{DATA_DIR}/full.tsv", sep="\t", index=False)
+        return self.analysis_report
 
-            # optionally you can download and the single tables with the following queries
-            for idx, table in enumerate(self.tables):
+    def _extract(self) -> Set[str]:
+        """
+            Extracts the data from the database: the whole join, or in incremental mode only the facts after the
+            watermark of the full dataset, as a new partition. The stored datasets are never rewritten by an
+            incremental extraction, and one that finds no new facts leaves them, and the watermarks, as they are.
+            :return: the datasets that have changed
+        """
+        # connect to the database, only if you are in online mode
+        dbc, pool = self._connect_to_db()
+
+        # in incremental mode, only the facts after the high-water mark of the full dataset
+        watermarks = self._load_watermarks()
+        after = watermarks.get(DATASETS["full"]) if self.incremental else None
+        ranges = self._date_ranges(dbc, pool, self.partitions, after)
+        if after is not None and not ranges:
+            pool.close()
+            logging.info(f"\tNo facts after {after}, the datasets are up to date")
+            return set()
+        partition = f"part-{ranges[0][0]}-{ranges[-1][1]}" if after is not None else None
+
+        with ThreadPoolExecutor(max_workers=self.connections) as executor:
+            # the dimension tables are small, they are fetched concurrently
+            tables: Dict[str, Future] = dict()
+            for table in self.tables:
                 logging.info(f"\tFetching {table}")
-                t_query, params = ("get_all", [table])
-                self.analysis_report["data"][table] = self._get_table(dbc, connection, t_query, params)
-
-            # close the connection
-            cursor = connection.cursor()
-            cursor.close()
-            connection.close()
-
-            # Remove redundant columns and save
-            full_data.drop(
-                [
-                    "Currency",
-                    "TurnoverLocalCurr",
-                    "GGRLocalCurr",
-                    "Game_DWID.1",
-                    "Player_DWID.1",
-                    "Operator_DWID.1",
-                    "Operator_DWID",
-                    "Game_DWID",
-                    "Player_DWID",
-                    "GameProvider_DWID",
-                    "GameProviderId",
-                    "GameID",
-                ],
-                axis=1,
-                inplace=True,
-            )
-
-            full_data.to_csv(f"{DATA_DIR}/full_simplified.tsv", sep="\t", index=False)
-
-            # Create the sample datasets
-            unique_players = full_data["playerid"].unique()
-            subset_big = self._create_subset(unique_players.tolist(), 500000, full_data)
-            subset_small = self._create_subset(unique_players.tolist(), 100000, full_data)
-            subset_tiny = self._create_subset(unique_players.tolist(), 5000, full_data)
-
-            if self.dataset == "full":
-                self.analysis_report["data"][self.dataset] = full_data
-            elif self.dataset == "sample_big":
-                self.analysis_report["data"][self.dataset] = subset_big
-            elif self.dataset == "sample_small":
-                self.analysis_report["data"][self.dataset] = subset_small
-            elif self.dataset == "sample_tiny":
-                self.analysis_report["data"][self.dataset] = subset_tiny
-            else:
-                raise ValueError("Dataset type is not supported.")
+                tables[table] = executor.submit(self._fetch_table, dbc, pool, "get_all", [table])
+
+            # fetch all the data after join, streaming it to disk, and save it as a single dataset
+            with StageTimer("data.extract") as t:
+                rows, latest = self._extract_full_data(dbc, pool, executor, ranges, partition)
+            logging.info(f"Data extracted in {t.elapsed}s.")
+
+            for table, future in tables.items():
+                self.analysis_report["data"][table] = future.result()
+
+        # close the connections
+        pool.close()
+
+        if rows:
+            self._update_dictionary(f"{DATA_DIR}/full_simplified" + (f".parts/{partition}" if partition else ""))
+
+        if after is None and not rows:
+            # the writer has removed the previous full dataset, the subsets would be drawn from nothing
+            raise ValueError("The database returned no facts.")
+
+        if after is None:
+            # the subsets are drawn again from the players of the stored dataset
+            self._assign_buckets(load_dataset(f"{DATA_DIR}/full_simplified", columns=["playerid"])["playerid"])
+            for name in SUBSETS:
+                remove_dataset(f"{DATA_DIR}/{DATASETS[name]}")
+            watermarks = dict()
+            changed = {"full"}
         else:
-            # Load the data from the Data directory
-            if self.dataset == "full":
-                path = "full_simplified"
-            elif self.dataset == "sample_big":
-                path = "subset_500000users"
-            elif self.dataset == "sample_small":
-                path = "subset_100000users"
-            elif self.dataset == "sample_tiny":
-                path = "subset_5000users"
-            else:
-                raise ValueError("Dataset type is not supported.")
+            logging.info(f"\tFetched {rows} rows after {after}")
+            changed = self._append_to_subsets(partition) if rows else set()
+
+        if latest is not None:
+            watermarks.update({DATASETS[name]: latest for name in changed})
+            self._save_watermarks(watermarks)
+        return changed
+
+    def _extract_full_data(
+        self,
+        dbc: DBConnector,
+        pool: ConnectionPool,
+        executor: ThreadPoolExecutor,
+        ranges: List[Tuple[int, int]],
+        partition: Optional[str] = None,
+    ) -> Tuple[int, Optional[int]]:
+        """
+            Pulls the join of the tables in date ranges, one worker per range, and appends every page to the full
+            dataset and, without the redundant columns, to the simplified one, so that memory stays bounded whatever
+            the size of the tables
+            :param dbc: the connector object
+            :param pool: the pool of connections
+            :param executor: the workers that pull the ranges
+            :param ranges: the [start, end) BeginDate_DWID ranges
+            :param partition: write a new partition of the datasets with this name, instead of the datasets
+            :return: the number of rows fetched and their latest BeginDate_DWID
+        """
+        start = time.time()
+        lock = threading.Lock()
+        latest: Optional[int] = None
+        paths = [f"{DATA_DIR}/full", f"{DATA_DIR}/full_simplified"]
+        if partition is not None:
+            paths = [partition_path(p, partition) for p in paths]
+
+        with DatasetWriter(paths[0], tsv=self.export_tsv) as full, DatasetWriter(
+            paths[1], tsv=self.export_tsv
+        ) as simplified:
+
+            def extract(lo: int, hi: int) -> None:
+                nonlocal latest
+                query = dbc.construct_query(dbc.query_templates["join_and_get_range"], [lo, hi])
+                with pool.connection() as connection:
+                    for chunk in dbc.iter_query(query, connection, self.chunksize):
+                        chunk.columns = self._deduplicate_columns(chunk.columns.tolist())
+                        simple = chunk.drop(REDUNDANT_COLUMNS, axis=1)
+                        with lock:
+                            full.write(chunk)
+                            simplified.write(simple)
+                            latest = max(latest or 0, int(chunk["BeginDate_DWID"].max()))
+
+                            elapsed = time.time() - start
+                            logging.info(f"\tFetched {full.rows} rows, {full.rows / max(elapsed, 1e-9):.0f} rows/s")
+
+            for future in [executor.submit(extract, lo, hi) for lo, hi in ranges]:
+                future.result()
+
+        return full.rows, latest
 
-            logging.info("\tLoading the data")
-            with Timer() as t:
-                self.analysis_report["data"][self.dataset] = pd.read_csv(f"{DATA_DIR}/{path}.tsv", sep="\t")
-            logging.info(f"Data loaded in {t.elapsed}s.")
+    @staticmethod
+    def _date_ranges(
+        dbc: DBConnector, pool: ConnectionPool, partitions: int, after: Optional[int] = None
+    ) -> List[Tuple[int, int]]:
+        """
+            Splits the dates of the fact table in ranges of about the same number of days
+            :param dbc: the connector object
+            :param pool: the pool of connections
+            :param partitions: the number of ranges
+            :param after: only the dates after this BeginDate_DWID
+            :return: the [start, end) BeginDate_DWID ranges
+        """
+        if after is None:
+            params = ["BeginDate_DWID", "BeginDate_DWID", "FactTablePlayer"]
+            query = dbc.construct_query(dbc.query_templates["get_min_max"], params)
+        else:
+            params = ["BeginDate_DWID", "BeginDate_DWID", "FactTablePlayer", "BeginDate_DWID", after]
+            query = dbc.construct_query(dbc.query_templates["get_min_max_after"], params)
+        with pool.connection() as connection:
+            first, last = pd.read_sql_query(query, connection).iloc[0]
+        if pd.isnull(first):
+            return []
+
+        # BeginDate_DWID is a YYYYMMDD integer, the end of the last range is the day after the last date
+        days = pd.date_range(pd.to_datetime(str(int(first))), pd.to_datetime(str(int(last))) + pd.Timedelta(days=1))
+        edges = np.unique(np.linspace(0, len(days) - 1, partitions + 1).astype(int))
+        dwids = days[edges].strftime("%Y%m%d").astype(int).tolist()
+        return list(zip(dwids[:-1], dwids[1:]))
+
+    def _append_to_subsets(self, partition: str) -> Set[str]:
+        """
+            Appends the rows of a new partition of the full dataset to the stored subsets, as a partition of each
+            subset that has some of their players. The new players are not in any subset.
+            :param partition: the name of the new partition
+            :return: the datasets that have changed
+        """
+        delta = load_dataset(f"{DATA_DIR}/full_simplified.parts/{partition}", columns=COLUMNS)
+        buckets = self._row_buckets(delta)
+        changed = {"full"}
+        for name in SUBSETS:
+            path = f"{DATA_DIR}/{DATASETS[name]}"
+            if not dataset_exists(path):
+                continue
+
+            rows = delta[buckets <= self._level(name)]
+            if rows.shape[0] > 0:
+                save_dataset(rows, partition_path(path, partition), tsv=self.export_tsv)
+                changed.add(name)
+            logging.info(f"\tAppended {rows.shape[0]} rows to {DATASETS[name]}")
+        return changed
+
+    def _update_dictionary(self, path: str) -> None:
+        """
+            Adds the new values of the id columns of a dataset to the id dictionary, as a new version, streaming the
+            dataset in chunks
+            :param path: the path to the dataset, or a partition of it
+        """
+        location = f"{DATA_DIR}/{DICTIONARY}"
+        dictionary = IdDictionary.load(location) if IdDictionary.exists(location) else IdDictionary()
+        columns = [c for c in COLUMNS if c in dictionary.columns]
+        with StageTimer("data.dictionary"):
+            chunks = iter_dataset(path, columns=columns, chunksize=self.chunksize)
+            added = sum(dictionary.update(chunk) for chunk in chunks)
+            dictionary.save(location)
+        logging.info(f"\tAdded {added} ids to the dictionary, version {dictionary.version}")
 
-        # call the function that is responsible for the statistics
-        _, _ = self._train_test_split(f"{DATA_DIR}/{path}")
-        self._get_statistics()
+    @staticmethod
+    def _load_watermarks() -> Dict[str, int]:
+        """
+            Loads the latest BeginDate_DWID of every stored dataset
+            :return: the watermarks
+        """
+        if not os.path.exists(f"{DATA_DIR}/{WATERMARKS}"):
+            return dict()
+        with open(f"{DATA_DIR}/{WATERMARKS}") as f:
+            return json.load(f)
 
-        return self.analysis_report
+    @staticmethod
+    def _save_watermarks(watermarks: Dict[str, int]) -> None:
+        """
+            Saves the latest BeginDate_DWID of every stored dataset
+            :param watermarks: the watermarks
+        """
+        with open(f"{DATA_DIR}/{WATERMARKS}", "w") as f:
+            json.dump(watermarks, f, indent=4)
+
+    @staticmethod
+    def _assign_buckets(players: pd.Series) -> pd.DataFrame:
+        """
+            Draws the nested subsets from one seeded permutation of the players, the order of a seeded hash of their
+            ids, and stores the bucket of every player: the index of the smallest subset that contains it, or the
+            number of subsets if none does
+            :param players: the players of the dataset
+            :return: the bucket of every player
+        """
+        unique = pd.Series(players.unique()).astype(str)
+        hashes = pd.util.hash_array(unique.to_numpy(dtype=object), hash_key=f"{SEED:016d}")
+        rank = np.empty(len(unique), dtype=np.int64)
+        rank[np.argsort(hashes, kind="stable")] = np.arange(len(unique))
+
+        sizes = sorted(SUBSETS.values())
+        buckets = pd.DataFrame({"playerid": unique, "bucket": np.searchsorted(sizes, rank, side="right")})
+        buckets["bucket"] = buckets["bucket"].astype(np.int8)
+        save_dataset(buckets, f"{DATA_DIR}/{BUCKETS}")
+        return buckets
+
+    def _row_buckets(self, data: pd.DataFrame) -> np.ndarray:
+        """
+            Looks up the bucket of the player of every row, in a single pass over the categorical codes
+            :param data: the dataframe
+            :return: the bucket of every row
+        """
+        if not dataset_exists(f"{DATA_DIR}/{BUCKETS}"):
+            self._assign_buckets(load_dataset(f"{DATA_DIR}/full_simplified", columns=["playerid"])["playerid"])
+        buckets = load_dataset(f"{DATA_DIR}/{BUCKETS}")
+
+        players = data["playerid"].astype("category").cat
+        by_player = pd.Series(buckets["bucket"].to_numpy(), index=buckets["playerid"].astype(str))
+        by_category = by_player.reindex(players.categories.astype(str)).fillna(len(SUBSETS)).to_numpy(np.int8)
+        return by_category[players.codes.to_numpy()]
 
     @staticmethod
-    def _create_subset(unique_players: List, size: int, data: pd.DataFrame) -> pd.DataFrame:
+    def _level(name: str) -> int:
+        """
+            The bucket of a subset, its rows are the rows of the players with a bucket up to it
+            :param name: the dataset type of the subset
+            :return: the bucket
+        """
+        return sorted(SUBSETS.values()).index(SUBSETS[name])
+
+    def _create_subset(self, name: str, data: pd.DataFrame) -> pd.DataFrame:
         """
             Creates a subset from the initial dataframe
-            :param unique_players: the list with the unique players that should appear in the dataset
-            :param size: the number of unique players to keep
+            :param name: the dataset type of the subset
             :param data: the dataframe to extract subset from
             :return subset: the subset dataset
         """
-        sub_players = random.sample(unique_players, size)
-        subset = data[data["playerid"].isin(sub_players)]
-        subset.to_csv(f"{DATA_DIR}/subset_{str(size)}users.tsv", sep="\t", index=False)
+        subset = data[self._row_buckets(data) <= self._level(name)]
+        save_dataset(subset, f"{DATA_DIR}/{DATASETS[name]}", tsv=self.export_tsv)
         return subset
 
+    @staticmethod
+    def _deduplicate_columns(columns: List[str]) -> List[str]:
+        """
+            Renames the repeated columns of a join, the way read_csv does (X, X.1, X.2, ...), since the columnar
+            format needs unique column names
+            :param columns: the column names
+            :return: the unique column names
+        """
+        seen: Dict[str, int] = dict()
+        unique = []
+        for column in columns:
+            unique.append(f"{column}.{seen[column]}" if column in seen else column)
+            seen[column] = seen.get(column, 0) + 1
+        return unique
+
     def _connect_to_db(self):
         """
-            Establish the connection with the database
+            Establish the pool of connections with the database
             :return dbc: the connector object
-            :return connection: the connection object
+            :return pool: the pool of connections
         """
-        dbc = DBConnector(self.credentials)
-        connection = dbc.connect()
+        dbc = DBConnector(self.credentials, connector=self.connector)
+        pool = dbc.create_pool(self.connections)
 
-        return dbc, connection
+        return dbc, pool
+
+    @classmethod
+    def _fetch_table(cls, dbc: DBConnector, pool: ConnectionPool, t_query: str, params: List) -> pd.DataFrame:
+        """
+            Fetches a table over a connection of the pool
+            :param dbc: the connector object
+            :param pool: the pool of connections
+            :param t_query: the string that is the key to the template query
+            :param params: the list with the parameters required for the query
+            :return data: the results of the query saved in a dataframe
+        """
+        with pool.connection() as connection:
+            return cls._get_table(dbc, connection, t_query, params)
 
     @staticmethod
     def _get_table(dbc: DBConnector, connection: pyodbc.Connection, t_query: str, params: List) -> pd.DataFrame:
@@ -175,29 +497,23 @@ class DataBrain:
             :return:
         """
         data = self.analysis_report["data"][self.dataset]
-        data = data[
-            [
-                "playerid",
-                "GameName",
-                "IsSGDContent",
-                "CountryPlayer",
-                "BeginDate_DWID",
-                "RoundCount",
-                "Turnover",
-                "GGR",
-                "GameProviderName",
-                "OperatorName",
-            ]
-        ]
-        data["BeginDate_DWID"] = data["BeginDate_DWID"].apply(lambda d: datetime.strptime(str(d), "%Y%m%d"))
+        data = data[COLUMNS]
+
+        # BeginDate_DWID is a YYYYMMDD integer
+        with StageTimer("data.dates") as t:
+            data["BeginDate_DWID"] = to_dates(data["BeginDate_DWID"])
+        logging.info(f"Dates parsed in {t.elapsed}s.")
         data.info()
 
         # split - data into train and test
         data = data.sample(frac=1).reset_index(drop=True)
-        data["year"] = data["BeginDate_DWID"].apply(lambda d: d.year)
-        data["month"] = data["BeginDate_DWID"].apply(lambda d: d.month)
-        data["day"] = data["BeginDate_DWID"].apply(lambda d: d.day)
-        data["weekday"] = data["BeginDate_DWID"].apply(lambda d: d.weekday())
+        with StageTimer("data.date_features") as t:
+            dates = data["BeginDate_DWID"].dt
+            data["year"] = dates.year
+            data["month"] = dates.month
+            data["day"] = dates.day
+            data["weekday"] = dates.weekday
+        logging.info(f"Date features extracted in {t.elapsed}s.")
 
         test = data[data["month"] == 12]
         train = data[data["month"] < 12]
@@ -207,61 +523,23 @@ class DataBrain:
         test = test[(test["playerid"].isin(train["playerid"])) & (test["GameName"].isin(train["GameName"]))]
 
         # save train and test
-        train.to_csv(f"{DATA_DIR}/{path}_train.tsv", sep="\t", index=False)
-        test.to_csv(f"{DATA_DIR}/{path}_test.tsv", sep="\t", index=False)
+        with StageTimer("data.save_split"):
+            save_dataset(train, f"{path}_train", tsv=self.export_tsv)
+            save_dataset(test, f"{path}_test", tsv=self.export_tsv)
 
         return train, test
 
     def _get_statistics(self) -> None:
         """
-            Generate and save various plots on the whole dataset.
+            Generate and save the statistics of the games and the players on the whole dataset, and render the plots
+            from them unless they are skipped.
             It is not finalized, since it still under investigation
             :return: Νone
         """
-        data = self.analysis_report["data"][self.dataset]
-        data["IsSGDContent"] = data["IsSGDContent"].apply(lambda x: 1 if x.lower().strip() == "1st party" else 0)
-
-        sam = data[["playerid", "GameName", "RoundCount"]]
-        samg = sam.groupby("GameName").agg({"playerid": ["nunique", "count"], "RoundCount": "sum"})
-
-        plt.figure()
-        samg["RoundCount"]["sum"].hist()
-
-        f, axes = plt.subplots(1, 2, sharey=False, tight_layout=True)
-        f.set_figheight(10)
-        f.set_figwidth(20)
-        axes2 = f.add_axes([0.1, 0.5, 0.4, 0.3])  # inset axes
-        axes2.hist(samg["RoundCount"]["sum"], bins=50, color="pink")
-        plt.ylim(0, 50)
-        axes3 = f.add_axes([0.6, 0.5, 0.4, 0.3])  # inset axes
-        axes3.hist(samg["playerid"]["nunique"], bins=50, color="pink")
-        plt.ylim(0, 50)
-
-        axes[0].hist(samg["RoundCount"]["sum"], bins=50)
-        axes[1].hist(samg["playerid"]["nunique"], bins=50)
-        axes[0].set(xlabel="Total plays (RoundCounts)", ylabel="Games", title="Hist of total plays per Game")
-        axes[1].set(xlabel="Total plays (Unique Users)", ylabel="Games", title="Hist of unique users per Game")
-        axes2.set(title="Zoom")
-        axes3.set(title="Zoom")
-        f.savefig(f"{PLOTS_DIR}/{self.dataset}/game_hist_all.png", bbox_inches="tight")
-
-        f = sns.jointplot(data=samg, x=("RoundCount", "sum"), y=("playerid", "nunique"))
-        f.savefig(f"{PLOTS_DIR}/{self.dataset}/round-players-joint.png", bbox_inches="tight")
-
-        games = (
-            data.groupby("GameName")
-            .agg(
-                {
-                    "playerid": ["nunique", "count"],
-                    "RoundCount": "sum",
-                    "CountryPlayer": "nunique",
-                    "Turnover": "sum",
-                    "GGR": "sum",
-                    "IsSGDContent": ["sum", lambda x: x.count() - x.sum()],
-                }
-            )
-            .sort_values(("RoundCount", "sum"), ascending=False)
-        )
+        with StageTimer("data.statistics") as t:
+            games, players = self._aggregate(f"{DATA_DIR}/{DATASETS[self.dataset]}")
+        logging.info(f"Statistics aggregated in {t.elapsed}s.")
+        save_statistics(self.dataset, games, players)
 
         # Game graphs - 1st Party - 3rd party
         gamesfirst = games[games["IsSGDContent"]["sum"] > 0]
@@ -272,78 +550,49 @@ class DataBrain:
             f"1st Party games: {gamesfirst.shape[0]}\n"
             f"3rd Party games: {gamesthrird.shape[0]}"
         )
-        # Game graphs - all
-        self._games_plot(games.head(20), "all")
-        self._games_plot(gamesfirst.head(20), "1st")
-        self._games_plot(gamesthrird.head(20), "3rd")
-
-        # players
-        players = (
-            data.groupby("playerid")
-            .agg(
-                {
-                    "GameName": ["nunique", "count"],
-                    "RoundCount": "sum",
-                    "Turnover": "sum",
-                    "GGR": "sum",
-                    "IsSGDContent": ["sum", lambda x: x.count() - x.sum()],
-                }
-            )
-            .sort_values(("RoundCount", "sum"), ascending=False)
-        )
-        data = players.head(20)
-        sns.set_theme()
-        f, axes = plt.subplots(2, 2)
-        f.set_figheight(10)
-        f.set_figwidth(20)
-        axes = axes.flatten()
-        sns.barplot(x=("RoundCount", "sum"), y="playerid", data=data.reset_index(), palette="coolwarm", ax=axes[0])
-        sns.barplot(x=("GameName", "nunique"), y="playerid", data=data.reset_index(), palette="coolwarm", ax=axes[1])
-        sns.barplot(x=("Turnover", "sum"), y="playerid", data=data.reset_index(), palette="coolwarm", ax=axes[2])
-        sns.barplot(x=("GGR", "sum"), y="playerid", data=data.reset_index(), palette="coolwarm", ax=axes[3])
-        axes[0].set(
-            xlabel="Total plays (RoundCounts)",
-            ylabel="Player",
-            title="# of RoundCounts of the top 20 players with the most plays",
-        )
-        axes[1].set(
-            xlabel="Unique Games", ylabel="Player", title="# of unique games for the top 20 players with the most plays"
-        )
-        axes[2].set(
-            xlabel="Total Turnover", ylabel="Player", title="Total Turnover for the top 20 players with the most plays"
-        )
-        axes[3].set(xlabel="Total GGR", ylabel="Player", title="Total GGR for the top 20 players with the most plays")
-        f.savefig(f"{PLOTS_DIR}/{self.dataset}/players_all.png", bbox_inches="tight")
+        print(players.head(TOP).describe())
 
-        print(data.describe())
+        if self.plots:
+            with StageTimer("data.plots") as t:
+                render_plots(self.dataset)
+            logging.info(f"Plots rendered in {t.elapsed}s.")
 
-    def _games_plot(self, data: pd.DataFrame, party: str) -> None:
+    def _aggregate(self, path: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
         """
-            Generate a plot for games.
-            :param data: the input data
-            :param party: a string indicator for the party ('all-1st-3rd)
+            Aggregates the metrics of every game and every player over the chunks of a stored dataset, so that the
+            statistics of the full dataset are computed in bounded memory
+            :param path: the path to the dataset
+            :return: the statistics of the games and of the players, sorted by the total plays
         """
-
-        sns.set_theme()
-        f, axes = plt.subplots(2, 2)
-        f.set_figheight(10)
-        f.set_figwidth(20)
-        axes = axes.flatten()
-
-        sns.barplot(x=("RoundCount", "sum"), y="GameName", data=data.reset_index(), palette="coolwarm", ax=axes[0])
-        sns.barplot(x=("playerid", "nunique"), y="GameName", data=data.reset_index(), palette="coolwarm", ax=axes[1])
-        sns.barplot(x=("Turnover", "sum"), y="GameName", data=data.reset_index(), palette="coolwarm", ax=axes[2])
-        sns.barplot(x=("GGR", "sum"), y="GameName", data=data.reset_index(), palette="coolwarm", ax=axes[3])
-        axes[0].set(
-            xlabel="Total plays (RoundCounts)",
-            ylabel="Game",
-            title="# of RoundCounts for the top 20 games with the most plays",
+        parties = {"IsSGDContent": ["sum", "count"]}
+        games = GroupAggregator(
+            "GameName",
+            {
+                "playerid": ["nunique", "count"],
+                "RoundCount": ["sum"],
+                "CountryPlayer": ["nunique"],
+                "Turnover": ["sum"],
+                "GGR": ["sum"],
+                **parties,
+            },
+            precision=self.precision,
         )
-        axes[1].set(
-            xlabel="Unique Players", ylabel="Game", title="# of unique Players for the top 20 games with the most plays"
+        players = GroupAggregator(
+            "playerid",
+            {"GameName": ["nunique", "count"], "RoundCount": ["sum"], "Turnover": ["sum"], "GGR": ["sum"], **parties},
+            precision=self.precision,
         )
-        axes[2].set(
-            xlabel="Total Turnover", ylabel="Game", title="Total Turnover for the top 20 games with the most plays"
-        )
-        axes[3].set(xlabel="Total GGR", ylabel="Game", title="Total GGR for the top 20 games with the most plays")
-        f.savefig(f"{PLOTS_DIR}/{self.dataset}/game_totalplays_{party}.png", bbox_inches="tight")
+
+        for chunk in iter_dataset(path, columns=COLUMNS, chunksize=self.chunksize):
+            chunk["IsSGDContent"] = is_first_party(chunk["IsSGDContent"])
+            games.update(chunk)
+            players.update(chunk)
+
+        stats = []
+        for aggregator in [games, players]:
+            result = aggregator.result()
+            # the 3rd party rows are the rest of the rows
+            result[("IsSGDContent", "3rd")] = result[("IsSGDContent", "count")] - result[("IsSGDContent", "sum")]
+            result = result.drop(columns=[("IsSGDContent", "count")])
+            stats.append(result.sort_values(("RoundCount", "sum"), ascending=False))
+        return stats[0], stats[1]
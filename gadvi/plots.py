@@ -0,0 +1,172 @@
+import os
+import logging
+import matplotlib.pyplot as plt
+import pandas as pd
+import seaborn as sns
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . import PLOTS_DIR, STATISTICS_DIR
+
+# the number of the top games and players that are plotted
+TOP = 20
+
+
+def save_statistics(dataset: str, games: pd.DataFrame, players: pd.DataFrame) -> None:
+    """
+        Saves the statistics of a dataset, the plots are rendered from them: all the games and the top players
+        :param dataset: the dataset type
+        :param games: the statistics of the games, sorted by the total plays
+        :param players: the statistics of the players, sorted by the total plays
+    """
+    os.makedirs(f"{STATISTICS_DIR}/{dataset}", exist_ok=True)
+    for name, table in [("games", games), ("players", players.head(TOP))]:
+        table = table.copy()
+        # parquet needs flat column names
+        table.columns = ["|".join(column) for column in table.columns]
+        table.to_parquet(f"{STATISTICS_DIR}/{dataset}/{name}.parquet")
+
+
+def load_statistics(dataset: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+        Loads the statistics of a dataset
+        :param dataset: the dataset type
+        :return: the statistics of the games and of the top players
+    """
+    tables = []
+    for name in ["games", "players"]:
+        table = pd.read_parquet(f"{STATISTICS_DIR}/{dataset}/{name}.parquet")
+        table.columns = pd.MultiIndex.from_tuples([tuple(column.split("|")) for column in table.columns])
+        tables.append(table)
+    return tables[0], tables[1]
+
+
+def render_plots(dataset: str, workers: Optional[int] = None) -> List[str]:
+    """
+        Renders the plots of a dataset from its saved statistics, one figure per task of a process pool with a
+        non-interactive backend
+        :param dataset: the dataset type
+        :param workers: the number of processes, one per figure by default
+        :return: the paths of the plots
+    """
+    os.makedirs(f"{PLOTS_DIR}/{dataset}", exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers or len(FIGURES), initializer=_init_worker) as executor:
+        futures = [executor.submit(_render, name, dataset) for name in FIGURES]
+        paths = [future.result() for future in futures]
+
+    logging.info(f"\tRendered {len(paths)} plots in {PLOTS_DIR}/{dataset}")
+    return paths
+
+
+def _init_worker() -> None:
+    """ The workers render to files only """
+    plt.switch_backend("Agg")
+
+
+def _render(name: str, dataset: str) -> str:
+    """
+        Renders a figure and closes it
+        :param name: the name of the figure
+        :param dataset: the dataset type
+        :return: the path of the plot
+    """
+    games, players = load_statistics(dataset)
+    path = f"{PLOTS_DIR}/{dataset}/{name}.png"
+    figure = FIGURES[name](games, players)
+    try:
+        figure.savefig(path, bbox_inches="tight")
+    finally:
+        plt.close(figure)
+    return path
+
+
+def _game_hist(games: pd.DataFrame, players: pd.DataFrame) -> plt.Figure:
+    """ Histograms of the total plays and of the unique users per game """
+    f, axes = plt.subplots(1, 2, sharey=False, tight_layout=True)
+    f.set_figheight(10)
+    f.set_figwidth(20)
+    axes2 = f.add_axes([0.1, 0.5, 0.4, 0.3])  # inset axes
+    axes2.hist(games["RoundCount"]["sum"], bins=50, color="pink")
+    plt.ylim(0, 50)
+    axes3 = f.add_axes([0.6, 0.5, 0.4, 0.3])  # inset axes
+    axes3.hist(games["playerid"]["nunique"], bins=50, color="pink")
+    plt.ylim(0, 50)
+
+    axes[0].hist(games["RoundCount"]["sum"], bins=50)
+    axes[1].hist(games["playerid"]["nunique"], bins=50)
+    axes[0].set(xlabel="Total plays (RoundCounts)", ylabel="Games", title="Hist of total plays per Game")
+    axes[1].set(xlabel="Total plays (Unique Users)", ylabel="Games", title="Hist of unique users per Game")
+    axes2.set(title="Zoom")
+    axes3.set(title="Zoom")
+    return f
+
+
+def _round_players_joint(games: pd.DataFrame, players: pd.DataFrame) -> plt.Figure:
+    """ Joint distribution of the total plays and the unique users of the games """
+    return sns.jointplot(data=games, x=("RoundCount", "sum"), y=("playerid", "nunique")).fig
+
+
+def _games_plot(data: pd.DataFrame) -> plt.Figure:
+    """
+        Generate a plot for games.
+        :param data: the input data
+    """
+    sns.set_theme()
+    f, axes = plt.subplots(2, 2)
+    f.set_figheight(10)
+    f.set_figwidth(20)
+    axes = axes.flatten()
+
+    sns.barplot(x=("RoundCount", "sum"), y="GameName", data=data.reset_index(), palette="coolwarm", ax=axes[0])
+    sns.barplot(x=("playerid", "nunique"), y="GameName", data=data.reset_index(), palette="coolwarm", ax=axes[1])
+    sns.barplot(x=("Turnover", "sum"), y="GameName", data=data.reset_index(), palette="coolwarm", ax=axes[2])
+    sns.barplot(x=("GGR", "sum"), y="GameName", data=data.reset_index(), palette="coolwarm", ax=axes[3])
+    axes[0].set(
+        xlabel="Total plays (RoundCounts)",
+        ylabel="Game",
+        title="# of RoundCounts for the top 20 games with the most plays",
+    )
+    axes[1].set(
+        xlabel="Unique Players", ylabel="Game", title="# of unique Players for the top 20 games with the most plays"
+    )
+    axes[2].set(xlabel="Total Turnover", ylabel="Game", title="Total Turnover for the top 20 games with the most plays")
+    axes[3].set(xlabel="Total GGR", ylabel="Game", title="Total GGR for the top 20 games with the most plays")
+    return f
+
+
+def _players_plot(games: pd.DataFrame, players: pd.DataFrame) -> plt.Figure:
+    """ The top players with the most plays """
+    data = players.head(TOP)
+    sns.set_theme()
+    f, axes = plt.subplots(2, 2)
+    f.set_figheight(10)
+    f.set_figwidth(20)
+    axes = axes.flatten()
+    sns.barplot(x=("RoundCount", "sum"), y="playerid", data=data.reset_index(), palette="coolwarm", ax=axes[0])
+    sns.barplot(x=("GameName", "nunique"), y="playerid", data=data.reset_index(), palette="coolwarm", ax=axes[1])
+    sns.barplot(x=("Turnover", "sum"), y="playerid", data=data.reset_index(), palette="coolwarm", ax=axes[2])
+    sns.barplot(x=("GGR", "sum"), y="playerid", data=data.reset_index(), palette="coolwarm", ax=axes[3])
+    axes[0].set(
+        xlabel="Total plays (RoundCounts)",
+        ylabel="Player",
+        title="# of RoundCounts of the top 20 players with the most plays",
+    )
+    axes[1].set(
+        xlabel="Unique Games", ylabel="Player", title="# of unique games for the top 20 players with the most plays"
+    )
+    axes[2].set(
+        xlabel="Total Turnover", ylabel="Player", title="Total Turnover for the top 20 players with the most plays"
+    )
+    axes[3].set(xlabel="Total GGR", ylabel="Player", title="Total GGR for the top 20 players with the most plays")
+    return f
+
+
+# the figures, by the name of their plot
+FIGURES: Dict[str, Callable[[pd.DataFrame, pd.DataFrame], plt.Figure]] = {
+    "game_hist_all": _game_hist,
+    "round-players-joint": _round_players_joint,
+    "game_totalplays_all": lambda games, players: _games_plot(games.head(TOP)),
+    "game_totalplays_1st": lambda games, players: _games_plot(games[games["IsSGDContent"]["sum"] > 0].head(TOP)),
+    "game_totalplays_3rd": lambda games, players: _games_plot(games[games["IsSGDContent"]["sum"] == 0].head(TOP)),
+    "players_all": _players_plot,
+}
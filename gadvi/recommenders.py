@@ -1,14 +1,88 @@
 import os
+import json
+import time
 import logging
 import pickle
+import hashlib
+from datetime import datetime
 import numpy as np
 import pandas as pd
-from typing import Dict, List, Tuple
+import scipy.sparse as sp
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 from lightfm import LightFM
 from lightfm.data import Dataset
 from lightfm.evaluation import precision_at_k, recall_at_k, auc_score
 
 from . import RECOMMENDERS_DIR
+from .ann import IVFIndex
+from .utils import (
+    REGISTRY,
+    STAGE_SECONDS,
+    IdDictionary,
+    StageTimer,
+    Timer,
+    is_first_party,
+    new_version,
+    publish_version,
+    to_dates,
+)
+
+# the players that predict was asked for, known or unknown to the model
+PREDICTED_PLAYERS = REGISTRY.counter(
+    "gadvi_predicted_players_total", "The players of the predictions, known or unknown to the model", ["kind"]
+)
+
+# the number of games kept per segment of the popularity fallback
+POPULAR_K = 20
+
+# the columns of the rows that train and update read, and the ones that evaluate reads
+TRAIN_COLUMNS = [
+    "playerid",
+    "GameName",
+    "IsSGDContent",
+    "CountryPlayer",
+    "BeginDate_DWID",
+    "RoundCount",
+    "OperatorName",
+]
+TEST_COLUMNS = ["playerid", "GameName"]
+
+# the format of the cached matrices, part of their hash so that the ones of an older format are built again
+MATRICES_FORMAT = 2
+
+
+def _segment(country: Optional[str] = None, operator: Optional[str] = None) -> str:
+    """ The key of a segment of the popularity fallback, an empty country or operator stands for all of them """
+    return f"{country or ''}|{operator or ''}"
+
+
+class SortedIds:
+    """
+        Read-only mapping of ids to indices, backed by a sorted array of the ids and their original positions.
+        Unlike a dict it can be memory-mapped, so that the processes of a server share one copy of it.
+    """
+
+    def __init__(self, sorted_ids: np.ndarray, positions: np.ndarray):
+        self.sorted_ids = sorted_ids
+        self.positions = positions
+
+    def get(self, key: str, default: Optional[int] = None) -> Optional[int]:
+        """
+            Get the index of an id
+            :param key: the id
+            :param default: the value to return for unknown ids
+            :return: the index of the id
+        """
+        i = int(np.searchsorted(self.sorted_ids, key))
+        if i < self.sorted_ids.shape[0] and self.sorted_ids[i] == key:
+            return int(self.positions[i])
+        return default
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return self.sorted_ids.shape[0]
 
 
 class LightFMBased:
@@ -21,6 +95,9 @@ class LightFMBased:
         loss: str = "warp",
         user_features: bool = True,
         item_featres: bool = True,
+        num_threads: int = 1,
+        round_weights: bool = False,
+        popularity_half_life: float = 30.0,
     ):
         self.dataset: str = dataset
         self.name: str = name
@@ -31,170 +108,1009 @@ class LightFMBased:
         self.model: LightFM = None
         self.uf = user_features
         self.itf = item_featres
+        self.num_threads = num_threads
+        # weigh the interactions by their round counts
+        self.round_weights = round_weights
+        # the days after which the round counts of a day weigh half in the popularity fallback
+        self.popularity_half_life = popularity_half_life
+
+        # the seconds of every epoch of the last fit
+        self.epoch_seconds: List[float] = []
+
+        # the version of the loaded model and when and how fast it was loaded
+        self.version: str = ""
+        self.loaded_at: str = ""
+        self.load_seconds: float = 0.0
+
+        # serving state, precomputed from the model and the train data whenever they change
+        self.user_ids: Union[Dict[str, int], SortedIds] = dict()
+        self.user_names: Optional[np.ndarray] = None
+        self.item_names: Optional[np.ndarray] = None
+        self.first_party: Optional[np.ndarray] = None
+        self.third_party_items: Optional[np.ndarray] = None
+        self.seen: Optional[sp.csr_matrix] = None
+        self.user_biases: Optional[np.ndarray] = None
+        self.user_embeddings: Optional[np.ndarray] = None
+        self.item_biases: Optional[np.ndarray] = None
+        self.item_embeddings: Optional[np.ndarray] = None
+
+        # popularity fallback of the unknown players: the top 1st party games of every segment by country and operator,
+        # one row of item indices per segment, padded with -1, and the row of every segment key
+        self.popular_segments: Optional[np.ndarray] = None
+        self.popular_top: Optional[np.ndarray] = None
+        self.popular_ids: Dict[str, int] = dict()
+
+        # approximate nearest neighbour index over the 1st party games, built on demand
+        self.ann: Optional[IVFIndex] = None
+
+        # materialized top-n index: one row of item indices per known player, padded with -1
+        self.top_n: Optional[np.ndarray] = None
 
         if not os.path.exists(self.path):
             os.makedirs(self.path)
 
-    def load(self, model_path: str, dataset_path: str, data_path: str) -> None:
+    def load(self, model_path: str, dataset_path: str, data_path: str, index_path: Optional[str] = None) -> None:
         """
             Load a model given a path
             :param path: the path to the model for loading
             :param dataset_path: the path with the interactions dataset path
             :param data_path: the path with the data used for training
+            :param index_path: the path with the materialized top-n index (optional)
             :return:
         """
+        start = time.time()
         self.model = pickle.load(open(model_path, "rb"))
         self.train_dataset = pickle.load(open(dataset_path, "rb"))
-        self.train_data = pickle.load(open(data_path, "rb"))
+        # the older models kept the dates as they were read from the tsv files
+        self.train_data = self._normalize_dates(pickle.load(open(data_path, "rb")))
+        self._build_serving_state()
 
-    def train(self, train: pd.DataFrame) -> Tuple[float, float, float]:
+        # the popularity fallback saved with the model, the older models build it from their train data
+        popular_path = f"{os.path.splitext(model_path)[0]}_popular.npz"
+        if os.path.exists(popular_path):
+            popular = np.load(popular_path)
+            self.popular_segments, self.popular_top = popular["segments"], popular["top"]
+            self.popular_ids = {segment: i for i, segment in enumerate(self.popular_segments.tolist())}
+        else:
+            self._build_popularity()
+
+        if index_path is not None:
+            self.load_index(index_path)
+        self._set_loaded(datetime.fromtimestamp(os.path.getmtime(model_path)).strftime("%Y%m%d%H%M%S"), start)
+
+    def load_serving(self, path: str, mmap_mode: Optional[str] = None) -> None:
+        """
+            Load a model from a serving artifact, created with export. Only what predict needs is loaded, neither
+            the LightFM model nor the train data.
+            With mmap_mode="r" nothing is copied into the process: the arrays are served from the page cache, so any
+            number of server processes share the same physical memory and loading takes milliseconds.
+            :param path: the directory of the serving artifact
+            :param mmap_mode: the numpy memory-map mode for the arrays (optional)
+            :return:
+        """
+        start = time.time()
+        # the version the path points to now, all the files are read from it even if a new one is published meanwhile
+        path = os.path.realpath(path)
+        with open(f"{path}/meta.json") as fle:
+            meta = json.load(fle)
+        self.name, self.d, self.loss = meta["name"], meta["dimensions"], meta["loss"]
+
+        arrays = {name: np.load(f"{path}/{name}.npy", mmap_mode=mmap_mode) for name in meta["arrays"]}
+        self.user_names, self.item_names = arrays["users"], arrays["items"]
+        if "users_sorted" in arrays:
+            self.user_ids = SortedIds(arrays["users_sorted"], arrays["users_positions"])
+        else:
+            self.user_ids = {u: i for i, u in enumerate(self.user_names.tolist())}
+        self.user_biases, self.user_embeddings = arrays["user_biases"], arrays["user_embeddings"]
+        self.item_biases, self.item_embeddings = arrays["item_biases"], arrays["item_embeddings"]
+        self.first_party = arrays["first_party"]
+        self.third_party_items = np.flatnonzero(~self.first_party)
+        self.seen = sp.csr_matrix(
+            (arrays["seen_data"], arrays["seen_indices"], arrays["seen_indptr"]),
+            shape=(self.user_names.shape[0], self.item_names.shape[0]),
+        )
+
+        self.top_n = arrays.get("top_n")
+        self.popular_segments, self.popular_top = arrays.get("popular_segments"), arrays.get("popular_top")
+        self.popular_ids = dict()
+        if self.popular_segments is not None:
+            self.popular_ids = {segment: i for i, segment in enumerate(self.popular_segments.tolist())}
+        if "ann_centroids" in arrays:
+            self.ann = IVFIndex.from_arrays({n[4:]: a for n, a in arrays.items() if n.startswith("ann_")})
+        modified = datetime.fromtimestamp(os.path.getmtime(f"{path}/meta.json")).strftime("%Y%m%d%H%M%S")
+        self._set_loaded(meta.get("version", modified), start)
+
+    def load_index(self, index_path: str) -> None:
+        """
+            Load a materialized top-n index. The index must have been built from the loaded model.
+            :param index_path: the path to the .npz index
+            :return:
+        """
+        index = np.load(index_path)
+        if not np.array_equal(index["users"], self.user_names) or not np.array_equal(index["items"], self.item_names):
+            raise ValueError("The top-n index does not match the loaded model.")
+
+        self.top_n = index["top_n"]
+
+    def train(self, train: pd.DataFrame, dictionary: Optional[IdDictionary] = None) -> Tuple[float, float, float]:
         """
             Model training
             :param train: the train dataframe
+            :param dictionary: the id dictionary of the dataset (optional)
             :return: precision@3, recall@3, auc
         """
-        # create the dataset
-        train_dataset = Dataset()
-        dtrain = train[
-            ["playerid", "GameName", "RoundCount", "IsSGDContent", "CountryPlayer", "OperatorName", "GameProviderName"]
-        ]
-        dtrain["content"] = dtrain["IsSGDContent"].apply(lambda x: 1 if x.lower().strip() == "1st party" else 0)
-        dtrain["all"] = list(zip(dtrain["playerid"], dtrain["GameName"], dtrain["content"]))
-
-        # Fit the dataset
-        user_features = dtrain["CountryPlayer"] if self.uf else None
-        item_features = dtrain["IsSGDContent"] if self.itf else None
-        self.user_features = user_features
-        self.item_features = item_features
+        matrices = self.build_matrices(train, dictionary=dictionary)
+        p, r, a = self.fit(matrices)
+        self.set_train_data(matrices, train)
+
+        return p, r, a
+
+    def update(
+        self, new: pd.DataFrame, epochs: Optional[int] = None, replay: float = 0.0, seed: int = 10
+    ) -> Tuple[float, float, float]:
+        """
+            Warm start a trained model on new rows instead of retraining it from scratch: the mappings are extended
+            with the new players, games and features, the representations of the old ones are kept and the new ones
+            are initialized like LightFM does, and fit_partial continues on the interactions of the new rows. A
+            sample of the old interactions can be replayed along with them, so that the old players and games do not
+            drift away from the new ones.
+            :param new: the new rows, with the columns of the train data
+            :param epochs: the epochs of fit_partial, the ones of the model by default
+            :param replay: the share of the old rows that are replayed, 0 to fit on the new rows only
+            :param seed: the seed of the replayed sample
+            :return: precision@3, recall@3, auc on the interactions of the update
+        """
+        if self.model is None or self.train_data is None:
+            raise ValueError("There is no trained model to update.")
+        epochs = self.epochs if epochs is None else epochs
+        # the new rows may be in the stored format, with YYYYMMDD integer dates
+        new = self._normalize_dates(new)
+
+        with StageTimer("train.update.mappings"):
+            self.train_dataset.fit_partial(
+                users=new["playerid"].unique(),
+                items=new["GameName"].unique(),
+                user_features=new["CountryPlayer"].dropna().unique() if self.uf else None,
+                item_features=new["IsSGDContent"].dropna().unique() if self.itf else None,
+            )
+            self._grow_model()
 
+        rows = new
+        if replay > 0:
+            rows = pd.concat([self.train_data.sample(frac=replay, random_state=seed), new], ignore_index=True)
+        data = pd.concat([self.train_data, new], ignore_index=True)
+        for column in data.columns:
+            if isinstance(self.train_data[column].dtype, pd.CategoricalDtype):
+                data[column] = data[column].astype("category")
+
+        # the interactions of the update, one entry per row like Dataset.build_interactions, in the same order in both
+        # matrices as the sample weights of fit need
+        user_ids, _, item_ids, _ = self.train_dataset.mapping()
+        users = self._map_ids(rows["playerid"], user_ids)
+        games = self._map_ids(rows["GameName"], item_ids)
+        shape = self.train_dataset.interactions_shape()
+        interactions = sp.coo_matrix((np.ones(users.shape[0], dtype=np.int32), (users, games)), shape=shape)
+        weights = None
+        if self.round_weights:
+            weights = sp.coo_matrix((rows["RoundCount"].to_numpy(np.float32), (users, games)), shape=shape)
+
+        # the feature weights are counted on all the rows, like a fit on them would
+        matrices = {**self._feature_matrices(data), "dataset": self.train_dataset}
+        for epoch in range(epochs):
+            start = time.time()
+            self.model.fit_partial(
+                interactions,
+                user_features=matrices["user_features"],
+                item_features=matrices["item_features"],
+                sample_weight=weights,
+                epochs=1,
+                num_threads=self.num_threads,
+            )
+            logging.info(f"Update epoch {epoch + 1}/{epochs} in {time.time() - start:.3f}s.")
+        p, r, a = self.score(interactions, matrices)
+
+        self.set_train_data(
+            {
+                **matrices,
+                "users": data["playerid"],
+                "games": data["GameName"],
+                "user_feature_values": data["CountryPlayer"] if self.uf else None,
+                "item_feature_values": data["IsSGDContent"] if self.itf else None,
+            },
+            data,
+        )
+        return p, r, a
+
+    def _grow_model(self) -> None:
+        """
+            Add the rows of the new features of the dataset to the representations of the model, initialized the way
+            LightFM initializes them, and keep the ones of the old features as they are
+            :return:
+        """
+        n_users, n_items = self.train_dataset.interactions_shape()
+        n_user_features, n_item_features = self.train_dataset.user_features_shape()[1], n_items
+        if self.itf:
+            n_item_features = self.train_dataset.item_features_shape()[1]
+        if not self.uf:
+            n_user_features = n_users
+
+        model = self.model
+        gradient = 1.0 if model.learning_schedule == "adagrad" else 0.0
+        for prefix, n in [("user", n_user_features), ("item", n_item_features)]:
+            embeddings = getattr(model, f"{prefix}_embeddings")
+            added = n - embeddings.shape[0]
+            if added <= 0:
+                continue
+            new = ((model.random_state.rand(added, model.no_components) - 0.5) / model.no_components).astype(np.float32)
+            setattr(model, f"{prefix}_embeddings", np.concatenate([embeddings, new]))
+            for name, fill, width in [
+                ("embedding_gradients", gradient, model.no_components),
+                ("embedding_momentum", 0.0, model.no_components),
+                ("biases", 0.0, None),
+                ("bias_gradients", gradient, None),
+                ("bias_momentum", 0.0, None),
+            ]:
+                old = getattr(model, f"{prefix}_{name}")
+                rows = np.full((added, width) if width else added, fill, dtype=np.float32)
+                setattr(model, f"{prefix}_{name}", np.concatenate([old, rows]))
+        logging.info(f"The model has {n_user_features} user and {n_item_features} item features.")
+
+    def build_matrices(
+        self,
+        train: pd.DataFrame,
+        user_features: Optional[bool] = None,
+        item_features: Optional[bool] = None,
+        cache: bool = True,
+        dictionary: Optional[IdDictionary] = None,
+    ) -> Dict:
+        """
+            Build the LightFM dataset of the train data: the id mappings, the interactions and the features.
+            The matrices are the ones of Dataset.build_interactions and build_user/item_features over the rows, built
+            in vectorized calls from the int32 codes of the id dictionary. They are saved as .npz files keyed by a
+            hash of the train data and the features, and later runs on the same data load them.
+            :param train: the train dataframe
+            :param user_features: build the user features, if the model uses them by default
+            :param item_features: build the item features, if the model uses them by default
+            :param cache: load the matrices if they are saved, else save them
+            :param dictionary: the id dictionary of the dataset, built from the train data by default
+            :return: the dataset, the interactions, the weights and the user and item features (None if not built)
+        """
+        uf = self.uf if user_features is None else user_features
+        itf = self.itf if item_features is None else item_features
+
+        dtrain = train[["playerid", "GameName", "IsSGDContent", "CountryPlayer"]]
+        rounds = train["RoundCount"] if self.round_weights else None
+        user_feature_values = dtrain["CountryPlayer"] if uf else None
+        item_feature_values = dtrain["IsSGDContent"] if itf else None
+        columns = {
+            "users": dtrain["playerid"],
+            "games": dtrain["GameName"],
+            "user_feature_values": user_feature_values,
+            "item_feature_values": item_feature_values,
+        }
+
+        digest = hashlib.blake2b(f"{MATRICES_FORMAT}:{uf}:{itf}:{self.round_weights}".encode(), digest_size=16)
+        digest.update(pd.util.hash_pandas_object(dtrain, index=False).values.tobytes())
+        if rounds is not None:
+            digest.update(pd.util.hash_pandas_object(rounds, index=False).values.tobytes())
+        path = f"{self.path}/matrices/{digest.hexdigest()}"
+        if cache and os.path.exists(f"{path}/mappings.npz"):
+            with Timer() as t:
+                matrices = self._load_matrices(path)
+            logging.info(f"Matrices loaded from {path} in {t.elapsed}s.")
+            return {**matrices, **columns}
+
+        # the codes of the id dictionary, extended in memory with the values it does not have yet
+        dictionary = IdDictionary() if dictionary is None else dictionary
+        dictionary.update(dtrain)
+
+        # the ids of the model are given in the order of their first appearance, like when fitted on the rows
+        users, user_names = self._factorize(dtrain["playerid"], dictionary)
+        games, game_names = self._factorize(dtrain["GameName"], dictionary)
+        user_feature_codes, user_feature_names = self._factorize(user_feature_values, dictionary) if uf else (None, [])
+        item_feature_codes, item_feature_names = self._factorize(item_feature_values, dictionary) if itf else (None, [])
+        train_dataset = Dataset()
         train_dataset.fit(
-            dtrain["playerid"], dtrain["GameName"], item_features=item_features, user_features=user_features
+            user_names,
+            game_names,
+            item_features=item_feature_names if itf else None,
+            user_features=user_feature_names if uf else None,
         )
 
         # Build the features
-        build_if = (
-            train_dataset.build_item_features(
-                [(x[0], [x[1]]) for x in dtrain[["GameName", "IsSGDContent"]].values], normalize=False
+        # the identity features come first, then the features in the order of their ids
+        # the rows with a missing feature value add only the identity feature of their entity
+        n_games, n_users = len(game_names), len(user_names)
+        n_item_features, n_user_features = n_games + len(item_feature_names), n_users + len(user_feature_names)
+        build_if, build_uf = None, None
+        if itf:
+            known = item_feature_codes >= 0
+            build_if = self._build_features(
+                games[known], np.arange(n_games), n_games + item_feature_codes[known], n_item_features
             )
-            if self.itf
-            else None
-        )
-
-        build_uf = (
-            train_dataset.build_user_features(
-                [(x[0], [x[1]]) for x in dtrain[["playerid", "CountryPlayer"]].values], normalize=False
+        if uf:
+            known = user_feature_codes >= 0
+            build_uf = self._build_features(
+                users[known], np.arange(n_users), n_users + user_feature_codes[known], n_user_features
             )
-            if self.uf
-            else None
-        )
 
         # build interactions
         # create the interaction matrix [Encodes the interaction between the user and the items]
         # Train_inter is a sparse matrix that has the unique users as rows and the unique games as columns
         # each cell is the filled with the number of times (dates not round counts) that a user played each game
-        # weights matrix is similar to the interaction matrix but the values is the sum of the roundcounts per player
-        # and game. If no weight is used then, the weights is the same with the interactions matrix
-        (train_inter, train_weights) = train_dataset.build_interactions(dtrain["all"])
+        # weights matrix is similar to the interaction matrix but the values are the 1st party flags of the rows, or
+        # their round counts
+        # both have one entry per row, the repeated pairs included, like Dataset.build_interactions, since fit trains
+        # on every entry, and they are in the same order as the sample weights of fit need
+        shape = train_dataset.interactions_shape()
+        train_inter = sp.coo_matrix((np.ones(users.shape[0], dtype=np.int32), (users, games)), shape=shape)
+        if self.round_weights:
+            weights = rounds.to_numpy(np.float32)
+        else:
+            weights = is_first_party(dtrain["IsSGDContent"]).astype(np.float32)
+        train_weights = sp.coo_matrix((weights, (users, games)), shape=shape)
         total = train_inter.shape[0] * train_inter.shape[1]
-        sparcity = (total - train_inter.count_nonzero()) / total
+        # count_nonzero of a coo matrix sums its duplicates in place, the csr copy is counted instead
+        sparcity = (total - train_inter.tocsr().count_nonzero()) / total
         logging.info(sparcity)
 
-        # build model
-        model = LightFM(no_components=self.d, loss=self.loss)
-        model.fit(train_inter, item_features=build_if, user_features=build_uf, epochs=self.epochs, verbose=True)
+        matrices = {
+            "dataset": train_dataset,
+            "interactions": train_inter,
+            "weights": train_weights,
+            "user_features": build_uf,
+            "item_features": build_if,
+        }
+        if cache:
+            self._save_matrices(path, matrices)
+        return {**matrices, **columns}
+
+    @staticmethod
+    def _factorize(values: pd.Series, dictionary: IdDictionary) -> Tuple[np.ndarray, List]:
+        """
+            The ids of the values of a column in the order of their first appearance, from the int32 codes of the
+            dictionary if it encodes the column. The missing values have no id, like pd.factorize does.
+            :param values: the column
+            :param dictionary: the id dictionary
+            :return: the int32 id of every row, -1 for the missing values, and the value of every id
+        """
+        if values.name in dictionary.columns:
+            ids, codes = pd.factorize(dictionary.encode(values, values.name))
+            # the code -1 of the missing values is not an id, the ids after it are shifted down
+            known = codes >= 0
+            shift = np.cumsum(known) - 1
+            shift[~known] = -1
+            return shift[ids].astype(np.int32), dictionary.decode(codes[known], values.name).tolist()
+        ids, uniques = pd.factorize(values)
+        return ids.astype(np.int32), list(uniques)
+
+    @staticmethod
+    def _build_features(
+        entities: np.ndarray, identity: np.ndarray, features: np.ndarray, n_features: int
+    ) -> sp.csr_matrix:
+        """
+            The feature matrix of Dataset.build_user/item_features, given one (entity, [feature]) pair per row: the
+            identity feature of every entity, and for every entity and feature the number of their rows, which is
+            what the repeated pairs sum up to
+            :param entities: the id of the entity of every row
+            :param identity: the column of the identity feature of every entity
+            :param features: the column of the feature of every row
+            :param n_features: the number of columns, the identity features included
+            :return: the feature matrix
+        """
+        n_entities = identity.shape[0]
+        pairs, counts = np.unique(entities.astype(np.int64) * n_features + features, return_counts=True)
+
+        rows = np.concatenate([np.arange(n_entities), pairs // n_features])
+        columns = np.concatenate([identity, pairs % n_features])
+        data = np.concatenate([np.ones(n_entities, dtype=np.float32), counts.astype(np.float32)])
+        return sp.coo_matrix((data, (rows, columns)), shape=(n_entities, n_features)).tocsr()
+
+    @staticmethod
+    def _map_ids(values: pd.Series, mapping: Dict) -> np.ndarray:
+        """
+            Map the values of a column to their ids, looking up every distinct value once
+            :param values: the column
+            :param mapping: the ids of the values
+            :return: the id of every row, -1 for the unknown values
+        """
+        values = values.astype("category")
+        ids = np.array([mapping.get(c, -1) for c in values.cat.categories], dtype=np.int64)
+        return np.append(ids, -1)[values.cat.codes.to_numpy()]
+
+    @staticmethod
+    def _identity_features(ids: Dict, feature_ids: Dict) -> np.ndarray:
+        """
+            The column of the identity feature of every entity, in the order of the ids
+            :param ids: the ids of the entities
+            :param feature_ids: the ids of the features, the identity ones included
+            :return: the feature id of every entity id
+        """
+        identity = np.empty(len(ids), dtype=np.int64)
+        identity[np.fromiter(ids.values(), dtype=np.int64, count=len(ids))] = np.fromiter(
+            (feature_ids[e] for e in ids), dtype=np.int64, count=len(ids)
+        )
+        return identity
+
+    def _feature_matrices(self, data: pd.DataFrame) -> Dict:
+        """
+            The feature matrices of the features the model uses, in the ids of its dataset, even after the mappings
+            have been extended and the identity features are no longer the first ones
+            :param data: the rows the feature weights are counted on, the train data
+            :return: the user and item features (None if not used)
+        """
+        user_ids, user_feature_ids, item_ids, item_feature_ids = self.train_dataset.mapping()
+        matrices = dict()
+        for name, used, ids, feature_ids, entity, feature in [
+            ("user_features", self.uf, user_ids, user_feature_ids, "playerid", "CountryPlayer"),
+            ("item_features", self.itf, item_ids, item_feature_ids, "GameName", "IsSGDContent"),
+        ]:
+            if not used:
+                matrices[name] = None
+                continue
+            identity = self._identity_features(ids, feature_ids)
+            columns = self._map_ids(data[feature], feature_ids)
+            entities = self._map_ids(data[entity], ids)
+            known = (columns >= 0) & (entities >= 0)
+            matrices[name] = self._build_features(entities[known], identity, columns[known], len(feature_ids))
+        return matrices
+
+    @staticmethod
+    def _save_matrices(path: str, matrices: Dict) -> None:
+        """
+            Save the matrices and the id mappings as .npz files
+            :param path: the directory of the matrices
+            :param matrices: the matrices of build_matrices
+            :return:
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in ["interactions", "weights", "user_features", "item_features"]:
+            if matrices[name] is not None:
+                sp.save_npz(f"{path}/{name}.npz", matrices[name])
+
+        # the features of the mappings after the identity features
+        user_ids, user_feature_ids, item_ids, item_feature_ids = matrices["dataset"].mapping()
+        np.savez(
+            f"{path}/mappings.npz",
+            users=np.array(list(user_ids), dtype=str),
+            items=np.array(list(item_ids), dtype=str),
+            user_features=np.array(list(user_feature_ids)[len(user_ids):], dtype=str),
+            item_features=np.array(list(item_feature_ids)[len(item_ids):], dtype=str),
+        )
 
-        p = precision_at_k(model, train_inter, item_features=build_if, user_features=build_uf, k=3).mean()
-        r = recall_at_k(model, train_inter, item_features=build_if, user_features=build_uf, k=3).mean()
-        a = auc_score(model, train_inter, item_features=build_if, user_features=build_uf).mean()
+    @staticmethod
+    def _load_matrices(path: str) -> Dict:
+        """
+            Load the matrices and the id mappings saved by _save_matrices
+            :param path: the directory of the matrices
+            :return: the matrices of build_matrices
+        """
+        matrices = dict()
+        for name in ["interactions", "weights", "user_features", "item_features"]:
+            exists = os.path.exists(f"{path}/{name}.npz")
+            matrices[name] = sp.load_npz(f"{path}/{name}.npz") if exists else None
 
-        self.users = dtrain["playerid"]
-        self.games = dtrain["GameName"]
-        self.train_dataset = train_dataset
-        self.train_data = train
+        mappings = np.load(f"{path}/mappings.npz")
+        dataset = Dataset()
+        dataset.fit(
+            mappings["users"].tolist(),
+            mappings["items"].tolist(),
+            user_features=mappings["user_features"].tolist() if matrices["user_features"] is not None else None,
+            item_features=mappings["item_features"].tolist() if matrices["item_features"] is not None else None,
+        )
+        matrices["dataset"] = dataset
+        return matrices
+
+    def fit(self, matrices: Dict) -> Tuple[float, float, float]:
+        """
+            Fit the model on the matrices of build_matrices, with the features the model uses, one epoch at a time
+            so that every epoch is timed. With round_weights the interactions are weighed by their round counts.
+            :param matrices: the matrices of the train data
+            :return: precision@3, recall@3, auc on the train interactions
+        """
+        build_uf = matrices["user_features"] if self.uf else None
+        build_if = matrices["item_features"] if self.itf else None
+        train_inter = matrices["interactions"]
+        weights = matrices["weights"] if self.round_weights else None
+
+        # build model, fit resets the model and runs the epochs of fit_partial
+        model = LightFM(no_components=self.d, loss=self.loss)
+        self.epoch_seconds = []
+        for epoch in range(self.epochs):
+            start = time.time()
+            model.fit_partial(
+                train_inter,
+                item_features=build_if,
+                user_features=build_uf,
+                sample_weight=weights,
+                epochs=1,
+                num_threads=self.num_threads,
+            )
+            self.epoch_seconds.append(time.time() - start)
+            logging.info(f"Epoch {epoch + 1}/{self.epochs} in {self.epoch_seconds[-1]:.3f}s.")
         self.model = model
 
+        return self.score(train_inter, matrices)
+
+    def score(self, interactions: sp.coo_matrix, matrices: Dict) -> Tuple[float, float, float]:
+        """
+            The metrics of the model on interactions in the ids of the train matrices
+            :param interactions: the interactions to score
+            :param matrices: the matrices of the train data
+            :return: precision@3, recall@3, auc
+        """
+        features = {
+            "user_features": matrices["user_features"] if self.uf else None,
+            "item_features": matrices["item_features"] if self.itf else None,
+            "num_threads": self.num_threads,
+        }
+        p = precision_at_k(self.model, interactions, k=3, **features).mean()
+        r = recall_at_k(self.model, interactions, k=3, **features).mean()
+        a = auc_score(self.model, interactions, **features).mean()
+
         return p, r, a
 
+    @staticmethod
+    def build_test_interactions(matrices: Dict, test: pd.DataFrame) -> sp.coo_matrix:
+        """
+            Build the interactions of test data in the ids of the train matrices, the unknown players and games are
+            dropped
+            :param matrices: the matrices of the train data
+            :param test: the test dataframe
+            :return: the test interactions
+        """
+        user_ids, _, item_ids, _ = matrices["dataset"].mapping()
+        known = test[test["playerid"].isin(list(user_ids)) & test["GameName"].isin(list(item_ids))]
+        test_inter, _ = matrices["dataset"].build_interactions(zip(known["playerid"], known["GameName"]))
+        return test_inter
+
+    def set_train_data(self, matrices: Dict, train: pd.DataFrame) -> None:
+        """
+            Keep the train data and mappings of a fitted model, for evaluate, predict and save
+            :param matrices: the matrices of the train data
+            :param train: the train dataframe
+            :return:
+        """
+        self.users = matrices["users"]
+        self.games = matrices["games"]
+        self.user_features = matrices["user_feature_values"] if self.uf else None
+        self.item_features = matrices["item_feature_values"] if self.itf else None
+        self.train_dataset = matrices["dataset"]
+        self.train_data = self._normalize_dates(train)
+        self._build_serving_state()
+        self._build_popularity()
+
+    @staticmethod
+    def _normalize_dates(data: pd.DataFrame) -> pd.DataFrame:
+        """
+            The rows with their BeginDate_DWID as datetimes, whether it is given as datetimes, YYYYMMDD integers or
+            strings, or a mix of them
+            :param data: the rows
+            :return: the rows with normalized dates
+        """
+        if "BeginDate_DWID" not in data.columns:
+            return data
+        return data.assign(BeginDate_DWID=to_dates(data["BeginDate_DWID"]))
+
     def evaluate(self, test: pd.DataFrame) -> Tuple[float, float, float]:
         """
             Model evaluating
             :param test: the evaluation dataset
             :return: precision@3, recall@3, auc
         """
-        # test
-        test_dataset = Dataset()
-        dtest = test[["playerid", "GameName", "RoundCount", "IsSGDContent"]]
-        dtest["content"] = dtest["IsSGDContent"].apply(lambda x: 1 if x.lower().strip() == "1st party" else 0)
+        # the test interactions and the train features in the ids of the train dataset, the unknown players and
+        # games are dropped
+        test_inter = self.build_test_interactions({"dataset": self.train_dataset}, test)
+        test_users, test_games = self.train_dataset.interactions_shape()
+        print(f"Test users: {test_users}, Test games {test_games}.")
 
-        dtest["all"] = list(zip(dtest["playerid"], dtest["GameName"]))
+        p, r, a = self.score(test_inter, self._feature_matrices(self.train_data))
 
-        test_dataset.fit(self.users, self.games, user_features=self.user_features, item_features=self.item_features)
-        test_users, test_games = test_dataset.interactions_shape()
-        print(f"Test users: {test_users}, Test games {test_games}.")
+        return p, r, a
 
-        # create the interaction matrix [Encodes the interaction between the user and the items]
-        (test_inter, test_weights) = test_dataset.build_interactions(dtest["all"])
+    def predict(
+        self, player: str, k: int = 3, country: Optional[str] = None, operator: Optional[str] = None
+    ) -> Dict[str, List[str]]:
+        """
+            Predict from model. The known players are answered from the materialized index if it has k columns, else
+            from the approximate nearest neighbour index if it has been built, else by scoring every game. The unknown
+            players get the popular games of their segment instead, see source.
+            :param player: the player id to get predictions for
+            :param k: the number of recommendations
+            :param country: the country of the player, for the popularity fallback (optional)
+            :param operator: the operator of the player, for the popularity fallback (optional)
+            :return: A dictionary with key the player id and value the list with the game recommendations
+        """
 
-        # Build the features
-        build_if = (
-            test_dataset.build_item_features(
-                [(x[0], [x[1]]) for x in dtest[["GameName", "IsSGDContent"]].values], normalize=False
-            )
-            if self.itf
-            else None
+        # check if the player id is a known player
+        player_id = self.user_ids.get(player)
+        if player_id is None:
+            PREDICTED_PLAYERS.inc("unknown")
+            return {player: self.popular(k, country, operator)}
+        PREDICTED_PLAYERS.inc("known")
+
+        # answer from the materialized index when it is available, else search the approximate or the exact way
+        if self.top_n is not None and k <= self.top_n.shape[1]:
+            with StageTimer("predict.index"):
+                row = self.top_n[player_id, :k]
+        elif self.ann is not None:
+            with StageTimer("predict.ann"):
+                row = self._ann_top_k(player_id, k)
+        else:
+            row = self._top_k(np.array([player_id]), k)[0]
+        with StageTimer("predict.decode"):
+            return {player: self.item_names[row[row >= 0]].tolist()}
+
+    def source(self, player: str) -> str:
+        """
+            Which path answers the predictions of a player
+            :param player: the player id
+            :return: "model" for the known players, "popularity" for the unknown ones, "none" if the model has no
+                     popularity fallback
+        """
+        if self.user_ids.get(player) is not None:
+            return "model"
+        return "popularity" if self.popular_ids else "none"
+
+    def popular(self, k: int = 3, country: Optional[str] = None, operator: Optional[str] = None) -> List[str]:
+        """
+            The popular 1st party games of the most specific segment of a player that the fallback has: their country
+            and operator, their country, their operator, or all the players
+            :param k: the number of recommendations, at most POPULAR_K
+            :param country: the country of the player (optional)
+            :param operator: the operator of the player (optional)
+            :return: the game recommendations, none if the model has no popularity fallback
+        """
+        with StageTimer("predict.popular"):
+            for segment in [_segment(country, operator), _segment(country), _segment(None, operator), _segment()]:
+                row = self.popular_ids.get(segment)
+                if row is not None:
+                    top = self.popular_top[row, :k]
+                    return self.item_names[top[top >= 0]].tolist()
+            return []
+
+    def predict_batch(self, players: List[str], k: int = 3, chunk_size: int = 4096) -> Dict[str, List[str]]:
+        """
+            Predict from model for many players at once.
+            :param players: the player ids to get predictions for
+            :param k: the number of recommendations per player
+            :param chunk_size: the number of players scored at once, it bounds the memory of the score matrix
+            :return: A dictionary with key the player id and value the list with the game recommendations
+        """
+        recommendations: Dict[str, List[str]] = dict()
+        for chunk in self.iter_predict_batch(players, k=k, chunk_size=chunk_size):
+            recommendations.update(chunk)
+        return recommendations
+
+    def iter_predict_batch(
+        self, players: List[str], k: int = 3, chunk_size: int = 4096
+    ) -> Iterator[Dict[str, List[str]]]:
+        """
+            Predict from model for many players at once, one chunk of players at a time. The known players are answered
+            from the materialized index if it has k columns, else from the approximate nearest neighbour index if it
+            has been built, else every chunk is scored as a single matrix product of the user and the item
+            representations. The unknown players get the popular games of all the players.
+            :param players: the player ids to get predictions for
+            :param k: the number of recommendations per player
+            :param chunk_size: the number of players scored at once, it bounds the memory of the score matrix
+            :return: An iterator over dictionaries with key the player id and value the list with the game
+                     recommendations
+        """
+        for start in range(0, len(players), chunk_size):
+            chunk = players[start : start + chunk_size]
+            with StageTimer("predict.lookup"):
+                player_ids = np.array([self.user_ids.get(p, -1) for p in chunk], dtype=np.int64)
+            known = player_ids >= 0
+            PREDICTED_PLAYERS.inc("known", amount=int(known.sum()))
+            PREDICTED_PLAYERS.inc("unknown", amount=int((~known).sum()))
+
+            # like predict: the materialized index, else the approximate search, else the exact one
+            top = np.full((len(chunk), k), -1, dtype=np.int32)
+            if self.top_n is not None and k <= self.top_n.shape[1]:
+                top[known] = self.top_n[player_ids[known], :k]
+            elif self.ann is not None:
+                with StageTimer("predict.ann"):
+                    for i in np.flatnonzero(known):
+                        top[i] = self._ann_top_k(player_ids[i], k)
+            elif known.any():
+                top[known] = self._top_k(player_ids[known], k)
+
+            with StageTimer("predict.decode"):
+                names = self.item_names[top]
+                recommendations = {p: n[r >= 0].tolist() for p, n, r in zip(chunk, names, top)}
+            if not known.all():
+                popular = self.popular(k)
+                recommendations.update({p: list(popular) for p, i in zip(chunk, known) if not i})
+            yield recommendations
+
+    def materialize(self, k: int = 3, chunk_size: int = 4096) -> None:
+        """
+            Precompute the top-k recommendations of every known player, with the seen games and the 3rd party games
+            already removed, so that predict becomes a single lookup.
+            Every row is scored again: a train or an update changes the representations of the games, and so the
+            scores of every player.
+            :param k: the number of recommendations to keep per player
+            :param chunk_size: the number of players scored at once
+            :return:
+        """
+        n_users = self.user_names.shape[0]
+        logging.info(f"Materializing the top-{k} of {n_users} players.")
+
+        top_n = np.full((n_users, k), -1, dtype=np.int32)
+        for start in range(0, n_users, chunk_size):
+            chunk = np.arange(start, min(start + chunk_size, n_users))
+            top_n[chunk] = self._top_k(chunk, k)
+
+        self.top_n = top_n
+
+    def save_index(self, path: Optional[str] = None) -> None:
+        """
+            Save the materialized top-n index
+            :param path: the path to save the index to, by default next to the model pickles
+            :return:
+        """
+        if self.top_n is None:
+            raise ValueError("The top-n index has not been materialized.")
+
+        np.savez(
+            path if path is not None else f"{self.path}/model_{self.name}_{self.d}_{self.loss}_topn.npz",
+            users=self.user_names,
+            items=self.item_names,
+            top_n=self.top_n,
         )
 
-        build_uf = (
-            test_dataset.build_user_features(
-                [(x[0], [x[1]]) for x in dtest[["playerid", "CountryPlayer"]].values], normalize=False
+    def build_ann(self, n_lists: Optional[int] = None, n_probe: int = 8, overfetch: int = 2) -> None:
+        """
+            Build an approximate nearest neighbour index over the 1st party games, that predict then searches instead
+            of scoring every game. The item bias is appended to the embedding, and 1 to the query, so that the inner
+            product is the score of the model.
+            :param n_lists: the number of clusters of the index, by default the square root of the number of games
+            :param n_probe: the minimum number of clusters searched per query
+            :param overfetch: how many candidates per recommendation must survive the removal of the seen games
+            :return:
+        """
+        vectors = np.hstack([self.item_embeddings, self.item_biases[:, None]])
+        items = np.flatnonzero(self.first_party)
+        with Timer() as t:
+            self.ann = IVFIndex(n_lists=n_lists, n_probe=n_probe, overfetch=overfetch).build(vectors[items], items)
+        logging.info(f"ANN index of {items.shape[0]} games built in {t.elapsed}s.")
+
+    def evaluate_ann(self, n_players: int = 1000, k: int = 3) -> Tuple[float, float, float]:
+        """
+            Compare the approximate search with the exact one on a sample of the known players
+            :param n_players: the number of players to sample
+            :param k: the number of recommendations
+            :return: recall@k of the approximate search, mean milliseconds of the exact and of the approximate search
+        """
+        rng = np.random.default_rng(10)
+        players = rng.choice(self.user_names.shape[0], min(n_players, self.user_names.shape[0]), replace=False)
+
+        with Timer() as t_exact:
+            exact = [self._top_k(np.array([p]), k)[0] for p in players]
+        with Timer() as t_ann:
+            approximate = [self._ann_top_k(p, k) for p in players]
+
+        found = sum(np.isin(e[e >= 0], a).sum() for e, a in zip(exact, approximate))
+        total = sum((e >= 0).sum() for e in exact)
+        return (
+            found / total if total else 1.0,
+            t_exact._elapsed * 1000 / players.shape[0],
+            t_ann._elapsed * 1000 / players.shape[0],
+        )
+
+    def export(self, path: Optional[str] = None) -> str:
+        """
+            Export what serving needs, and only that, as plain numpy arrays that can be memory-mapped: the user and
+            item representations, the id mappings, the 1st party games, the games each player has already played, the
+            popularity fallback and the materialized top-n index if any.
+            Every export is a new version in <path>.versions/, and path is a link that is swapped to it atomically
+            once it is complete: the servers map the files of the served version, which are never rewritten.
+            :param path: the path to export to, by default next to the model pickles
+            :return: the path of the serving artifact
+        """
+        if path is None:
+            path = f"{self.path}/model_{self.name}_{self.d}_{self.loss}_serving"
+        version = new_version(path)
+
+        positions = np.argsort(self.user_names, kind="stable").astype(np.int32)
+        arrays = {
+            "users": self.user_names,
+            "users_sorted": self.user_names[positions],
+            "users_positions": positions,
+            "items": self.item_names,
+            "user_biases": self.user_biases,
+            "user_embeddings": self.user_embeddings,
+            "item_biases": self.item_biases,
+            "item_embeddings": self.item_embeddings,
+            "first_party": self.first_party,
+            "seen_data": self.seen.data,
+            "seen_indices": self.seen.indices,
+            "seen_indptr": self.seen.indptr,
+        }
+        if self.top_n is not None:
+            arrays["top_n"] = self.top_n
+        if self.popular_top is not None:
+            arrays["popular_segments"] = self.popular_segments
+            arrays["popular_top"] = self.popular_top
+        if self.ann is not None:
+            arrays.update({f"ann_{name}": array for name, array in self.ann.to_arrays().items()})
+
+        for name, array in arrays.items():
+            np.save(f"{version}/{name}.npy", np.ascontiguousarray(array))
+        with open(f"{version}/meta.json", "w") as fle:
+            json.dump(
+                {
+                    "name": self.name,
+                    "dimensions": self.d,
+                    "loss": self.loss,
+                    "arrays": list(arrays.keys()),
+                    "version": datetime.now().strftime("%Y%m%d%H%M%S"),
+                },
+                fle,
+                indent=2,
             )
-            if self.uf
-            else None
+        publish_version(path, version)
+
+        return path
+
+    def _set_loaded(self, version: str, start: float) -> None:
+        """
+            Record the version of a model that has just been loaded and the time it took
+            :param version: the version of the model
+            :param start: the time the loading started
+            :return:
+        """
+        self.version = version
+        self.loaded_at = datetime.now().isoformat(timespec="seconds")
+        self.load_seconds = time.time() - start
+        STAGE_SECONDS.observe(self.load_seconds, "model.load")
+
+    def _ann_top_k(self, player_id: int, k: int) -> np.ndarray:
+        """
+            Search the approximate nearest neighbour index for a player, excluding the games already played
+            :param player_id: the mapped id of the player
+            :param k: the number of recommendations
+            :return: the mapped ids of the games, best first, padded with -1
+        """
+        query = np.append(self.user_embeddings[player_id], 1).astype(np.float32)
+        seen = self.seen.indices[self.seen.indptr[player_id] : self.seen.indptr[player_id + 1]]
+        return self.ann.search(query, k, exclude=seen)
+
+    def _top_k(self, users: np.ndarray, k: int) -> np.ndarray:
+        """
+            Score all the games for a batch of players and keep the best k of those that can be recommended
+            :param users: the mapped ids of the players
+            :param k: the number of recommendations per player
+            :return: a (players x k) array with the mapped ids of the games, best first, padded with -1
+        """
+        with StageTimer("predict.score"):
+            scores = self.user_embeddings[users] @ self.item_embeddings.T + self.item_biases
+
+        # exclude the 3rd party games and the games that each player has already played
+        with StageTimer("predict.filter"):
+            scores[:, self.third_party_items] = -np.inf
+            seen = self.seen[users]
+            scores[np.repeat(np.arange(users.shape[0]), np.diff(seen.indptr)), seen.indices] = -np.inf
+
+        with StageTimer("predict.sort"):
+            kk = min(k, scores.shape[1])
+            best = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+            best_scores = np.take_along_axis(scores, best, axis=1)
+            order = np.argsort(-best_scores, axis=1, kind="stable")
+            best = np.take_along_axis(best, order, axis=1)
+            best[np.take_along_axis(best_scores, order, axis=1) == -np.inf] = -1
+
+        top = np.full((users.shape[0], k), -1, dtype=np.int32)
+        top[:, :kk] = best
+        return top
+
+    def _build_serving_state(self) -> None:
+        """
+            Precompute everything predict needs from the model and the train data: the id mappings in both directions,
+            the user and item representations, the 1st party games and the games each player has already played.
+            :return:
+        """
+        n_users, n_items = self.train_dataset.interactions_shape()
+
+        self.user_ids = self.train_dataset._user_id_mapping
+        self.user_names = np.empty(n_users, dtype=object)
+        self.user_names[list(self.user_ids.values())] = list(self.user_ids.keys())
+        self.user_names = self.user_names.astype(str)
+        self.item_names = np.empty(n_items, dtype=object)
+        self.item_names[list(self.train_dataset._item_id_mapping.values())] = list(
+            self.train_dataset._item_id_mapping.keys()
         )
+        self.item_names = self.item_names.astype(str)
 
-        p = precision_at_k(self.model, test_inter, user_features=build_uf, item_features=build_if, k=3).mean()
-        r = recall_at_k(self.model, test_inter, user_features=build_uf, item_features=build_if, k=3).mean()
-        a = auc_score(self.model, test_inter, user_features=build_uf, item_features=build_if).mean()
+        self.first_party = self._first_party_mask()
+        self.third_party_items = np.flatnonzero(~self.first_party)
+        self.seen = self._seen_matrix()
 
-        return p, r, a
+        # the representations with the identity features, i.e. what model.predict scores without features. They are
+        # the first rows, unless an update has added features after the identity features of the old entities
+        user_biases, user_embeddings = self.model.get_user_representations()
+        item_biases, item_embeddings = self.model.get_item_representations()
+        user_rows, item_rows = np.arange(n_users), np.arange(n_items)
+        user_ids, user_feature_ids, item_ids, item_feature_ids = self.train_dataset.mapping()
+        if user_embeddings.shape[0] > n_users:
+            user_rows = self._identity_features(user_ids, user_feature_ids)
+        if item_embeddings.shape[0] > n_items:
+            item_rows = self._identity_features(item_ids, item_feature_ids)
+        self.user_biases, self.user_embeddings = user_biases[user_rows], user_embeddings[user_rows]
+        self.item_biases, self.item_embeddings = item_biases[item_rows], item_embeddings[item_rows]
 
-    def predict(self, player: str) -> Dict[str, List[str]]:
+        # a new model invalidates the materialized and the approximate index
+        self.top_n = None
+        self.ann = None
+
+    def _seen_matrix(self) -> sp.csr_matrix:
         """
-            Predict from model.
-            :param player: the player id to get predictions for
-            :return: A dictionary with key the player id and value the list with the game recommendations
+            Build the player x game matrix of the games each player has already played
+            :return: a boolean sparse matrix with the mapped player ids as rows and the mapped game ids as columns
         """
+        shape = self.train_dataset.interactions_shape()
+        users = self._map_ids(self.train_data["playerid"], self.train_dataset._user_id_mapping)
+        items = self._map_ids(self.train_data["GameName"], self.train_dataset._item_id_mapping)
+        pairs = np.unique(users * shape[1] + items)
 
-        # check if the player id is a known player
-        if player not in list(self.train_dataset._user_id_mapping.keys()):
-            return {player: []}
-        else:
-            player_id = self.train_dataset._user_id_mapping[player]
-            scores = self.model.predict(player_id, np.arange(self.train_dataset.interactions_shape()[1]))
-            key_list = list(self.train_dataset._item_id_mapping.keys())
-            val_list = list(self.train_dataset._item_id_mapping.values())
-
-            known_games = self.train_data[self.train_data["playerid"] == player]
-
-            recommendations: List[str] = []
-            for s in np.argsort(-scores):
-                if len(recommendations) == 3:
-                    break
-                rn = key_list[val_list.index(s)]
-                if rn in list(known_games["GameName"]):
-                    continue
-                if (
-                    self.train_data[self.train_data["GameName"] == rn].iloc[0]["IsSGDContent"].lower().strip()
-                    == "3rd party"
-                ):
-                    continue
-                recommendations.append(rn)
-
-            return {player: recommendations}
+        return sp.csr_matrix(
+            (np.ones(pairs.shape[0], dtype=bool), (pairs // shape[1], pairs % shape[1])), shape=shape
+        )
+
+    def _first_party_mask(self) -> np.ndarray:
+        """
+            Flag the 1st party games, based on the first appearance of each game in the train data
+            :return: a boolean array indexed by the mapped game ids
+        """
+        games = self.train_data.drop_duplicates("GameName")
+        mask = np.zeros(self.train_dataset.interactions_shape()[1], dtype=bool)
+        first = is_first_party(games["IsSGDContent"]) == 1
+        mask[self._map_ids(games["GameName"], self.train_dataset._item_id_mapping)[first]] = True
+        return mask
+
+    def _build_popularity(self) -> None:
+        """
+            Build the popularity fallback: the top POPULAR_K 1st party games of every country and operator, of every
+            country, of every operator and of all the players, by the round counts of the train data, where the
+            round counts of a day weigh half every popularity_half_life days before the latest day
+            :return:
+        """
+        data = self.train_data
+        games = self._map_ids(data["GameName"], self.train_dataset._item_id_mapping)
+        first = (games >= 0) & self.first_party[np.maximum(games, 0)]
+
+        # the dates are normalized by set_train_data
+        dates = data["BeginDate_DWID"]
+        days = ((dates.max() - dates) / pd.Timedelta(days=1)).to_numpy(np.float64)
+        weights = data["RoundCount"].to_numpy(np.float64) * 0.5 ** (days / self.popularity_half_life)
+
+        rows = pd.DataFrame({"game": games[first], "weight": weights[first]})
+        for column, name in [("CountryPlayer", "country"), ("OperatorName", "operator")]:
+            values = data[column] if column in data.columns else pd.Series("", index=data.index)
+            rows[name] = values.astype(str).to_numpy()[first]
+
+        # the weights of every game in the segments of every level, the missing columns of a level stand for all
+        levels = []
+        for keys in [["country", "operator"], ["country"], ["operator"], []]:
+            level = rows.groupby(keys + ["game"], sort=False)["weight"].sum().reset_index()
+            for name in {"country", "operator"} - set(keys):
+                level[name] = ""
+            levels.append(level)
+        popular = pd.concat(levels, ignore_index=True).sort_values(
+            ["country", "operator", "weight", "game"], ascending=[True, True, False, True], kind="stable"
+        )
+        popular = popular[popular.groupby(["country", "operator"], sort=False).cumcount() < POPULAR_K]
+
+        segments = (popular["country"] + "|" + popular["operator"]).to_numpy(dtype=str)
+        self.popular_segments, rows_of = np.unique(segments, return_inverse=True)
+        self.popular_top = np.full((self.popular_segments.shape[0], POPULAR_K), -1, dtype=np.int32)
+        ranks = popular.groupby(["country", "operator"], sort=False).cumcount().to_numpy()
+        self.popular_top[rows_of, ranks] = popular["game"].to_numpy()
+        self.popular_ids = {segment: i for i, segment in enumerate(self.popular_segments.tolist())}
 
     def save(self) -> None:
         """
-            Save a model
+            Save a model, along with its popularity fallback and the materialized top-n index if any
             :return:
         """
         with open(f"{self.path}/model_{self.name}_{self.d}_{self.loss}.pickle", "wb") as fle:
@@ -203,10 +1119,23 @@ class LightFMBased:
             pickle.dump(self.train_dataset, fle, protocol=pickle.HIGHEST_PROTOCOL)
         with open(f"{self.path}/model_{self.name}_{self.d}_{self.loss}_data.pickle", "wb") as fle:
             pickle.dump(self.train_data, fle, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.popular_top is not None:
+            np.savez(
+                f"{self.path}/model_{self.name}_{self.d}_{self.loss}_popular.npz",
+                segments=self.popular_segments,
+                top=self.popular_top,
+            )
+        if self.top_n is not None:
+            self.save_index()
 
     def get_info(self) -> Dict[str, str]:
         """
-            Return model information. Currently it returns only the name of the model
-            :return: A dictionary with the name of the model
+            Return model information
+            :return: A dictionary with the name and the version of the model, and when and how fast it was loaded
         """
-        return {"name": self.name}
+        return {
+            "name": self.name,
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "load_seconds": f"{self.load_seconds:.3f}",
+        }
@@ -0,0 +1,376 @@
+import os
+import hmac
+import time
+import asyncio
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .recommenders import PREDICTED_PLAYERS, LightFMBased
+from .utils import REGISTRY, CacheBackend, MetricsRegistry, process_memory
+
+# the most recommendations a request can ask for
+MAX_K = 100
+
+
+def load_model(path: str, mmap_mode: Optional[str] = "r") -> LightFMBased:
+    """
+        Load a model for serving. A directory is a serving artifact (see LightFMBased.export), a file is the model
+        pickle, with the dataset and data pickles and the optional top-n index next to it.
+        :param path: the path to the serving artifact or to the model pickle
+        :param mmap_mode: the numpy memory-map mode for the serving artifact
+        :return: the loaded model
+    """
+    model = LightFMBased()
+    if os.path.isdir(path):
+        model.load_serving(path, mmap_mode=mmap_mode)
+    else:
+        base = os.path.splitext(path)[0]
+        index_path = f"{base}_topn.npz"
+        model.load(
+            path,
+            f"{base}_dataset.pickle",
+            f"{base}_data.pickle",
+            index_path=index_path if os.path.exists(index_path) else None,
+        )
+
+    # touch the serving structures once, so that the first request does not pay for it
+    if model.user_names.shape[0] > 0:
+        model.predict(str(model.user_names[0]))
+
+    return model
+
+
+def authorized(token: Optional[str], header: Optional[str]) -> bool:
+    """
+        Whether a request to an admin route carries the admin token. Without a configured token the admin routes are
+        disabled.
+        :param token: the admin token of the server, if any
+        :param header: the token of the request, if any
+        :return: True if the tokens match
+    """
+    if not token or header is None:
+        return False
+    return hmac.compare_digest(token.encode(), header.encode())
+
+
+def parse_k(value, default: int = 3, maximum: int = MAX_K) -> int:
+    """
+        The number of recommendations that a request asks for, an integer from 1 to the maximum
+        :param value: the k of the request, None if it is not given
+        :param default: the k of the requests that do not give it
+        :param maximum: the largest k
+        :return: the k
+        :raises ValueError: if the k of the request is not an integer from 1 to the maximum
+    """
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).strip().isdigit():
+        raise ValueError(f"k must be an integer from 1 to {maximum}")
+    k = int(value)
+    if not 1 <= k <= maximum:
+        raise ValueError(f"k must be an integer from 1 to {maximum}")
+    return k
+
+
+class ModelHolder:
+    """
+        Holds the model that is being served. A new model is loaded in the background and then swapped in with a
+        single assignment, so requests that already got the old model finish on it.
+    """
+
+    def __init__(self, path: str, loader: Callable[[str], LightFMBased] = load_model):
+        """
+            Initialization, the first model is loaded synchronously
+            :param path: the path of the model to serve
+            :param loader: the function that loads a model from a path
+        """
+        self.path: str = path
+        self.loader = loader
+        self.model: LightFMBased = loader(path)
+        self.listeners: List[Callable[[LightFMBased], None]] = []
+        self.last_error: str = ""
+
+        self._lock = threading.Lock()
+        self._stamp = self._modified(path)
+
+    def reload(self, path: Optional[str] = None, wait: bool = False) -> bool:
+        """
+            Load a model in the background and swap it in when it is ready
+            :param path: the path of the new model, by default the current path
+            :param wait: block until the new model is served
+            :return: False if a reload is already in progress
+        """
+        if not self._lock.acquire(blocking=False):
+            return False
+
+        thread = threading.Thread(target=self._reload, args=(path or self.path,), daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return True
+
+    def watch(self, interval: float) -> None:
+        """
+            Poll the model path and reload whenever it changes. Every server process watches on its own, unlike
+            a reload request that only reaches the process that handles it.
+            :param interval: the seconds between two polls
+            :return:
+        """
+
+        def poll():
+            while True:
+                time.sleep(interval)
+                if self._modified(self.path) != self._stamp:
+                    self.reload()
+
+        threading.Thread(target=poll, daemon=True).start()
+
+    def _reload(self, path: str) -> None:
+        """
+            Load a model and swap it in
+            :param path: the path of the new model
+            :return:
+        """
+        # a broken model is not retried until it changes again
+        stamp = self._modified(path)
+        try:
+            model = self.loader(path)
+            self.model, self.path, self.last_error = model, path, ""
+            for listener in self.listeners:
+                listener(model)
+            logging.info(f"Model {model.version} from {path} loaded in {model.load_seconds:.3f}s.")
+        except Exception as e:
+            self.last_error = str(e)
+            logging.exception(f"Failed to reload the model from {path}.")
+        finally:
+            self._stamp = stamp
+            self._lock.release()
+
+    @staticmethod
+    def _modified(path: str) -> Tuple[str, float]:
+        """
+            The version of a model on disk: for a serving artifact the version directory its path points to, which
+            export swaps atomically, and the modification time of its metadata file, that is written last
+            :param path: the path of the model
+            :return: the resolved path and its modification time, 0 if it does not exist
+        """
+        path = os.path.realpath(path)
+        meta = f"{path}/meta.json" if os.path.isdir(path) else path
+        return path, os.path.getmtime(meta) if os.path.exists(meta) else 0.0
+
+
+class PredictionCache:
+    """
+        Caches the recommendations of the known players in front of the served model, keyed by the model version, the
+        player id and k. The unknown players are answered by the popularity fallback of their segment, which is a
+        lookup already, and are not cached. The cache is cleared when the holder swaps in a new model.
+    """
+
+    def __init__(self, holder: ModelHolder, backend: CacheBackend):
+        """
+            Initialization
+            :param holder: the holder of the served model
+            :param backend: the cache backend
+        """
+        self.holder = holder
+        self.backend = backend
+        holder.listeners.append(lambda model: backend.clear())
+
+    def get(self, model: LightFMBased, player: str, k: int) -> Optional[List[str]]:
+        """
+            Get the cached recommendations of a player
+            :param model: the model that would answer
+            :param player: the player id
+            :param k: the number of recommendations
+            :return: the recommendations, None on a miss
+        """
+        return self.backend.get(self._key(model, player, k))
+
+    def set(self, model: LightFMBased, player: str, k: int, recommendations: List[str]) -> None:
+        """
+            Cache the recommendations of a player
+            :param model: the model that answered
+            :param player: the player id
+            :param k: the number of recommendations
+            :param recommendations: the recommendations
+            :return:
+        """
+        self.backend.set(self._key(model, player, k), recommendations)
+
+    def predict(
+        self, player: str, k: int = 3, country: Optional[str] = None, operator: Optional[str] = None
+    ) -> Dict[str, List[str]]:
+        """
+            Predict from the served model, through the cache. The unknown players are answered by the popularity
+            fallback of their segment, which is a lookup already and is not cached.
+            :param player: the player id to get predictions for
+            :param k: the number of recommendations
+            :param country: the country of the player, for the popularity fallback (optional)
+            :param operator: the operator of the player, for the popularity fallback (optional)
+            :return: A dictionary with key the player id and value the list with the game recommendations
+        """
+        model = self.holder.model
+        if model.source(player) != "model":
+            return model.predict(player, k, country, operator)
+        recommendations = self.get(model, player, k)
+        if recommendations is None:
+            recommendations = model.predict(player, k)[player]
+            self.set(model, player, k, recommendations)
+        return {player: recommendations}
+
+    @staticmethod
+    def _key(model: LightFMBased, player: str, k: int) -> str:
+        return f"{model.version}:{k}:{player}"
+
+
+class MicroBatcher:
+    """
+        Collects the predict requests that arrive concurrently within a short window and scores them as one batch,
+        i.e. one matrix product against the item representations instead of one per request.
+    """
+
+    def __init__(
+        self,
+        holder: ModelHolder,
+        window: float = 0.002,
+        max_batch: int = 256,
+        cache: Optional[PredictionCache] = None,
+    ):
+        """
+            Initialization
+            :param holder: the holder of the served model
+            :param window: the seconds to wait for more requests after the first one of a batch
+            :param max_batch: the number of requests that triggers the scoring before the window closes
+            :param cache: the cache to answer from, and to fill, if any
+        """
+        self.holder = holder
+        self.window = window
+        self.max_batch = max_batch
+        self.cache = cache
+
+        self._pending: List[Tuple[LightFMBased, str, int, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def predict(
+        self, player: str, k: int = 3, country: Optional[str] = None, operator: Optional[str] = None
+    ) -> Dict[str, List[str]]:
+        """
+            Predict for one player, as part of the next batch. The unknown players are answered right away by the
+            popularity fallback of their segment. The request is answered by the model served when it arrives, even
+            if the holder swaps in a new one before its batch is scored.
+            :param player: the player id to get predictions for
+            :param k: the number of recommendations
+            :param country: the country of the player, for the popularity fallback (optional)
+            :param operator: the operator of the player, for the popularity fallback (optional)
+            :return: A dictionary with key the player id and value the list with the game recommendations
+        """
+        model = self.holder.model
+        if model.source(player) != "model":
+            return model.predict(player, k, country, operator)
+        if self.cache is not None:
+            recommendations = self.cache.get(model, player, k)
+            if recommendations is not None:
+                return {player: recommendations}
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((model, player, k, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        """
+            Close the current batch and score it in the background
+            :return:
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._score(batch))
+
+    async def _score(self, batch: List[Tuple[LightFMBased, str, int, asyncio.Future]]) -> None:
+        """
+            Score a batch in a worker thread, so that the event loop keeps accepting requests, and answer each request
+            :param batch: the pending requests, with the model that answers them
+            :return:
+        """
+        loop = asyncio.get_running_loop()
+        for model, k in set((request[0], request[2]) for request in batch):
+            requests = [request for request in batch if request[0] is model and request[2] == k]
+            try:
+                predictions = await loop.run_in_executor(
+                    None, model.predict_batch, list(set(request[1] for request in requests)), k
+                )
+                for _, player, _, future in requests:
+                    if self.cache is not None:
+                        self.cache.set(model, player, k, predictions[player])
+                    if not future.done():
+                        future.set_result({player: predictions[player]})
+            except Exception as e:
+                for _, _, _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+class ServerMetrics:
+    """
+        The metrics of a server process, in the Prometheus text format: the requests by route and status code and
+        their latency, the stages of predict and of the data pipeline, the load time of the served model, the rate of
+        the unknown players and the memory of the process. Every worker process has its own metrics, unless the
+        registry is shared with the other workers (MetricsRegistry.share), then the counters and the histograms are
+        summed over all of them and the gauges are rendered per worker, labelled with its pid.
+    """
+
+    def __init__(self, holder: ModelHolder, registry: MetricsRegistry = REGISTRY):
+        """
+            Initialization
+            :param holder: the holder of the served model
+            :param registry: the registry of the metrics, the one of the process by default
+        """
+        self.registry = registry
+        self.requests = registry.counter("gadvi_requests_total", "The requests by route and status", ["route", "code"])
+        self.latency = registry.histogram("gadvi_request_seconds", "The latency of the requests by route", ["route"])
+        registry.gauge(
+            "gadvi_model_load_seconds", "The seconds the served model took to load", lambda: holder.model.load_seconds
+        )
+        registry.gauge("gadvi_unknown_players_ratio", "The share of unknown players in the predictions", self._unknown)
+        registry.gauge(
+            "process_resident_memory_bytes", "The resident memory of the process", lambda: process_memory()["resident"]
+        )
+        registry.gauge(
+            "process_max_resident_memory_bytes",
+            "The peak resident memory of the process",
+            lambda: process_memory()["max_resident"],
+        )
+
+    def observe(self, route: str, status: int, seconds: float) -> None:
+        """
+            Count a request and observe its latency
+            :param route: the route of the request
+            :param status: the status code of the response
+            :param seconds: the seconds it took
+            :return:
+        """
+        self.requests.inc(route, str(status))
+        self.latency.observe(seconds, route)
+
+    def render(self) -> str:
+        """
+            The metrics in the text format
+            :return: the body of the metrics endpoint
+        """
+        return self.registry.render()
+
+    @staticmethod
+    def _unknown() -> Optional[float]:
+        """ The share of the unknown players, None before any prediction """
+        unknown, known = PREDICTED_PLAYERS.value("unknown"), PREDICTED_PLAYERS.value("known")
+        return unknown / (unknown + known) if unknown + known > 0 else None
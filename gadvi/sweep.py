@@ -0,0 +1,138 @@
+import os
+import time
+import logging
+import itertools
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+from .recommenders import LightFMBased
+from .utils import IdDictionary
+
+# the metrics of every candidate, the leaderboard is ranked by one of them
+METRICS = ["precision", "recall", "auc", "train_precision", "train_recall", "train_auc"]
+
+# the matrices shared by the workers of a sweep, set before the workers are forked so that they are never copied
+_SHARED: Dict[str, Any] = dict()
+
+
+def search_space(space: Dict[str, List], search: str = "grid", candidates: int = 10, seed: int = 10) -> List[Dict]:
+    """
+        The candidates of a search space
+        :param space: the values of every searched parameter
+        :param search: 'grid' for all the combinations, 'random' for a sample of them
+        :param candidates: the number of candidates of a random search
+        :param seed: the seed of a random search
+        :return: the parameters of every candidate
+    """
+    if search not in ["grid", "random"]:
+        raise ValueError("The search should be 'grid' or 'random'.")
+
+    names = list(space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])]
+    if search == "grid" or candidates >= len(grid):
+        return grid
+
+    rng = np.random.default_rng(seed)
+    return [grid[i] for i in sorted(rng.choice(len(grid), size=candidates, replace=False))]
+
+
+def run_sweep(
+    config: Dict,
+    candidates: List[Dict],
+    train: pd.DataFrame,
+    test: pd.DataFrame,
+    workers: Optional[int] = None,
+    num_threads: Optional[int] = None,
+    metric: str = "precision",
+    dictionary: Optional[IdDictionary] = None,
+) -> Tuple[pd.DataFrame, LightFMBased]:
+    """
+        Train and evaluate the candidates in a pool of processes, each fit with num_threads threads. The matrices are
+        built once, with all the features, and shared read-only by the forked workers. Only the best model is kept.
+        :param config: the model configuration, the candidates override some of its parameters
+        :param candidates: the parameters of every candidate
+        :param train: the train dataframe
+        :param test: the test dataframe
+        :param workers: the number of processes, by default as many as the cores fit with num_threads threads
+        :param num_threads: the threads of every fit, the num_threads of the configuration by default
+        :param metric: the metric the candidates are ranked by, one of METRICS
+        :param dictionary: the id dictionary of the dataset (optional)
+        :return: the leaderboard and the best model
+    """
+    if metric not in METRICS:
+        raise ValueError(f"The metric should be one of {METRICS}")
+
+    if num_threads is not None:
+        config = {**config, "num_threads": num_threads}
+    workers = workers or max(1, (os.cpu_count() or 1) // config.get("num_threads", 1))
+    base = LightFMBased(**_model_parameters(config, dict()))
+    with_uf = any(_model_parameters(config, c)["user_features"] for c in candidates)
+    with_itf = any(_model_parameters(config, c)["item_featres"] for c in candidates)
+    # the round count weights are built if any candidate uses them, the others ignore them
+    base.round_weights = any(_model_parameters(config, c)["round_weights"] for c in candidates)
+
+    start = time.time()
+    matrices = base.build_matrices(train, user_features=with_uf, item_features=with_itf, dictionary=dictionary)
+    _SHARED.update(matrices=matrices, test=base.build_test_interactions(matrices, test))
+    logging.info(f"Matrices built in {time.time() - start:.1f}s, sweeping {len(candidates)} candidates")
+
+    rows: List[Dict] = []
+    best: Optional[LightFMBased] = None
+    best_score = 0.0
+    try:
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = [executor.submit(_train_candidate, _model_parameters(config, c)) for c in candidates]
+            for future in as_completed(futures):
+                model, row = future.result()
+                rows.append(row)
+                logging.info(f"\t{row}")
+                # only the best model is kept in memory
+                if best is None or row[metric] > best_score:
+                    best, best_score = model, row[metric]
+    finally:
+        _SHARED.clear()
+
+    leaderboard = pd.DataFrame(rows).sort_values(metric, ascending=False).reset_index(drop=True)
+    leaderboard.index.name = "rank"
+
+    best.set_train_data(matrices, train)
+    return leaderboard, best
+
+
+def _model_parameters(config: Dict, candidate: Dict) -> Dict:
+    """ The parameters of the model of a candidate """
+    parameters = {**config, **candidate}
+    return {
+        "dataset": parameters["dataset"],
+        "name": parameters["name"],
+        "dimensions": parameters["dimensions"],
+        "loss": parameters["loss"],
+        "epochs": parameters["epochs"],
+        "user_features": parameters["user_features"],
+        "item_featres": parameters["item_featres"],
+        "num_threads": parameters.get("num_threads", 1),
+        "round_weights": parameters.get("round_weights", False),
+        "popularity_half_life": parameters.get("popularity_half_life", 30.0),
+    }
+
+
+def _train_candidate(parameters: Dict) -> Tuple[LightFMBased, Dict]:
+    """
+        Train and evaluate a candidate on the shared matrices, in a worker
+        :param parameters: the parameters of the model
+        :return: the model, without the train data, and the row of the leaderboard
+    """
+    start = time.time()
+    model = LightFMBased(**parameters)
+    train_metrics = model.fit(_SHARED["matrices"])
+    test_metrics = model.score(_SHARED["test"], _SHARED["matrices"])
+
+    row = {**parameters}
+    row.update({name: float(value) for name, value in zip(METRICS[:3], test_metrics)})
+    row.update({name: float(value) for name, value in zip(METRICS[3:], train_metrics)})
+    row["seconds"] = round(time.time() - start, 2)
+    return model, row
@@ -0,0 +1,170 @@
+import os
+import sqlite3
+import logging
+import numpy as np
+import pandas as pd
+from typing import Any, Callable, Dict, Iterator
+
+# the sizes of the synthetic datasets, the players of tiny, small and big are the ones of the sample datasets
+SCALES = {
+    "tiny": {"players": 5000, "games": 500, "rows": 100000},
+    "small": {"players": 100000, "games": 2000, "rows": 2000000},
+    "big": {"players": 500000, "games": 3000, "rows": 10000000},
+    "full": {"players": 2000000, "games": 5000, "rows": 40000000},
+}
+
+# the countries of the players, their currencies and the exchange rates of the local currencies
+COUNTRIES = pd.DataFrame(
+    {
+        "CountryPlayer": ["GB", "SE", "DE", "GR", "IT", "ES", "NL", "DK", "NO", "FI"],
+        "Currency": ["GBP", "SEK", "EUR", "EUR", "EUR", "EUR", "EUR", "DKK", "NOK", "EUR"],
+        "Rate": [0.85, 10.5, 1.0, 1.0, 1.0, 1.0, 1.0, 7.45, 10.8, 1.0],
+    }
+)
+
+PROVIDERS = 40
+OPERATORS = 25
+
+# the share of the providers of 1st party content
+FIRST_PARTY = 0.25
+
+# the year of the facts, the test split is its last month
+YEAR = 2020
+
+SEED = 10
+
+
+def _zipf_weights(n: int, exponent: float) -> np.ndarray:
+    """ Probabilities that decay as a power of the rank, the skew of the activity of players and games """
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def dimension_tables(scale: str = "tiny", seed: int = SEED) -> Dict[str, pd.DataFrame]:
+    """
+        The dimension tables of the join, with the columns of the database
+        :param scale: the size of the data, one of SCALES
+        :param seed: the seed of the data
+        :return: the dimension tables by name
+    """
+    if scale not in SCALES:
+        raise ValueError(f"The scale should be one of {list(SCALES)}")
+    sizes = SCALES[scale]
+    rng = np.random.default_rng(seed)
+
+    providers = pd.DataFrame(
+        {
+            "GameProvider_DWID": np.arange(PROVIDERS),
+            "GameProviderName": [f"Provider_{i:03d}" for i in range(PROVIDERS)],
+            "GameProviderId": np.arange(PROVIDERS) + 1000,
+            "IsSGDContent": np.where(np.arange(PROVIDERS) < PROVIDERS * FIRST_PARTY, "1st Party", "3rd Party"),
+        }
+    )
+    games = pd.DataFrame(
+        {
+            "GameName": [f"Game_{i:08d}" for i in range(sizes["games"])],
+            "Game_DWID": np.arange(sizes["games"]),
+            "GameID": np.arange(sizes["games"]) + 100000,
+            # a few providers have most of the games
+            "GameProvider_DWID": rng.choice(PROVIDERS, sizes["games"], p=_zipf_weights(PROVIDERS, 1.0)),
+        }
+    )
+    players = pd.DataFrame(
+        {
+            "Player_DWID": np.arange(sizes["players"]),
+            "playerid": [f"Player_{i:08d}" for i in rng.permutation(sizes["players"]) + 10000000],
+            "CountryPlayer": COUNTRIES["CountryPlayer"].to_numpy()[
+                rng.choice(len(COUNTRIES), sizes["players"], p=_zipf_weights(len(COUNTRIES), 1.2))
+            ],
+        }
+    )
+    operators = pd.DataFrame(
+        {"Operator_DWID": np.arange(OPERATORS), "OperatorName": [f"Operator_{i:03d}" for i in range(OPERATORS)]}
+    )
+    return {"dimGameProvider": providers, "dimGame": games, "dimPlayer": players, "dimOperator": operators}
+
+
+def iter_facts(
+    tables: Dict[str, pd.DataFrame], scale: str = "tiny", seed: int = SEED, chunksize: int = 1000000
+) -> Iterator[pd.DataFrame]:
+    """
+        The rows of the fact table in chunks, so that they never have to be in memory at once. The activity of the
+        players and the popularity of the games are skewed, every player plays at one operator, in the currency of
+        their country, and the plays of a day are lognormal.
+        :param tables: the dimension tables
+        :param scale: the size of the data, one of SCALES
+        :param seed: the seed of the data, the rows are the same for the same seed and chunksize
+        :param chunksize: the number of rows per chunk
+        :return: an iterator over the chunks
+    """
+    sizes = SCALES[scale]
+    rng = np.random.default_rng(seed)
+    player_weights = _zipf_weights(sizes["players"], 0.7)[rng.permutation(sizes["players"])]
+    game_weights = _zipf_weights(sizes["games"], 1.1)[rng.permutation(sizes["games"])]
+    operators = rng.choice(OPERATORS, sizes["players"], p=_zipf_weights(OPERATORS, 1.0))
+    rates = tables["dimPlayer"].merge(COUNTRIES, on="CountryPlayer", how="left")
+    days = pd.date_range(f"{YEAR}-01-01", f"{YEAR}-12-31").strftime("%Y%m%d").astype(int).to_numpy()
+
+    for i, start in enumerate(range(0, sizes["rows"], chunksize)):
+        n = min(chunksize, sizes["rows"] - start)
+        chunk_rng = np.random.default_rng([seed, i])
+        players = chunk_rng.choice(sizes["players"], n, p=player_weights)
+        rounds = np.maximum(1, chunk_rng.lognormal(2.5, 1.2, n)).astype(np.int64)
+        turnover = np.round(rounds * chunk_rng.lognormal(0.0, 1.0, n), 2)
+        # the house edge is a few percents, with the wins and the losses of the day around it
+        ggr = np.round(turnover * (0.04 + chunk_rng.normal(0.0, 0.3, n)), 2)
+        rate = rates["Rate"].to_numpy()[players]
+        yield pd.DataFrame(
+            {
+                "Player_DWID": players,
+                "Game_DWID": chunk_rng.choice(sizes["games"], n, p=game_weights),
+                "Operator_DWID": operators[players],
+                "BeginDate_DWID": days[chunk_rng.integers(0, len(days), n)],
+                "RoundCount": rounds,
+                "Turnover": turnover,
+                "GGR": ggr,
+                "Currency": rates["Currency"].to_numpy()[players],
+                "TurnoverLocalCurr": np.round(turnover * rate, 2),
+                "GGRLocalCurr": np.round(ggr * rate, 2),
+            }
+        )
+
+
+def write_sqlite(path: str, scale: str = "tiny", seed: int = SEED, chunksize: int = 1000000) -> int:
+    """
+        Writes the synthetic tables in a sqlite database, a stand-in of the SQL Server that DataBrain extracts from
+        :param path: the path of the database, it is replaced if it exists
+        :param scale: the size of the data, one of SCALES
+        :param seed: the seed of the data
+        :param chunksize: the number of rows written at once
+        :return: the number of rows of the fact table
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+    tables = dimension_tables(scale, seed)
+    rows = 0
+    connection = sqlite3.connect(path)
+    try:
+        for name, table in tables.items():
+            table.to_sql(name, connection, index=False)
+        for chunk in iter_facts(tables, scale, seed, chunksize):
+            chunk.to_sql("FactTablePlayer", connection, index=False, if_exists="append")
+            rows += chunk.shape[0]
+            logging.info(f"\tWritten {rows} rows")
+        connection.execute("CREATE INDEX date ON FactTablePlayer (BeginDate_DWID)")
+        connection.commit()
+    finally:
+        connection.close()
+    return rows
+
+
+def sqlite_connector(path: str) -> Callable[[], Any]:
+    """
+        The connector of a sqlite database, for DataBrain and DBConnector
+        :param path: the path of the database
+        :return: a function that opens a connection, usable from the threads of the connection pool
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No database at {path}")
+    return lambda: sqlite3.connect(path, check_same_thread=False)
@@ -1,2 +1,28 @@
-from gadvi.utils.db_connector import DBConnector  # noqa: F401
-from gadvi.utils.utils import Timer  # noqa: F401
+from gadvi.utils.db_connector import ConnectionPool, DBConnector  # noqa: F401
+from gadvi.utils.utils import Timer, is_first_party, to_dates  # noqa: F401
+from gadvi.utils.cache import CacheBackend, LocalCache  # noqa: F401
+from gadvi.utils.aggregation import GroupAggregator  # noqa: F401
+from gadvi.utils.dictionary import ENCODED_COLUMNS, IdDictionary  # noqa: F401
+from gadvi.utils.metrics import (  # noqa: F401
+    REGISTRY,
+    STAGE_SECONDS,
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+    StageTimer,
+    process_memory,
+)
+from gadvi.utils.storage import (  # noqa: F401
+    CATEGORICAL_COLUMNS,
+    DatasetWriter,
+    clear_partitions,
+    dataset_exists,
+    iter_dataset,
+    load_dataset,
+    new_version,
+    partition_path,
+    publish_version,
+    remove_dataset,
+    save_dataset,
+)
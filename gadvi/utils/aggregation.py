@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+# the aggregations that have mergeable partials
+AGGREGATIONS = ["sum", "count", "nunique"]
+
+# the partials are compacted once their rows outgrow both the compacted state and this number of rows
+COMPACT_ROWS = 1000000
+
+
+def _as_str(values: pd.Series) -> pd.Series:
+    """ The values as strings, categoricals only rename their categories """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.rename_categories(values.cat.categories.astype(str))
+    return values.astype(str).astype("category")
+
+
+def _hash(values: pd.Series) -> np.ndarray:
+    """ 64 bit hashes of the values, the same for a value in every chunk """
+    return pd.util.hash_array(_as_str(values).array)
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """ The number of bits of unsigned 64 bit integers, split in halves that floats represent exactly """
+    high = np.frexp((values >> np.uint64(32)).astype(np.float64))[1]
+    low = np.frexp((values & np.uint64(0xFFFFFFFF)).astype(np.float64))[1]
+    return np.where(high > 0, high + 32, low)
+
+
+class GroupAggregator:
+    """
+        Group by aggregation over the chunks of a dataset that never has to be in memory as a whole. Every chunk is
+        reduced to a partial aggregate, and the partials are merged: the sums and the counts by adding them, the
+        distinct values either exactly, as the distinct (group, value) hashes, or approximately, as the registers
+        of a HyperLogLog per group, so that memory is bounded by the number of groups.
+    Usage:
+        games = GroupAggregator("GameName", {"playerid": ["nunique", "count"], "RoundCount": ["sum"]})
+        for chunk in iter_dataset(path):
+            games.update(chunk)
+        games.result()
+    """
+
+    def __init__(self, key: str, aggregations: Dict[str, List[str]], precision: Optional[int] = None) -> None:
+        """ Initialization
+            :param key: the column to group by
+            :param aggregations: the aggregations ('sum', 'count', 'nunique') of every column, like pandas agg
+            :param precision: the distinct values are counted by a HyperLogLog with 2 ** precision registers, with
+                              a relative error of about 1.04 / sqrt(2 ** precision), instead of exactly
+        """
+        for column, functions in aggregations.items():
+            if not set(functions) <= set(AGGREGATIONS):
+                raise ValueError(f"The aggregations of {column} should be some of {AGGREGATIONS}")
+        if precision is not None and not 4 <= precision <= 16:
+            raise ValueError("The precision should be between 4 and 16")
+
+        self.key: str = key
+        self.aggregations: Dict[str, List[str]] = aggregations
+        self.precision: Optional[int] = precision
+        self.rows: int = 0
+
+        self._totals: List[pd.DataFrame] = []
+        self._distinct: Dict[str, List[pd.DataFrame]] = {c: [] for c, f in aggregations.items() if "nunique" in f}
+        self._compacted: Dict[str, int] = {column: 0 for column in self._distinct}
+        self._compacted_totals: int = 0
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        """ Aggregate a chunk
+            :param chunk: the rows, with the key and the aggregated columns
+        """
+        self.merge(self._partial(chunk))
+
+    def merge(self, other: "GroupAggregator") -> None:
+        """ Merge the partial aggregate of other chunks, with the same aggregations
+            :param other: the other aggregator
+        """
+        if other.key != self.key or other.aggregations != self.aggregations or other.precision != self.precision:
+            raise ValueError("Only aggregators with the same aggregations can be merged")
+
+        self.rows += other.rows
+        # the partials are compacted when they outgrow the compacted state, linear time over all the chunks
+        self._totals.extend(other._totals)
+        pending = sum(p.shape[0] for p in self._totals) - self._compacted_totals
+        if pending > max(self._compacted_totals, COMPACT_ROWS):
+            self._compact_totals()
+
+        for column in self._distinct:
+            self._distinct[column].extend(other._distinct[column])
+            pending = sum(p.shape[0] for p in self._distinct[column]) - self._compacted[column]
+            if pending > max(self._compacted[column], COMPACT_ROWS):
+                self._compact(column)
+
+    def result(self) -> pd.DataFrame:
+        """ The aggregates, with the columns of a pandas agg
+            :return: the aggregates of every group
+        """
+        columns = pd.MultiIndex.from_tuples([(c, f) for c, functions in self.aggregations.items() for f in functions])
+        if not self._totals:
+            return pd.DataFrame(columns=columns)
+
+        self._compact_totals()
+        totals = self._totals[0]
+        result = pd.DataFrame(index=totals.index, columns=columns)
+        hashes = pd.Series(totals.index.astype(str), index=totals.index)
+        hashes = pd.util.hash_array(hashes.to_numpy(dtype=object))
+        for column, functions in self.aggregations.items():
+            for function in functions:
+                if function == "nunique":
+                    self._compact(column)
+                    distinct = self._count_distinct(self._distinct[column][0])
+                    result[(column, function)] = distinct.reindex(hashes).fillna(0).to_numpy(np.int64)
+                else:
+                    result[(column, function)] = totals[f"{column}|{function}"]
+        result.index.name = self.key
+        return result.infer_objects()
+
+    def _partial(self, chunk: pd.DataFrame) -> "GroupAggregator":
+        """ The partial aggregate of a chunk """
+        partial = GroupAggregator(self.key, self.aggregations, self.precision)
+        partial.rows = chunk.shape[0]
+
+        keys = _as_str(chunk[self.key])
+        totals = {}
+        for column, functions in self.aggregations.items():
+            for function in [f for f in functions if f != "nunique"]:
+                values = chunk[column]
+                totals[f"{column}|{function}"] = values.to_numpy() if function == "sum" else values.notna().to_numpy()
+        grouped = pd.DataFrame(totals, index=chunk.index).groupby(keys.array, observed=True).sum()
+        grouped.index = grouped.index.astype(str)
+        partial._totals = [grouped]
+
+        key_hashes = _hash(keys)
+        for column in partial._distinct:
+            values = chunk[column]
+            present = values.notna().to_numpy()
+            distinct = pd.DataFrame({"key": key_hashes[present], "value": _hash(values[present])})
+            if self.precision is None:
+                partial._distinct[column] = [distinct.drop_duplicates()]
+            else:
+                partial._distinct[column] = [self._registers(distinct)]
+        return partial
+
+    def _registers(self, distinct: pd.DataFrame) -> pd.DataFrame:
+        """ The HyperLogLog registers of every group: the register of every value is picked by its first bits,
+            and holds the maximum position of the first set bit of the rest of them """
+        bits = np.uint64(64 - self.precision)
+        values = distinct["value"].to_numpy()
+        rest = values & np.uint64((1 << int(bits)) - 1)
+        registers = pd.DataFrame(
+            {
+                "key": distinct["key"].to_numpy(),
+                "register": (values >> bits).astype(np.uint16),
+                "rank": (int(bits) - _bit_length(rest) + 1).astype(np.uint8),
+            }
+        )
+        return registers.groupby(["key", "register"], sort=False)["rank"].max().reset_index()
+
+    def _compact_totals(self) -> None:
+        """ Merge the partials of the sums and the counts into one """
+        if len(self._totals) > 1:
+            self._totals = [pd.concat(self._totals).groupby(level=0).sum()]
+        self._compacted_totals = self._totals[0].shape[0] if self._totals else 0
+
+    def _compact(self, column: str) -> None:
+        """ Merge the partials of the distinct values of a column into one """
+        partials = pd.concat(self._distinct[column], ignore_index=True)
+        if self.precision is None:
+            partials = partials.drop_duplicates()
+        else:
+            partials = partials.groupby(["key", "register"], sort=False)["rank"].max().reset_index()
+        self._distinct[column] = [partials]
+        self._compacted[column] = partials.shape[0]
+
+    def _count_distinct(self, distinct: pd.DataFrame) -> pd.Series:
+        """ The number of distinct values of every group, by the key hash """
+        if self.precision is None:
+            return distinct.groupby("key").size()
+
+        m = 2 ** self.precision
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        registers = distinct.assign(power=np.exp2(-distinct["rank"].to_numpy(np.float64))).groupby("key")
+        empty = m - registers.size()
+        estimate = alpha * m * m / (registers["power"].sum() + empty)
+
+        # small range correction, by the empty registers
+        small = (estimate <= 2.5 * m) & (empty > 0)
+        estimate[small] = m * np.log(m / empty[small])
+        return estimate.round()
@@ -0,0 +1,89 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class CacheBackend:
+    """
+        Interface of the cache backends. A backend shared between processes (e.g. over the network) has to implement
+        these methods, with string keys and JSON-serializable values.
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        """ Get a value, None if it is missing or expired """
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any) -> None:
+        """ Set a value """
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """ Remove all the values """
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        """ The counters of the cache """
+        raise NotImplementedError
+
+
+class LocalCache(CacheBackend):
+    """
+        In-process cache with least-recently-used eviction and a time-to-live for every entry.
+        Usage:
+            cache = LocalCache(max_size=1000, ttl=60)
+            cache.set("key", value)
+            cache.get("key")
+    """
+
+    def __init__(self, max_size: int = 100000, ttl: float = 300.0) -> None:
+        """ Initialization
+            :param max_size: the maximum number of entries, the least recently used are evicted
+            :param ttl: the seconds an entry stays valid
+        """
+        self.max_size: int = max_size
+        self.ttl: float = ttl
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.expirations: int = 0
+
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
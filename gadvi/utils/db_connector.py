@@ -1,20 +1,77 @@
 import os
+import queue
+import threading
 import pyodbc
+import pandas as pd
+from contextlib import contextmanager
 from dotenv import load_dotenv
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, Iterator, List, Optional
 import copy
 
 
+class ConnectionPool:
+    """
+        A fixed-size pool of connections, shared by the threads of an extraction.
+        The connections are opened on first use.
+    Usage:
+        with pool.connection() as connection:
+            data = pd.read_sql_query(query, connection)
+    """
+
+    def __init__(self, connect: Callable[[], Any], size: int) -> None:
+        """ Initialization
+            :param connect: the function that opens a connection
+            :param size: the maximum number of open connections
+        """
+        self.size: int = size
+        self._connect = connect
+        self._idle: queue.Queue = queue.Queue()
+        self._opened: List[Any] = []
+        self._count: int = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """ Borrow a connection, waiting for one to be returned if all of them are in use """
+        with self._lock:
+            new = self._idle.empty() and self._count < self.size
+            if new:
+                self._count += 1
+
+        if new:
+            connection = self._connect()
+            with self._lock:
+                self._opened.append(connection)
+        else:
+            connection = self._idle.get()
+        try:
+            yield connection
+        finally:
+            self._idle.put(connection)
+
+    def close(self) -> None:
+        """ Close all the connections """
+        with self._lock:
+            for connection in self._opened:
+                connection.close()
+            self._opened = []
+            self._count = 0
+            self._idle = queue.Queue()
+
+
 class DBConnector:
     """
         Class responsible for the connection to the database.
     """
 
-    def __init__(self, path: str) -> None:
+    def __init__(self, path: str, connector: Optional[Callable[[], Any]] = None) -> None:
         """ Initialization
             :param path : the path to the environmental file
+            :param connector: a function that opens a DB-API connection, used instead of the ODBC driver
+                              (e.g. a local sqlite3 database standing in for the server)
         """
         self.env_file: str = path
+        self.connector = connector
         self.server: str = ""
         self.db: str = ""
         self.username: str = ""
@@ -37,12 +94,42 @@ class DBConnector:
     def connect(self) -> pyodbc.Connection:
         """ Connect to the database given the credentials"""
 
+        if self.connector is not None:
+            return self.connector()
+
         dbc = pyodbc.connect(
             "DRIVER={ODBC Driver 17 for SQL Server};"
             "SERVER=" + self.server + ";DATABASE=" + self.db + ";UID=" + self.username + ";PWD=" + self.password
         )
         return dbc
 
+    def create_pool(self, size: int) -> ConnectionPool:
+        """ Create a pool of connections to the database
+            :param size: the maximum number of open connections
+            :return the pool
+        """
+        return ConnectionPool(self.connect, size)
+
+    @staticmethod
+    def iter_query(query: str, connection: Any, chunksize: int) -> Iterator[pd.DataFrame]:
+        """ Execute a query and page through its results, so that they never have to fit in memory at once
+            :param query: the query
+            :param connection: the connection object
+            :param chunksize: the number of rows per page
+            :return an iterator over the pages of the results
+        """
+        cursor = connection.cursor()
+        try:
+            cursor.execute(query)
+            columns = [column[0] for column in cursor.description]
+            while True:
+                rows = cursor.fetchmany(chunksize)
+                if not rows:
+                    break
+                yield pd.DataFrame.from_records([tuple(row) for row in rows], columns=columns)
+        finally:
+            cursor.close()
+
     @staticmethod
     def _get_variable(var: str) -> str:
         """ Get an environmental variable from the file, given its key name
@@ -65,8 +152,8 @@ class DBConnector:
             raise ValueError("The query and the data do not match")
 
         const_query = copy.deepcopy(query)
-        for idx, d in enumerate(data):
-            const_query = const_query.replace("__", str(d), idx + 1)
+        for d in data:
+            const_query = const_query.replace("__", str(d), 1)
 
         # if missing fields still exist in the query raise an error
         if "__" in const_query:
@@ -81,6 +168,9 @@ class DBConnector:
             "get_top_n": """SELECT TOP __ *  FROM __""",
             "get_all": """SELECT *  FROM __""",
             "get_count": """SELECT COUNT ( __ ) FROM __""",
+            "get_min_max": """SELECT MIN ( __ ), MAX ( __ ) FROM __""",
+            "get_min_max_after": """SELECT MIN ( __ ), MAX ( __ ) FROM __ WHERE __ > __""",
+            "get_range": """SELECT * FROM __ WHERE __ >= __ AND __ < __""",
             "join_and_get": """SELECT * 
                     FROM FactTablePlayer 
                     INNER JOIN (
@@ -90,4 +180,14 @@ class DBConnector:
                         ON FactTablePlayer.Game_DWID=game_provider.Game_DWID
                     INNER JOIN dimPlayer ON dimPlayer.Player_DWID=FactTablePlayer.Player_DWID
                     INNER JOIN dimOperator ON dimOperator.Operator_DWID=FactTablePlayer.Operator_DWID""",
+            "join_and_get_range": """SELECT * 
+                    FROM FactTablePlayer 
+                    INNER JOIN (
+                        SELECT dimGameProvider.GameProvider_DWID, dimGameProvider.GameProviderName, dimGameProvider.GameProviderId, dimGameProvider.IsSGDContent, dimGame.GameName, dimGame.Game_DWID, dimGame.GameID
+                        FROM dimGame
+                        INNER JOIN dimGameProvider on dimGame.GameProvider_DWID=dimGameProvider.GameProvider_DWID) AS game_provider
+                        ON FactTablePlayer.Game_DWID=game_provider.Game_DWID
+                    INNER JOIN dimPlayer ON dimPlayer.Player_DWID=FactTablePlayer.Player_DWID
+                    INNER JOIN dimOperator ON dimOperator.Operator_DWID=FactTablePlayer.Operator_DWID
+                    WHERE FactTablePlayer.BeginDate_DWID >= __ AND FactTablePlayer.BeginDate_DWID < __""",
         }
@@ -0,0 +1,125 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+# the id columns that are encoded, the players, the games, the countries, the operators and the providers
+ENCODED_COLUMNS = ["playerid", "GameName", "CountryPlayer", "OperatorName", "GameProviderName"]
+
+
+class IdDictionary:
+    """
+        Persistent, versioned dictionary of the int32 codes of the id columns. The codes are append only: a value
+        keeps its code in every version and the new values get the next codes, so the codes of an older version stay
+        valid in the newer ones, and an older version is the prefix of the values of every column. Every save that
+        has new values is a new version.
+    Usage:
+        ids = IdDictionary.load(path) if IdDictionary.exists(path) else IdDictionary()
+        ids.update(chunk)
+        ids.save(path)
+        players = ids.encode(train["playerid"], "playerid")
+    """
+
+    def __init__(self, columns: Optional[List[str]] = None) -> None:
+        """ Initialization
+            :param columns: the encoded columns, ENCODED_COLUMNS by default
+        """
+        self.columns: List[str] = list(columns or ENCODED_COLUMNS)
+        self.version: int = 0
+
+        # the number of values of every column in every version
+        self.sizes: List[Dict[str, int]] = [{column: 0 for column in self.columns}]
+
+        self._values: Dict[str, pd.Index] = {column: pd.Index([], dtype=object) for column in self.columns}
+
+    def update(self, data: pd.DataFrame) -> int:
+        """ Add the values of the encoded columns of data that are not in the dictionary
+            :param data: the rows, with some of the encoded columns
+            :return: the number of new values
+        """
+        added = 0
+        for column in [c for c in self.columns if c in data.columns]:
+            values = pd.Index(self._categories(data[column]))
+            new = values[self._values[column].get_indexer(values) < 0]
+            if len(new) > 0:
+                self._values[column] = self._values[column].append(pd.Index(new, dtype=object))
+                added += len(new)
+        return added
+
+    def encode(self, values: pd.Series, column: str) -> np.ndarray:
+        """ The codes of the values of a column, looking up every distinct value once
+            :param values: the values
+            :param column: the encoded column
+            :return: the int32 code of every value, -1 for the unknown and the missing values
+        """
+        values = values.astype("category")
+        codes = self._values[column].get_indexer(self._categories(values)).astype(np.int32)
+        # the missing values have the code -1, the last of the categories
+        return np.append(codes, np.int32(-1))[values.cat.codes.to_numpy()]
+
+    def decode(self, codes: np.ndarray, column: str) -> np.ndarray:
+        """ The values of the codes of a column
+            :param codes: the codes
+            :param column: the encoded column
+            :return: the values
+        """
+        return self._values[column].to_numpy()[codes]
+
+    def size(self, column: str) -> int:
+        """ The number of values of a column
+            :param column: the encoded column
+            :return: the number of values
+        """
+        return len(self._values[column])
+
+    def save(self, path: str) -> None:
+        """ Save the dictionary, the values of every column in the order of their codes
+            :param path: the directory of the dictionary
+        """
+        sizes = {column: len(self._values[column]) for column in self.columns}
+        if sizes != self.sizes[-1]:
+            self.version += 1
+            self.sizes.append(sizes)
+
+        os.makedirs(path, exist_ok=True)
+        for column in self.columns:
+            pd.DataFrame({"value": self._values[column].to_numpy(dtype=str)}).to_parquet(f"{path}/{column}.parquet")
+        with open(f"{path}/meta.json", "w") as f:
+            json.dump({"version": self.version, "columns": self.columns, "sizes": self.sizes}, f, indent=4)
+
+    @classmethod
+    def load(cls, path: str, version: Optional[int] = None) -> "IdDictionary":
+        """ Load a dictionary
+            :param path: the directory of the dictionary
+            :param version: the version to load, the latest by default
+            :return: the dictionary
+        """
+        with open(f"{path}/meta.json") as f:
+            meta = json.load(f)
+        version = meta["version"] if version is None else version
+        if not 0 <= version <= meta["version"]:
+            raise ValueError(f"The version should be between 0 and {meta['version']}")
+
+        dictionary = cls(meta["columns"])
+        dictionary.version = version
+        dictionary.sizes = meta["sizes"][: version + 1]
+        for column in dictionary.columns:
+            values = pd.read_parquet(f"{path}/{column}.parquet")["value"].to_numpy(dtype=object)
+            dictionary._values[column] = pd.Index(values[: dictionary.sizes[-1][column]], dtype=object)
+        return dictionary
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        """ Whether a dictionary is stored
+            :param path: the directory of the dictionary
+            :return: True if it exists
+        """
+        return os.path.exists(f"{path}/meta.json")
+
+    @staticmethod
+    def _categories(values: pd.Series) -> np.ndarray:
+        """ The distinct values of a column as strings, without the missing values """
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            return values.cat.categories.astype(str).to_numpy(dtype=object)
+        return pd.unique(values.dropna().astype(str).to_numpy(dtype=object))
@@ -0,0 +1,335 @@
+import os
+import json
+import time
+import bisect
+import logging
+import resource
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from gadvi.utils.utils import Timer
+
+# the upper bounds of the histogram buckets, in seconds, from 10 microseconds to 100 seconds
+LATENCY_BUCKETS = [b * 10.0 ** e for e in range(-5, 2) for b in (1, 2.5, 5)] + [100.0]
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    """ The labels of a sample in the text format """
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)] + ([extra] if extra else [])
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """ A value that only goes up, e.g. the number of requests, per combination of the values of its labels """
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()) -> None:
+        self.name: str = name
+        self.documentation: str = documentation
+        self.labels: Tuple[str, ...] = tuple(labels)
+
+        self._values: Dict[Tuple[str, ...], float] = dict()
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        """ Increase the counter of the label values by amount """
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        """ The counter of the label values """
+        return self._values.get(labels, 0.0)
+
+    def empty(self) -> "Counter":
+        """ A counter with the same name and labels and no values """
+        return Counter(self.name, self.documentation, self.labels)
+
+    def clear(self) -> None:
+        """ Drop the values of all the label values """
+        with self._lock:
+            self._values = dict()
+
+    def snapshot(self) -> Dict:
+        """ The values of the counter, in a form that can be saved as json and merged into another counter """
+        with self._lock:
+            return {"values": [[list(k), v] for k, v in self._values.items()]}
+
+    def merge(self, snapshot: Dict) -> None:
+        """ Add the values of a snapshot to the counter """
+        for labels, value in snapshot["values"]:
+            self.inc(*labels, amount=value)
+
+    def render(self) -> List[str]:
+        """ The lines of the counter in the text format """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.labels, k)} {v}" for k, v in values)
+        return lines
+
+
+class Histogram:
+    """ The distribution of observed values in cumulative buckets, with their sum and count, per label values """
+
+    def __init__(
+        self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        self.name: str = name
+        self.documentation: str = documentation
+        self.labels: Tuple[str, ...] = tuple(labels)
+        self.buckets: List[float] = sorted(buckets)
+
+        # the count of every bucket, not cumulative, the last one is +Inf, and the sum of the values
+        self._counts: Dict[Tuple[str, ...], List[int]] = dict()
+        self._sums: Dict[Tuple[str, ...], float] = dict()
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        """ Add a value to the histogram of the label values """
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(labels)
+            if counts is None:
+                counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+                self._sums[labels] = 0.0
+            counts[i] += 1
+            self._sums[labels] += value
+
+    def count(self, *labels: str) -> int:
+        """ The number of values of the label values """
+        return sum(self._counts.get(labels, []))
+
+    def empty(self) -> "Histogram":
+        """ A histogram with the same name, labels and buckets and no values """
+        return Histogram(self.name, self.documentation, self.labels, self.buckets)
+
+    def clear(self) -> None:
+        """ Drop the values of all the label values """
+        with self._lock:
+            self._counts, self._sums = dict(), dict()
+
+    def snapshot(self) -> Dict:
+        """ The buckets of the histogram, in a form that can be saved as json and merged into another histogram """
+        with self._lock:
+            return {"values": [[list(k), list(c), self._sums[k]] for k, c in self._counts.items()]}
+
+    def merge(self, snapshot: Dict) -> None:
+        """ Add the buckets of a snapshot to the histogram """
+        with self._lock:
+            for labels, counts, total in snapshot["values"]:
+                labels = tuple(labels)
+                current = self._counts.setdefault(labels, [0] * (len(self.buckets) + 1))
+                self._counts[labels] = [a + b for a, b in zip(current, counts)]
+                self._sums[labels] = self._sums.get(labels, 0.0) + total
+
+    def render(self) -> List[str]:
+        """ The lines of the histogram in the text format """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            states = sorted((k, list(c), self._sums[k]) for k, c in self._counts.items())
+        for key, counts, total in states:
+            cumulative = 0
+            for bound, count in zip(self.buckets + [float("inf")], counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{float(bound)!r}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """ A value that is read when the metrics are rendered, e.g. the memory of the process """
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], Optional[float]]) -> None:
+        self.name: str = name
+        self.documentation: str = documentation
+        self.function = function
+
+    def render(self) -> List[str]:
+        """ The lines of the gauge in the text format, none if it has no value """
+        return self.render_processes({None: self.function()})
+
+    def snapshot(self) -> Dict:
+        """ The value of the gauge, in a form that can be saved as json """
+        return {"value": self.function()}
+
+    def render_processes(self, values: Dict[Optional[int], Optional[float]]) -> List[str]:
+        """ The lines of the values of the gauge in several processes, labelled with their pids """
+        values = {pid: value for pid, value in values.items() if value is not None}
+        if not values:
+            return []
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for pid, value in sorted(values.items(), key=lambda item: item[0] or 0):
+            lines.append(f"{self.name}{_labels(('pid',), (str(pid),)) if pid is not None else ''} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+        The metrics of a process, rendered in the Prometheus text format.
+        The processes that share a directory, like the workers of gunicorn, render the metrics of all of them: every
+        process saves a snapshot of its metrics there, the counters and the histograms are summed over the snapshots
+        and the gauges are rendered per process, labelled with its pid.
+    Usage:
+        registry = MetricsRegistry()
+        requests = registry.counter("requests_total", "The requests", ["route"])
+        requests.inc("/predict")
+        registry.share("/tmp/metrics")
+        registry.render()
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, object] = dict()
+        self._lock = threading.Lock()
+        self._directory: Optional[str] = None
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        """ Register a counter, or get it if it is registered """
+        return self._register(name, lambda: Counter(name, documentation, labels))
+
+    def histogram(
+        self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        """ Register a histogram, or get it if it is registered """
+        return self._register(name, lambda: Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name: str, documentation: str, function: Callable[[], Optional[float]]) -> Gauge:
+        """ Register a gauge, a registered one is replaced """
+        with self._lock:
+            self._metrics[name] = Gauge(name, documentation, function)
+            return self._metrics[name]
+
+    def render(self) -> str:
+        """ All the metrics in the text format, the ones of all the processes that share the directory if shared """
+        if self._directory is not None:
+            return "\n".join(self._aggregate()) + "\n"
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+    def share(self, directory: str, interval: float = 1.0) -> None:
+        """
+            Share the metrics of the process with the other processes of the directory: a snapshot of them is saved
+            every interval seconds, and on render. The values that the process has observed so far are dropped, they
+            are the ones of the parent it was forked from, which would be counted once more by every child otherwise.
+            Call it once per process, after the fork.
+            :param directory: the directory of the snapshots, one per process, emptied when the server starts
+            :param interval: the seconds between two snapshots
+            :return:
+        """
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            if not isinstance(metric, Gauge):
+                metric.clear()
+        self._directory = directory
+        self.save()
+
+        def save():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.save()
+                except OSError:
+                    logging.exception(f"Failed to save the metrics in {directory}.")
+
+        threading.Thread(target=save, daemon=True).start()
+
+    def save(self) -> None:
+        """ Save the snapshot of the metrics of the process in the shared directory, replacing its previous one """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        snapshot = {metric.name: metric.snapshot() for metric in metrics}
+        path = f"{self._directory}/{os.getpid()}.json"
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _aggregate(self) -> List[str]:
+        """ The lines of the metrics summed over the snapshots of the processes, the gauges of the live ones """
+        self.save()
+        snapshots: Dict[int, Dict] = dict()
+        for name in os.listdir(self._directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(f"{self._directory}/{name}") as f:
+                    snapshots[int(name[: -len(".json")])] = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            if isinstance(metric, Gauge):
+                # the gauges of the processes that have exited are not current any more
+                values = {pid: s[metric.name]["value"] for pid, s in snapshots.items() if metric.name in s}
+                lines.extend(metric.render_processes({pid: v for pid, v in values.items() if _alive(pid)}))
+                continue
+            # the counts of the processes that have exited are kept, so that the counters never go down
+            total = metric.empty()
+            for snapshot in snapshots.values():
+                if metric.name in snapshot:
+                    total.merge(snapshot[metric.name])
+            lines.extend(total.render())
+        return lines
+
+    def _register(self, name: str, create: Callable[[], object]):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = create()
+            return self._metrics[name]
+
+
+def _alive(pid: int) -> bool:
+    """ Whether a process is running """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# the metrics of the process, shared by the server, the models and the data pipeline
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.histogram("gadvi_stage_seconds", "The seconds of the stages of the pipelines", ["stage"])
+
+
+class StageTimer(Timer):
+    """ A Timer that observes its elapsed seconds in the histogram of a stage
+    Usage:
+        with StageTimer("predict.score"):
+            scores = f(x)
+        with StageTimer("data.load") as t:
+            data = load(path)
+        print(f'Data loaded in {t.elapsed}s!')
+    """
+
+    def __init__(self, stage: str, histogram: Histogram = STAGE_SECONDS) -> None:
+        """ Initialization
+            :param stage: the name of the stage
+            :param histogram: the histogram of the stages, the one of the process registry by default
+        """
+        self.stage: str = stage
+        self.histogram: Histogram = histogram
+
+    def __exit__(self, *args):
+        """ Exit """
+        super().__exit__(*args)
+        self.histogram.observe(self._elapsed, self.stage)
+
+
+def process_memory() -> Dict[str, Optional[float]]:
+    """ The resident memory of the process in bytes, now (Linux only) and at its peak """
+    resident = None
+    try:
+        with open("/proc/self/statm") as f:
+            resident = float(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    # the peak is in kilobytes on Linux
+    return {"resident": resident, "max_resident": float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) * 1024}
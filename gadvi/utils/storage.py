@@ -0,0 +1,271 @@
+import os
+import glob
+import shutil
+import tempfile
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+# the string columns with few distinct values compared to the rows, stored as categoricals
+CATEGORICAL_COLUMNS = ["playerid", "GameName", "CountryPlayer", "OperatorName", "GameProviderName"]
+
+
+def save_dataset(data: pd.DataFrame, path: str, tsv: bool = False) -> None:
+    """ Save a dataset in the columnar format (parquet), with categorical string columns
+        :param data: the dataset
+        :param path: the path of the dataset, without extension
+        :param tsv: export a .tsv as well
+    """
+    clear_partitions(path)
+    data = data.copy(deep=False)
+    for column in CATEGORICAL_COLUMNS:
+        if column in data.columns:
+            # subsets keep only the categories they use
+            data[column] = data[column].astype("category").cat.remove_unused_categories()
+
+    data.to_parquet(f"{path}.parquet", index=False)
+    if tsv:
+        data.to_csv(f"{path}.tsv", sep="\t", index=False)
+
+
+def partition_path(path: str, name: str) -> str:
+    """ The path of a new partition of a dataset, the partitions are appended to the dataset when it is loaded
+        :param path: the path of the dataset, without extension
+        :param name: the name of the partition
+        :return: the path of the partition, without extension
+    """
+    os.makedirs(f"{path}.parts", exist_ok=True)
+    return f"{path}.parts/{name}"
+
+
+def clear_partitions(path: str) -> None:
+    """ Remove the partitions of a dataset, when it is written from scratch
+        :param path: the path of the dataset, without extension
+    """
+    shutil.rmtree(f"{path}.parts", ignore_errors=True)
+
+
+def new_version(path: str) -> str:
+    """ A new, empty directory of a version of an artifact, next to it in <path>.versions/, to be written and then
+        swapped in with publish_version, so that the files of a version are never rewritten once published
+        :param path: the path of the artifact
+        :return: the directory of the new version
+    """
+    versions = f"{path}.versions"
+    os.makedirs(versions, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix=f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}-", dir=versions)
+    os.chmod(directory, 0o755)
+    return directory
+
+
+def publish_version(path: str, version: str, keep: int = 3) -> None:
+    """ Point the path of an artifact at a version, by atomically replacing a symbolic link, so that the readers see
+        either the old or the new version and the processes that have mapped the files of the old one keep reading
+        them. Only the latest versions are kept: a removed file stays readable for the processes that have mapped it.
+        :param path: the path of the artifact
+        :param version: the directory of the version, from new_version
+        :param keep: the number of versions kept
+    """
+    versions = f"{path}.versions"
+    if os.path.isdir(path) and not os.path.islink(path):
+        # an artifact written in place, before the versions, is moved aside so that the link can replace it
+        os.rename(path, f"{versions}/00000000000000000000-{os.getpid()}")
+
+    link = f"{path}.{os.getpid()}.link"
+    os.symlink(os.path.relpath(version, os.path.dirname(os.path.abspath(path))), link)
+    os.replace(link, path)
+
+    current = os.path.realpath(path)
+    names = sorted(os.listdir(versions))
+    for name in names[: max(len(names) - keep, 0)]:
+        if os.path.realpath(f"{versions}/{name}") != current:
+            shutil.rmtree(f"{versions}/{name}", ignore_errors=True)
+
+
+def dataset_exists(path: str) -> bool:
+    """ Whether a dataset is stored
+        :param path: the path of the dataset, without extension
+        :return: True if the parquet or the tsv exists
+    """
+    return os.path.exists(f"{path}.parquet") or os.path.exists(f"{path}.tsv")
+
+
+def remove_dataset(path: str) -> None:
+    """ Remove a dataset together with its partitions
+        :param path: the path of the dataset, without extension
+    """
+    for extension in [".parquet", ".tsv"]:
+        if os.path.exists(f"{path}{extension}"):
+            os.remove(f"{path}{extension}")
+    clear_partitions(path)
+
+
+def _dataset_files(path: str) -> List[str]:
+    """ The files of a dataset: the dataset and then its partitions """
+    if not path.endswith(".parquet") and not path.endswith(".tsv"):
+        path = f"{path}.parquet" if os.path.exists(f"{path}.parquet") else f"{path}.tsv"
+
+    base, extension = os.path.splitext(path)
+    return [path] + sorted(glob.glob(f"{base}.parts/*{extension}"))
+
+
+def _categorize(data: pd.DataFrame) -> pd.DataFrame:
+    """ Cast the categorical columns, the datasets written in chunks, or concatenated from partitions, store plain
+        strings """
+    for column in CATEGORICAL_COLUMNS:
+        if column in data.columns and not isinstance(data[column].dtype, pd.CategoricalDtype):
+            data[column] = data[column].astype("category")
+    return data
+
+
+def load_dataset(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """ Load a dataset together with its partitions, reading only the requested columns
+        :param path: the path of the dataset, a .parquet or a .tsv file, or a path without extension to load the
+                     parquet if it exists and else the tsv
+        :param columns: the columns to read, all by default
+        :return: the dataset
+    """
+    frames = []
+    for part in _dataset_files(path):
+        if part.endswith(".parquet"):
+            frames.append(pd.read_parquet(part, columns=columns))
+        else:
+            frames.append(pd.read_csv(part, sep="\t", usecols=columns))
+    data = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    return _categorize(data)
+
+
+def iter_dataset(path: str, columns: Optional[List[str]] = None, chunksize: int = 100000) -> Iterator[pd.DataFrame]:
+    """ Read a dataset together with its partitions in chunks, so that it never has to be in memory as a whole
+        :param path: the path of the dataset, as in load_dataset
+        :param columns: the columns to read, all by default
+        :param chunksize: the number of rows per chunk
+        :return: an iterator over the chunks
+    """
+    for part in _dataset_files(path):
+        if part.endswith(".parquet"):
+            batches = pq.ParquetFile(part).iter_batches(batch_size=chunksize, columns=columns)
+            chunks = (batch.to_pandas() for batch in batches)
+        else:
+            chunks = pd.read_csv(part, sep="\t", usecols=columns, chunksize=chunksize)
+        for chunk in chunks:
+            yield _categorize(chunk)
+
+
+class DatasetWriter:
+    """ Append chunks of rows to a dataset on disk, so that the dataset never has to be in memory as a whole.
+        The schema of the dataset is the given one, or the one of the first chunks: a column with only missing values
+        has no type yet, so the chunks are held back until every column has one, up to buffer_rows rows, and the
+        columns that still have none are stored as strings. A dataset without rows is written with the given schema,
+        or else removed, so that a previous version of it never stays in place.
+    Usage:
+        with DatasetWriter(path) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+    """
+
+    def __init__(
+        self, path: str, tsv: bool = False, schema: Optional[pa.Schema] = None, buffer_rows: int = 1000000
+    ) -> None:
+        """ Initialization
+            :param path: the path of the dataset, without extension
+            :param tsv: export a .tsv as well
+            :param schema: the schema of the dataset, inferred from the first chunks by default
+            :param buffer_rows: the most rows held back while some columns have no type
+        """
+        self.path: str = path
+        self.tsv: bool = tsv
+        self.buffer_rows: int = buffer_rows
+        self.rows: int = 0
+
+        clear_partitions(path)
+
+        self._writer: Optional[pq.ParquetWriter] = None
+        self._schema: Optional[pa.Schema] = schema
+        # the chunks held back, with their schemas
+        self._pending: List[pd.DataFrame] = []
+        self._schemas: List[pa.Schema] = []
+        # the columns without a type in the first chunks, stored as strings
+        self._strings: List[str] = []
+
+    def write(self, chunk: pd.DataFrame) -> None:
+        """ Append a chunk, it must have the columns of the first one
+            :param chunk: the rows to append
+        """
+        if self._writer is None and self._schema is None:
+            self._pending.append(chunk)
+            self._schemas.append(pa.Schema.from_pandas(chunk, preserve_index=False))
+            schema = self._resolve(self._schemas)
+            untyped = any(pa.types.is_null(field.type) for field in schema)
+            if untyped and sum(pending.shape[0] for pending in self._pending) < self.buffer_rows:
+                self._write_tsv(chunk)
+                return
+            self._open(schema)
+        else:
+            if self._writer is None:
+                self._open(self._schema)
+            self._writer.write_table(self._table(chunk))
+        self._write_tsv(chunk)
+
+    def close(self) -> None:
+        """ Finish the dataset """
+        if self._writer is None and self._pending:
+            self._open(self._resolve(self._schemas))
+        if self._writer is None and self._schema is not None:
+            # no rows, the dataset has the columns of the schema
+            self._open(self._schema)
+            if self.tsv:
+                pd.DataFrame(columns=self._schema.names).to_csv(f"{self.path}.tsv", sep="\t", index=False)
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        elif self.rows == 0:
+            # no rows and no schema, a previous version of the dataset is removed
+            remove_dataset(self.path)
+
+    def _open(self, schema: pa.Schema) -> None:
+        """ Start the parquet file with a schema, the untyped columns as strings, and write the chunks held back """
+        self._strings = [field.name for field in schema if pa.types.is_null(field.type)]
+        for name in self._strings:
+            schema = schema.set(schema.get_field_index(name), pa.field(name, pa.string()))
+        self._schema = schema
+        self._writer = pq.ParquetWriter(f"{self.path}.parquet", schema)
+        for chunk in self._pending:
+            self._writer.write_table(self._table(chunk))
+        self._pending, self._schemas = [], []
+
+    @staticmethod
+    def _resolve(schemas: List[pa.Schema]) -> pa.Schema:
+        """ The schema of the first chunk, with the type of the first chunk that has values for its untyped columns """
+        schema = schemas[0]
+        for other in schemas[1:]:
+            for i, field in enumerate(schema):
+                if pa.types.is_null(field.type) and not pa.types.is_null(other.field(field.name).type):
+                    schema = schema.set(i, other.field(field.name))
+        return schema
+
+    def _table(self, chunk: pd.DataFrame) -> pa.Table:
+        """ The chunk with the schema of the dataset """
+        if self._strings:
+            chunk = chunk.copy(deep=False)
+            for name in self._strings:
+                chunk[name] = chunk[name].astype(str).where(chunk[name].notna(), None)
+        return pa.Table.from_pandas(chunk, schema=self._schema, preserve_index=False)
+
+    def _write_tsv(self, chunk: pd.DataFrame) -> None:
+        """ Append a chunk to the tsv export, and count its rows """
+        if self.tsv:
+            chunk.to_csv(
+                f"{self.path}.tsv", sep="\t", index=False, mode="w" if self.rows == 0 else "a", header=self.rows == 0
+            )
+        self.rows += chunk.shape[0]
+
+    def __enter__(self):
+        """ Enter """
+        return self
+
+    def __exit__(self, *args):
+        """ Exit """
+        self.close()
@@ -1,4 +1,6 @@
 import time
+import numpy as np
+import pandas as pd
 from datetime import timedelta
 
 
@@ -12,11 +14,54 @@ class Timer:
 
     def __enter__(self):
         """ Enter """
-        self._start = time.time()
+        self._start = time.perf_counter()
         return self
 
     def __exit__(self, *args):
         """ Exit """
-        self._end = time.time()
+        self._end = time.perf_counter()
         self._elapsed = self._end - self._start
-        self.elapsed = str(timedelta(seconds=self._elapsed))
+
+    @property
+    def elapsed(self) -> str:
+        """ The elapsed time, formatted when it is read """
+        return str(timedelta(seconds=self._elapsed))
+
+
+def to_dates(values: pd.Series) -> pd.Series:
+    """ The dates of a BeginDate_DWID column, whether it holds datetimes, YYYYMMDD integers or strings, or a mix of
+        them, e.g. the rows of a train split along with new rows in the stored format
+        :param values: the BeginDate_DWID column
+        :return: the dates, as datetime64
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    if pd.api.types.is_integer_dtype(values):
+        # the date parts come from integer arithmetic
+        dwid = values.astype(np.int64)
+        parts = pd.DataFrame({"year": dwid // 10000, "month": dwid // 100 % 100, "day": dwid % 100})
+        return pd.to_datetime(parts).rename(values.name)
+
+    def parse(value) -> pd.Timestamp:
+        if isinstance(value, (int, np.integer, str)) and len(str(value)) == 8:
+            return pd.to_datetime(str(value), format="%Y%m%d")
+        return pd.Timestamp(value)
+
+    # every distinct value is parsed once, the missing values have the code -1, the last of the dates
+    codes, uniques = pd.factorize(values)
+    dates = pd.DatetimeIndex([parse(value) for value in uniques]).to_numpy(dtype="datetime64[ns]")
+    parsed = np.append(dates, np.datetime64("NaT", "ns"))
+    return pd.Series(parsed[codes], index=values.index, name=values.name)
+
+
+def is_first_party(content: pd.Series) -> np.ndarray:
+    """ Flag the 1st party rows of an IsSGDContent column, vectorized over its distinct values
+        :param content: the IsSGDContent column, with values like "1st Party" and "3rd Party"
+        :return: an integer array with 1 for the 1st party rows and 0 for the rest
+    """
+    content = content.astype("category")
+    first = (content.cat.categories.str.lower().str.strip() == "1st party").astype(np.int64)
+    codes = content.cat.codes.values
+
+    # missing values have code -1
+    return np.where(codes >= 0, first[codes], 0)
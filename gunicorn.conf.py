@@ -0,0 +1,36 @@
+# Multi-worker serving entry point: gunicorn -c gunicorn.conf.py server:app
+#
+# The model is loaded from its serving artifact with memory-mapping, so the workers
+# share the same physical pages of the embeddings and the lookup tables and adding
+# workers costs almost no memory. The worker count and the bind address can be set
+# through the environment.
+import os
+import glob
+import tempfile
+import multiprocessing
+
+bind = os.getenv("GADVI_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GADVI_WORKERS", multiprocessing.cpu_count()))
+threads = int(os.getenv("GADVI_THREADS", 1))
+timeout = int(os.getenv("GADVI_TIMEOUT", 30))
+
+# load the app, and therefore map the model, once in the master before forking
+preload_app = True
+
+# every worker saves its metrics in this directory, so that /metrics renders the ones of all of them
+# whichever worker answers the scrape (a temporary directory of this run by default)
+os.environ.setdefault("GADVI_METRICS_DIR", tempfile.mkdtemp(prefix="gadvi-metrics-"))
+
+
+def on_starting(server):
+    # the snapshots of a previous run would be summed with the ones of this run
+    directory = os.environ["GADVI_METRICS_DIR"]
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        os.remove(path)
+
+
+def post_fork(server, worker):
+    # threads do not survive the fork, so every worker starts its own model watcher and metrics snapshots
+    import server as app_module
+
+    app_module.start_background_threads()
@@ -4,8 +4,8 @@ export PYTHONPATH==$PYTHONPATH:/scripts/
 
 resources='scripts/resources/'
 data=$resources"data/"
-train_data=$data"subset_5000users_train.tsv"
-test_data=$data"subset_5000users_test.tsv"
+train_data=$data"subset_5000users_train.parquet"
+test_data=$data"subset_5000users_test.parquet"
 
 models=$resources"models/"
 model=$models"model_light_fm_simple_256_warp.pickle"
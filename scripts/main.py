@@ -1,9 +1,23 @@
+import os
 import argparse
+import json
 import yaml
 import pandas as pd
-from gadvi.utils import Timer
-from gadvi.brain import DataBrain
-from gadvi.recommenders import LightFMBased
+from typing import Optional
+from gadvi import BENCHMARKS_DIR, DATA_DIR
+from gadvi.utils import IdDictionary, Timer, load_dataset
+from gadvi.benchmarks import compare_results, run_benchmarks, save_results
+from gadvi.brain import DICTIONARY, DataBrain
+from gadvi.plots import render_plots
+from gadvi.recommenders import TEST_COLUMNS, TRAIN_COLUMNS, LightFMBased
+from gadvi.sweep import METRICS, run_sweep, search_space
+from gadvi.synthetic import SCALES, sqlite_connector, write_sqlite
+
+
+def load_dictionary() -> Optional[IdDictionary]:
+    """ The id dictionary created with the datasets, if it exists """
+    path = f"{DATA_DIR}/{DICTIONARY}"
+    return IdDictionary.load(path) if IdDictionary.exists(path) else None
 
 
 def parse_arguments():
@@ -14,8 +28,17 @@ def parse_arguments():
     # modes
     subparsers = parser.add_subparsers(description="Model functionalities", dest="mode")
     data_analysis = subparsers.add_parser(name="create-datasets", help="Connect to a database")
+    plots = subparsers.add_parser(name="plots", help="Render the plots from the saved statistics of a dataset")
     train = subparsers.add_parser(name="train", help="Train a model")
+    update = subparsers.add_parser(name="update", help="Warm start a trained model on new data")
+    sweep = subparsers.add_parser(name="sweep", help="Train and evaluate the candidates of a search space")
     predict = subparsers.add_parser(name="predict", help="Inference on a model")
+    predict_batch = subparsers.add_parser(name="predict-batch", help="Inference on a model for many players")
+    materialize = subparsers.add_parser(name="materialize", help="Precompute the top-n index of a model")
+    export = subparsers.add_parser(name="export", help="Export the serving artifact of a model")
+    benchmark_ann = subparsers.add_parser(name="benchmark-ann", help="Recall and latency of the ANN index")
+    synthetic = subparsers.add_parser(name="synthetic-data", help="Generate a synthetic sqlite database")
+    benchmark = subparsers.add_parser(name="benchmark", help="Benchmark the hot paths on synthetic data")
 
     # subparsers
     data_analysis.add_argument("-credentials", type=str, required=True, help="Environmental file with the credentials")
@@ -33,15 +56,117 @@ def parse_arguments():
         required=True,
         help="Determine the dataset type that is going to be used for the analysis ",
     )
+    data_analysis.add_argument("-tsv", action="store_true", help="Export the datasets as tsv files as well")
+    data_analysis.add_argument(
+        "-chunksize", type=int, default=100000, help="Rows fetched from the database, or aggregated, at once"
+    )
+    data_analysis.add_argument(
+        "-connections", type=int, default=4, help="Connections opened to the database in online mode"
+    )
+    data_analysis.add_argument(
+        "-partitions", type=int, default=None, help="Date ranges the fact table is split in (4 per connection)"
+    )
+    data_analysis.add_argument(
+        "-hll_precision",
+        type=int,
+        default=None,
+        help="Count the distinct players and games of the statistics with a HyperLogLog of 2^precision registers",
+    )
+    data_analysis.add_argument(
+        "-incremental", action="store_true", help="Fetch only the facts after the latest date of the stored datasets"
+    )
+
+    data_analysis.add_argument("-skip_plots", action="store_true", help="Save the statistics without rendering plots")
+    data_analysis.add_argument(
+        "-sqlite", type=str, default=None, help="Extract from a sqlite database instead, e.g. of synthetic-data"
+    )
+
+    plots.add_argument(
+        "-dataset",
+        type=str,
+        choices=["full", "sample_small", "sample_big", "sample_tiny"],
+        required=True,
+        help="The dataset whose statistics are plotted",
+    )
+    plots.add_argument("-workers", type=int, default=None, help="Processes rendering the plots, one per plot")
 
     train.add_argument("-config", type=str, required=True, help="Model configuration file")
-    train.add_argument("-train_path", type=str, required=True, help="Path to train data")
-    train.add_argument("-test_path", type=str, required=True, help="Path to test data")
+    train.add_argument("-train_path", type=str, required=True, help="Path to train data (.parquet or .tsv)")
+    train.add_argument("-test_path", type=str, required=True, help="Path to test data (.parquet or .tsv)")
+
+    update.add_argument("-config", type=str, required=True, help="Model configuration file of the trained model")
+    update.add_argument("-new_path", type=str, required=True, help="Path to the new data (.parquet or .tsv)")
+    update.add_argument("-test_path", type=str, required=False, help="Path to test data (.parquet or .tsv)")
+    update.add_argument("-epochs", type=int, required=False, help="Epochs of the update, by default of the config")
+    update.add_argument("-replay", type=float, default=0.0, help="Share of the old data replayed with the new data")
+
+    sweep.add_argument("-config", type=str, required=True, help="Model configuration file, the base of the candidates")
+    sweep.add_argument("-space", type=str, required=True, help="Search space file")
+    sweep.add_argument("-train_path", type=str, required=True, help="Path to train data (.parquet or .tsv)")
+    sweep.add_argument("-test_path", type=str, required=True, help="Path to test data (.parquet or .tsv)")
+    sweep.add_argument("-workers", type=int, required=False, help="Candidates trained at once")
+    sweep.add_argument("-num_threads", type=int, required=False, help="Threads of every fit, by default of the config")
+    sweep.add_argument("-metric", type=str, choices=METRICS, default="precision", help="Metric of the leaderboard")
 
     predict.add_argument("-playerid", type=str, required=True, help="The id of the player to get recommendations for")
     predict.add_argument("-model_path", type=str, required=True, help="Path to the model")
     predict.add_argument("-dataset_path", type=str, required=True, help="Path to LightFM dataset")
     predict.add_argument("-data_path", type=str, required=True, help="Path to actual data")
+    predict.add_argument("-index_path", type=str, required=False, help="Path to the materialized top-n index")
+    predict.add_argument("-country", type=str, required=False, help="Country of an unknown player")
+    predict.add_argument("-operator", type=str, required=False, help="Operator of an unknown player")
+
+    predict_batch.add_argument(
+        "-players", type=str, required=False, help="File with one player id per line, by default all known players"
+    )
+    predict_batch.add_argument("-output", type=str, required=True, help="Output file, .tsv or .parquet")
+    predict_batch.add_argument("-model_path", type=str, required=True, help="Path to the model")
+    predict_batch.add_argument("-dataset_path", type=str, required=True, help="Path to LightFM dataset")
+    predict_batch.add_argument("-data_path", type=str, required=True, help="Path to actual data")
+    predict_batch.add_argument("-index_path", type=str, required=False, help="Path to the materialized top-n index")
+    predict_batch.add_argument("-k", type=int, default=3, help="Number of recommendations per player")
+    predict_batch.add_argument("-chunk_size", type=int, default=4096, help="Number of players scored at once")
+
+    materialize.add_argument("-model_path", type=str, required=True, help="Path to the model")
+    materialize.add_argument("-dataset_path", type=str, required=True, help="Path to LightFM dataset")
+    materialize.add_argument("-data_path", type=str, required=True, help="Path to actual data")
+    materialize.add_argument("-k", type=int, default=3, help="Number of recommendations to keep per player")
+    materialize.add_argument(
+        "-index_path", type=str, required=False, help="Path to the index, by default next to the model"
+    )
+
+    export.add_argument("-model_path", type=str, required=True, help="Path to the model")
+    export.add_argument("-dataset_path", type=str, required=True, help="Path to LightFM dataset")
+    export.add_argument("-data_path", type=str, required=True, help="Path to actual data")
+    export.add_argument("-index_path", type=str, required=False, help="Path to the materialized top-n index")
+    export.add_argument(
+        "-output", type=str, required=False, help="Directory of the serving artifact, by default next to the model"
+    )
+    export.add_argument("-ann", action="store_true", help="Build an approximate nearest neighbour index as well")
+
+    benchmark_ann.add_argument("-model_path", type=str, required=True, help="Path to the model")
+    benchmark_ann.add_argument("-dataset_path", type=str, required=True, help="Path to LightFM dataset")
+    benchmark_ann.add_argument("-data_path", type=str, required=True, help="Path to actual data")
+    benchmark_ann.add_argument("-k", type=int, default=3, help="Number of recommendations per player")
+    benchmark_ann.add_argument("-players", type=int, default=1000, help="Number of players to sample")
+    benchmark_ann.add_argument("-n_lists", type=int, required=False, help="Number of clusters of the index")
+    benchmark_ann.add_argument(
+        "-n_probe", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="Numbers of clusters searched per query"
+    )
+
+    synthetic.add_argument("-path", type=str, required=True, help="Path of the sqlite database")
+    synthetic.add_argument("-scale", type=str, choices=list(SCALES), default="tiny", help="Size of the data")
+    synthetic.add_argument("-seed", type=int, default=10, help="Seed of the data")
+
+    benchmark.add_argument("-scale", type=str, choices=list(SCALES), default="tiny", help="Size of the synthetic data")
+    benchmark.add_argument("-seed", type=int, default=10, help="Seed of the data and of the sampled players")
+    benchmark.add_argument("-dimensions", type=int, default=32, help="Dimensions of the model")
+    benchmark.add_argument("-epochs", type=int, default=5, help="Epochs of the model")
+    benchmark.add_argument("-num_threads", type=int, default=1, help="Threads of the fit")
+    benchmark.add_argument("-players", type=int, default=1000, help="Players whose predictions are timed")
+    benchmark.add_argument("-k", type=int, default=3, help="Number of recommendations per player")
+    benchmark.add_argument("-output", type=str, required=False, help="Path of the json results")
+    benchmark.add_argument("-baseline", type=str, required=False, help="Json results to compare with")
 
     return parser.parse_args()
 
@@ -53,20 +178,135 @@ def main(args: argparse.Namespace):
     """
     if args.mode == "train":
         model_train_evaluate(config_path=args.config, train_path=args.train_path, test_path=args.test_path)
+    elif args.mode == "update":
+        model_update(
+            config_path=args.config,
+            new_path=args.new_path,
+            test_path=args.test_path,
+            epochs=args.epochs,
+            replay=args.replay,
+        )
+    elif args.mode == "sweep":
+        model_sweep(
+            config_path=args.config,
+            space_path=args.space,
+            train_path=args.train_path,
+            test_path=args.test_path,
+            workers=args.workers,
+            num_threads=args.num_threads,
+            metric=args.metric,
+        )
     elif args.mode == "create-datasets":
         online = True if args.online.lower() == "true" else False
-        data_analysis(credentials=args.credentials, online=online, dataset=args.dataset)
+        data_analysis(
+            credentials=args.credentials,
+            online=online,
+            dataset=args.dataset,
+            export_tsv=args.tsv,
+            chunksize=args.chunksize,
+            connections=args.connections,
+            partitions=args.partitions,
+            incremental=args.incremental,
+            precision=args.hll_precision,
+            plots=not args.skip_plots,
+            sqlite=args.sqlite,
+        )
+    elif args.mode == "plots":
+        render_plots(dataset=args.dataset, workers=args.workers)
     elif args.mode == "predict":
         model_predict(
-            playerid=args.playerid, model_path=args.model_path, dataset_path=args.dataset_path, data_path=args.data_path
+            playerid=args.playerid,
+            model_path=args.model_path,
+            dataset_path=args.dataset_path,
+            data_path=args.data_path,
+            index_path=args.index_path,
+            country=args.country,
+            operator=args.operator,
+        )
+    elif args.mode == "predict-batch":
+        model_predict_batch(
+            players_path=args.players,
+            output=args.output,
+            model_path=args.model_path,
+            dataset_path=args.dataset_path,
+            data_path=args.data_path,
+            index_path=args.index_path,
+            k=args.k,
+            chunk_size=args.chunk_size,
+        )
+    elif args.mode == "materialize":
+        model_materialize(
+            model_path=args.model_path,
+            dataset_path=args.dataset_path,
+            data_path=args.data_path,
+            k=args.k,
+            index_path=args.index_path,
+        )
+    elif args.mode == "export":
+        model_export(
+            model_path=args.model_path,
+            dataset_path=args.dataset_path,
+            data_path=args.data_path,
+            index_path=args.index_path,
+            output=args.output,
+            ann=args.ann,
+        )
+    elif args.mode == "synthetic-data":
+        rows = write_sqlite(args.path, scale=args.scale, seed=args.seed)
+        print(f"{rows} rows written in {args.path}.")
+    elif args.mode == "benchmark":
+        benchmark(
+            scale=args.scale,
+            seed=args.seed,
+            dimensions=args.dimensions,
+            epochs=args.epochs,
+            num_threads=args.num_threads,
+            players=args.players,
+            k=args.k,
+            output=args.output,
+            baseline=args.baseline,
+        )
+    elif args.mode == "benchmark-ann":
+        model_benchmark_ann(
+            model_path=args.model_path,
+            dataset_path=args.dataset_path,
+            data_path=args.data_path,
+            k=args.k,
+            players=args.players,
+            n_lists=args.n_lists,
+            n_probes=args.n_probe,
         )
 
 
-def data_analysis(credentials: str, online: bool, dataset: str):
+def data_analysis(
+    credentials: str,
+    online: bool,
+    dataset: str,
+    export_tsv: bool = False,
+    chunksize: int = 100000,
+    connections: int = 4,
+    partitions: Optional[int] = None,
+    incremental: bool = False,
+    precision: Optional[int] = None,
+    plots: bool = True,
+    sqlite: Optional[str] = None,
+):
     """ Start analyzing the data"""
 
     # Initialize the class for the data analysis and start the analysis
-    brain = DataBrain(credentials, online, dataset)
+    brain = DataBrain(
+        credentials,
+        online,
+        dataset,
+        export_tsv=export_tsv,
+        chunksize=chunksize,
+        connections=connections,
+        partitions=partitions,
+        incremental=incremental,
+        precision=precision,
+        plots=plots,
+        connector=sqlite_connector(sqlite) if sqlite is not None else None,
+    )
     analysis_report = brain.start_analysis()
 
     return analysis_report
@@ -81,8 +321,10 @@ def model_train_evaluate(config_path: str, train_path: str, test_path: str):
     :return:
     """
     # load data and config
-    train = pd.read_csv(train_path, sep="\t")
-    test = pd.read_csv(test_path, sep="\t")
+    with Timer() as t:
+        train = load_dataset(train_path, columns=TRAIN_COLUMNS)
+        test = load_dataset(test_path, columns=TEST_COLUMNS)
+    print(f"Data loaded in {t.elapsed}s.")
 
     config = yaml.load(open(config_path).read(), Loader=yaml.SafeLoader)
 
@@ -94,12 +336,16 @@ def model_train_evaluate(config_path: str, train_path: str, test_path: str):
         epochs=config["epochs"],
         user_features=config["user_features"],
         item_featres=config["item_featres"],
+        num_threads=config.get("num_threads", 1),
+        round_weights=config.get("round_weights", False),
+        popularity_half_life=config.get("popularity_half_life", 30.0),
     )
 
     with Timer() as t:
-        precision, recall, auc = model.train(train)
+        precision, recall, auc = model.train(train, dictionary=load_dictionary())
+    epoch = sum(model.epoch_seconds) / max(len(model.epoch_seconds), 1)
     print(
-        f"Model trained in {t.elapsed}s.\n"
+        f"Model trained in {t.elapsed}s, {epoch:.3f}s per epoch.\n"
         f"Train Metrics:\n"
         f"Precision: {precision}\n"
         f"Recall: {recall}\n"
@@ -116,28 +362,344 @@ def model_train_evaluate(config_path: str, train_path: str, test_path: str):
         f"Auc: {auc}"
     )
 
-    # save model
+    # save model, with its top-n index and its serving artifact
+    model_save(model, ann=config.get("ann", False))
+
+
+def model_save(model: LightFMBased, ann: bool = False):
+    """
+        Save a trained model the way it is served: precompute the recommendations of the known players, optionally
+        build the approximate nearest neighbour index, save the model and export its serving artifact
+    :param model: the trained model
+    :param ann: build the approximate nearest neighbour index, it answers the k beyond the top-n index
+    :return:
+    """
+    # every train, update or sweep changes the representations of the games, so every row is materialized again
+    with Timer() as t:
+        model.materialize()
+    print(f"Top-n index materialized in {t.elapsed}s.")
+    if ann:
+        model.build_ann()
+
     model.save()
     print("Model saved.")
+    print(f"Serving artifact exported to {model.export()}.")
 
 
-def model_predict(playerid: str, model_path: str, dataset_path: str, data_path: str):
+def model_update(
+    config_path: str, new_path: str, test_path: Optional[str] = None, epochs: Optional[int] = None, replay: float = 0.0
+):
+    """
+        Update the model trained with a configuration on new data, instead of training it again on all the data
+    :param config_path:
+    :param new_path:
+    :param test_path:
+    :param epochs:
+    :param replay:
+    :return:
+    """
+    config = yaml.load(open(config_path).read(), Loader=yaml.SafeLoader)
+    model = LightFMBased(
+        dataset=config["dataset"],
+        name=config["name"],
+        dimensions=config["dimensions"],
+        loss=config["loss"],
+        epochs=config["epochs"],
+        user_features=config["user_features"],
+        item_featres=config["item_featres"],
+        num_threads=config.get("num_threads", 1),
+        round_weights=config.get("round_weights", False),
+        popularity_half_life=config.get("popularity_half_life", 30.0),
+    )
+    prefix = f"{model.path}/model_{model.name}_{model.d}_{model.loss}"
+    model.load(f"{prefix}.pickle", f"{prefix}_dataset.pickle", f"{prefix}_data.pickle")
+
+    with Timer() as t:
+        new = load_dataset(new_path, columns=TRAIN_COLUMNS)
+    print(f"New data loaded in {t.elapsed}s.")
+
+    with Timer() as t:
+        precision, recall, auc = model.update(new, epochs=epochs, replay=replay)
+    print(
+        f"Model updated in {t.elapsed}s.\n"
+        f"Update Metrics:\n"
+        f"Precision: {precision}\n"
+        f"Recall: {recall}\n"
+        f"Auc: {auc}"
+    )
+
+    if test_path is not None:
+        with Timer() as t:
+            precision, recall, auc = model.evaluate(load_dataset(test_path, columns=TEST_COLUMNS))
+        print(
+            f"Model evaluated in {t.elapsed}s."
+            f"Evaluation Metrics:\n"
+            f"Precision: {precision}\n"
+            f"Recall: {recall}\n"
+            f"Auc: {auc}"
+        )
+
+    model_save(model, ann=config.get("ann", False))
+
+
+def model_sweep(
+    config_path: str,
+    space_path: str,
+    train_path: str,
+    test_path: str,
+    workers: Optional[int] = None,
+    num_threads: Optional[int] = None,
+    metric: str = "precision",
+):
+    """
+        Train and evaluate the candidates of a search space in parallel, write the leaderboard and save the best model
+        with its top-n index and its serving artifact, like train
+    :param config_path: the model configuration, the candidates override some of its parameters
+    :param space_path: the search space, with the search ('grid' or 'random'), the number of candidates and the seed
+                       of a random search, and the values of every searched parameter
+    :param train_path:
+    :param test_path:
+    :param workers: the number of candidates trained at once
+    :param num_threads: the threads of every fit, by default the num_threads of the configuration
+    :param metric: the metric of the leaderboard
+    :return:
+    """
+    with Timer() as t:
+        train = load_dataset(train_path, columns=TRAIN_COLUMNS)
+        test = load_dataset(test_path, columns=TEST_COLUMNS)
+    print(f"Data loaded in {t.elapsed}s.")
+
+    config = yaml.load(open(config_path).read(), Loader=yaml.SafeLoader)
+    space = yaml.load(open(space_path).read(), Loader=yaml.SafeLoader)
+    candidates = search_space(
+        space["space"],
+        search=space.get("search", "grid"),
+        candidates=space.get("candidates", 10),
+        seed=space.get("seed", 10),
+    )
+
+    with Timer() as t:
+        leaderboard, model = run_sweep(
+            config,
+            candidates,
+            train,
+            test,
+            workers=workers,
+            num_threads=num_threads,
+            metric=metric,
+            dictionary=load_dictionary(),
+        )
+    print(f"{len(candidates)} candidates trained in {t.elapsed}s.")
+    print(leaderboard.head(10).to_string())
+
+    leaderboard.to_csv(f"{model.path}/sweep_{model.name}_leaderboard.tsv", sep="\t")
+    # the best model is saved like train saves it, so that it is served the same way
+    model_save(model, ann=config.get("ann", False))
+    print(f"Best model saved: {model.name}_{model.d}_{model.loss}.")
+
+
+def model_predict(
+    playerid: str,
+    model_path: str,
+    dataset_path: str,
+    data_path: str,
+    index_path: str = None,
+    country: str = None,
+    operator: str = None,
+):
     """
 
     :param playerid:
     :param model_path:
     :param dataset_path:
     :param data_path:
+    :param index_path:
+    :param country:
+    :param operator:
     :return:
     """
     model = LightFMBased()
-    model.load(model_path, dataset_path, data_path)
+    model.load(model_path, dataset_path, data_path, index_path=index_path)
     with Timer() as t:
-        predictions = model.predict(playerid)
-    print(f"Inference completed in {t.elapsed}s.")
+        predictions = model.predict(playerid, country=country, operator=operator)
+    print(f"Inference completed in {t.elapsed}s ({model.source(playerid)}).")
     print(predictions)
 
 
+def model_predict_batch(
+    players_path: str,
+    output: str,
+    model_path: str,
+    dataset_path: str,
+    data_path: str,
+    index_path: str = None,
+    k: int = 3,
+    chunk_size: int = 4096,
+):
+    """
+        Get recommendations for many players and stream them to a .tsv or a .parquet file, with one row per player
+        and recommendation.
+    :param players_path:
+    :param output:
+    :param model_path:
+    :param dataset_path:
+    :param data_path:
+    :param index_path:
+    :param k:
+    :param chunk_size:
+    :return:
+    """
+    model = LightFMBased()
+    model.load(model_path, dataset_path, data_path, index_path=index_path)
+
+    if players_path is None:
+        players = model.user_names.tolist()
+    else:
+        with open(players_path) as fle:
+            players = [line.strip() for line in fle if line.strip()]
+
+    parquet = output.endswith(".parquet")
+    if parquet:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+    else:
+        writer = open(output, "w")
+        writer.write("playerid\trank\tGameName\n")
+
+    with Timer() as t:
+        for chunk in model.iter_predict_batch(players, k=k, chunk_size=chunk_size):
+            rows = pd.DataFrame(
+                [(player, rank + 1, game) for player, games in chunk.items() for rank, game in enumerate(games)],
+                columns=["playerid", "rank", "GameName"],
+            )
+            if parquet:
+                table = pa.Table.from_pandas(rows, preserve_index=False)
+                writer = pq.ParquetWriter(output, table.schema) if writer is None else writer
+                writer.write_table(table)
+            else:
+                rows.to_csv(writer, sep="\t", index=False, header=False)
+    if parquet and writer is None:
+        pq.write_table(pa.Table.from_pandas(pd.DataFrame(columns=["playerid", "rank", "GameName"])), output)
+    elif writer is not None:
+        writer.close()
+    print(f"Inference for {len(players)} players completed in {t.elapsed}s.")
+
+
+def model_materialize(model_path: str, dataset_path: str, data_path: str, k: int, index_path: str = None):
+    """
+        Build the top-n index of a saved model
+    :param model_path:
+    :param dataset_path:
+    :param data_path:
+    :param k:
+    :param index_path:
+    :return:
+    """
+    if index_path is None:
+        index_path = f"{os.path.splitext(model_path)[0]}_topn.npz"
+
+    model = LightFMBased()
+    model.load(model_path, dataset_path, data_path)
+    with Timer() as t:
+        model.materialize(k=k)
+    print(f"Top-n index materialized in {t.elapsed}s.")
+    model.save_index(index_path)
+    print(f"Index saved to {index_path}.")
+
+
+def model_export(
+    model_path: str, dataset_path: str, data_path: str, index_path: str = None, output: str = None, ann: bool = False
+):
+    """
+        Export the serving artifact of a saved model
+    :param model_path:
+    :param dataset_path:
+    :param data_path:
+    :param index_path:
+    :param output:
+    :param ann:
+    :return:
+    """
+    if output is None:
+        output = f"{os.path.splitext(model_path)[0]}_serving"
+
+    model = LightFMBased()
+    model.load(model_path, dataset_path, data_path, index_path=index_path)
+    if ann:
+        model.build_ann()
+    print(f"Serving artifact exported to {model.export(output)}.")
+
+
+def model_benchmark_ann(
+    model_path: str, dataset_path: str, data_path: str, k: int, players: int, n_lists: int, n_probes: list
+):
+    """
+        Report the recall and the latency of the approximate search against the exact one
+    :param model_path:
+    :param dataset_path:
+    :param data_path:
+    :param k:
+    :param players:
+    :param n_lists:
+    :param n_probes:
+    :return:
+    """
+    model = LightFMBased()
+    model.load(model_path, dataset_path, data_path)
+    model.build_ann(n_lists=n_lists)
+
+    print(f"n_probe\trecall@{k}\texact_ms\tann_ms")
+    for n_probe in n_probes:
+        model.ann.n_probe = n_probe
+        recall, exact_ms, ann_ms = model.evaluate_ann(n_players=players, k=k)
+        print(f"{n_probe}\t{recall:.4f}\t{exact_ms:.3f}\t{ann_ms:.3f}")
+
+
+def benchmark(
+    scale: str,
+    seed: int,
+    dimensions: int,
+    epochs: int,
+    num_threads: int,
+    players: int,
+    k: int,
+    output: Optional[str] = None,
+    baseline: Optional[str] = None,
+):
+    """
+        Benchmark the data, training and serving hot paths on synthetic data and save the results as json
+    :param scale:
+    :param seed:
+    :param dimensions:
+    :param epochs:
+    :param num_threads:
+    :param players:
+    :param k:
+    :param output:
+    :param baseline:
+    :return:
+    """
+    report = run_benchmarks(
+        scale=scale,
+        seed=seed,
+        dimensions=dimensions,
+        epochs=epochs,
+        num_threads=num_threads,
+        players=players,
+        k=k,
+    )
+    output = output or f"{BENCHMARKS_DIR}/{scale}_{report['environment']['created_at']}.json"
+    save_results(report, output)
+    print(pd.DataFrame(report["results"]).to_string(index=False))
+    print(f"Results saved in {output}.")
+
+    if baseline is not None:
+        with open(baseline) as fle:
+            print(compare_results(report, json.load(fle)).to_string())
+
+
 if __name__ == "__main__":
     arguments = parse_arguments()
     main(args=arguments)
@@ -1,45 +1,142 @@
-from flask import Flask, request, jsonify
+import os
+import time
+import logging
+from flask import Flask, Response, g, request, jsonify
 # export FLASK_APP=server.py
 
-from gadvi.recommenders import LightFMBased
+from gadvi.serving import ModelHolder, PredictionCache, ServerMetrics, authorized, parse_k
+from gadvi.utils import REGISTRY, LocalCache, StageTimer
 
 # initialize flask application
 app = Flask(__name__, template_folder='app/templates', static_folder='app/static')
 model_path = 'scripts/resources/models//model_light_fm_simple_256_warp.pickle'
-dataset_path = 'scripts/resources/models/model_light_fm_simple_256_warp_dataset.pickle'
-data_path = 'scripts/resources/models//model_light_fm_simple_256_warp_data.pickle'
+serving_path = os.getenv('GADVI_SERVING_PATH', 'scripts/resources/models/model_light_fm_simple_256_warp_serving')
+watch_interval = float(os.getenv('GADVI_WATCH_INTERVAL', 0))
+admin_token = os.getenv('GADVI_ADMIN_TOKEN')
+cache_size = int(os.getenv('GADVI_CACHE_SIZE', 100000))
+cache_ttl = float(os.getenv('GADVI_CACHE_TTL', 300))
+metrics_dir = os.getenv('GADVI_METRICS_DIR')
 
-model = LightFMBased()
-model.load(model_path, dataset_path, data_path)
+# prefer the lean serving artifact, it holds only what predict needs and it is memory-mapped,
+# so all the worker processes share one copy of it (see gunicorn.conf.py).
+# The model pickles are expected next to each other: <model>.pickle, <model>_dataset.pickle, <model>_data.pickle
+holder = ModelHolder(serving_path if os.path.exists(serving_path) else model_path)
 
+# recommendations of the recently active players, cleared when the model is reloaded
+cache = PredictionCache(holder, LocalCache(max_size=cache_size, ttl=cache_ttl)) if cache_size > 0 else None
 
-# Predict route takes one argument: player id
+# requests, latencies and the stages of predict, exposed on /metrics
+metrics = ServerMetrics(holder)
+
+
+def start_background_threads():
+    """
+        Reload the model whenever it changes on disk, if GADVI_WATCH_INTERVAL is set, and share the metrics with the
+        other worker processes, if GADVI_METRICS_DIR is set. Call it once per process, after the fork.
+    """
+    if watch_interval > 0:
+        holder.watch(watch_interval)
+    if metrics_dir:
+        REGISTRY.share(metrics_dir)
+
+
+@app.before_request
+def start_timer():
+    g.start = time.perf_counter()
+
+
+@app.after_request
+def observe_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.observe(route, response.status_code, time.perf_counter() - g.get('start', time.perf_counter()))
+    return response
+
+
+# Predict route takes one argument: player id, and optionally the country and the operator of the player, that
+# the unknown players are recommended the popular games of. The source tells whether the model or the popularity
+# fallback answered
 @app.route('/predict')
 def predict():
     player = request.args.get('playerid')
     if player is None:
-        return jsonify(data=None, message="Required parameter is missing", statusCode=400, isError=True)
+        return jsonify(data=None, message="Required parameter is missing", statusCode=400, isError=True), 400
     else:
-        predictions = model.predict(player)  # "Player_13893025"
+        # "Player_13893025"
+        country, operator = request.args.get('country'), request.args.get('operator')
+        model = holder.model
+        if cache is not None:
+            predictions = cache.predict(player, country=country, operator=operator)
+        else:
+            predictions = model.predict(player, country=country, operator=operator)
 
-        return jsonify(data=predictions, message="Success", statusCode=200, isError=False)
+        with StageTimer('server.encode'):
+            return jsonify(data=predictions, source=model.source(player), message="Success", statusCode=200,
+                           isError=False)
+
+
+# Batch predict route takes a json body: {"playerids": [...], "k": 3}, the unknown players get the popular games.
+# k is optional, from 1 to MAX_K
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('playerids'), list):
+        return jsonify(data=None, message="Required parameter is missing", statusCode=400, isError=True), 400
+    try:
+        k = parse_k(body.get('k'))
+    except ValueError as e:
+        return jsonify(data=None, message=str(e), statusCode=400, isError=True), 400
+    else:
+        model = holder.model
+        predictions = model.predict_batch([str(p) for p in body['playerids']], k=k)
+
+        with StageTimer('server.encode'):
+            return jsonify(data=predictions, sources={p: model.source(p) for p in predictions}, message="Success",
+                           statusCode=200, isError=False)
+
+
+# Reload route reloads the configured model in the background. It requires the X-Admin-Token header and is disabled
+# unless GADVI_ADMIN_TOKEN is set. It only reaches the worker process that handles it, GADVI_WATCH_INTERVAL reloads
+# every worker
+@app.route('/reload', methods=['POST'])
+def reload():
+    if not authorized(admin_token, request.headers.get('X-Admin-Token')):
+        return jsonify(data=None, message="Forbidden", statusCode=403, isError=True), 403
+    if not holder.reload():
+        return jsonify(data=None, message="A reload is already in progress", statusCode=409, isError=True), 409
+
+    return jsonify(data={'path': holder.path, 'pid': os.getpid()}, message="Reload started", statusCode=202,
+                   isError=False), 202
 
 
 @app.route('/')
 def info():
-    info = model.get_info()
+    info = holder.model.get_info()
+    info['path'] = holder.path
+    if holder.last_error:
+        info['last_reload_error'] = holder.last_error
+    if cache is not None:
+        info['cache'] = cache.backend.stats()
     return jsonify(data=info, message="Success", statusCode=200, isError=False)
 
 
+# Prometheus metrics of all the worker processes if GADVI_METRICS_DIR is set, else of this one
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.errorhandler(500)
 def internal_server_error(e):
-    return jsonify(message=str(e), statusCode=500, isError=True)
+    logging.error(f"{request.method} {request.path} failed: {getattr(e, 'original_exception', e)!r}")
+    return jsonify(message=str(e), statusCode=500, isError=True), 500
 
 
 @app.errorhandler(404)
 def not_found_error(e):
-    return jsonify(message=str(e), statusCode=404, isError=True)
+    return jsonify(message=str(e), statusCode=404, isError=True), 404
 
 
+# Development server only, serve with: gunicorn -c gunicorn.conf.py server:app
 if __name__ == '__main__':
-     app.run(debug=True, port=5000)
+    start_background_threads()
+    app.run(debug=True, port=5000)
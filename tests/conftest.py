@@ -0,0 +1,70 @@
+import os
+import sys
+import importlib
+import pytest
+import pandas as pd
+
+from gadvi import synthetic
+from gadvi.brain import COLUMNS
+from gadvi.recommenders import LightFMBased
+from gadvi.utils import CATEGORICAL_COLUMNS
+
+# a synthetic database small enough for the tests
+SCALE = {"players": 300, "games": 60, "rows": 6000}
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """ A temporary working directory, the data and the results directories relative to it are inside it too """
+    (tmp_path / "scripts").mkdir()
+    monkeypatch.chdir(tmp_path / "scripts")
+    return tmp_path
+
+
+@pytest.fixture
+def database(workspace, monkeypatch):
+    """ The path of a synthetic sqlite database, the stand-in of the SQL Server """
+    monkeypatch.setitem(synthetic.SCALES, "test", SCALE)
+    path = str(workspace / "synthetic.sqlite")
+    synthetic.write_sqlite(path, "test", chunksize=2000)
+    return path
+
+
+@pytest.fixture
+def rows(monkeypatch):
+    """ The rows of the synthetic facts with the columns of the stored datasets """
+    monkeypatch.setitem(synthetic.SCALES, "test", SCALE)
+    tables = synthetic.dimension_tables("test")
+    facts = pd.concat(synthetic.iter_facts(tables, "test"), ignore_index=True)
+    games = tables["dimGame"].merge(tables["dimGameProvider"], on="GameProvider_DWID")
+    data = (
+        facts.merge(tables["dimPlayer"], on="Player_DWID")
+        .merge(games, on="Game_DWID")
+        .merge(tables["dimOperator"], on="Operator_DWID")
+        .sort_values(["BeginDate_DWID", "Player_DWID", "Game_DWID"], kind="stable", ignore_index=True)
+    )
+    data["BeginDate_DWID"] = pd.to_datetime(data["BeginDate_DWID"].astype(str), format="%Y%m%d")
+    data = data[COLUMNS].copy()
+    for column in CATEGORICAL_COLUMNS:
+        data[column] = data[column].astype("category")
+    return data
+
+
+@pytest.fixture
+def model(workspace, rows):
+    """ A small model trained on the synthetic rows """
+    recommender = LightFMBased(dataset="test", dimensions=8, epochs=2)
+    recommender.train(rows)
+    return recommender
+
+
+@pytest.fixture
+def server(model, monkeypatch):
+    """ The Flask server module, serving the exported small model """
+    monkeypatch.setenv("GADVI_SERVING_PATH", os.path.abspath(model.export()))
+    monkeypatch.setenv("GADVI_CACHE_SIZE", "100")
+    for name in ["server", "asgi"]:
+        sys.modules.pop(name, None)
+    yield importlib.import_module("server")
+    for name in ["server", "asgi"]:
+        sys.modules.pop(name, None)
@@ -0,0 +1,27 @@
+import pandas as pd
+
+from gadvi.utils import aggregation
+from gadvi.utils.aggregation import GroupAggregator
+
+AGGREGATIONS = {"playerid": ["nunique", "count"], "RoundCount": ["sum"], "CountryPlayer": ["nunique"]}
+
+
+def test_chunked_aggregates_are_the_ones_of_a_groupby(rows, monkeypatch):
+    # a small threshold, so that the partials are compacted several times over the chunks
+    monkeypatch.setattr(aggregation, "COMPACT_ROWS", 100)
+    compactions = []
+    compact = GroupAggregator._compact_totals
+    monkeypatch.setattr(GroupAggregator, "_compact_totals", lambda self: compactions.append(1) or compact(self))
+
+    games = GroupAggregator("GameName", AGGREGATIONS)
+    chunks = [rows.iloc[start : start + 250] for start in range(0, rows.shape[0], 250)]
+    for chunk in chunks:
+        games.update(chunk)
+    result = games.result()
+
+    expected = rows.astype({"GameName": str}).groupby("GameName").agg(AGGREGATIONS)
+    result = result.reindex(expected.index)
+    assert games.rows == rows.shape[0]
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, check_names=False)
+    # the totals are not grouped again for every chunk
+    assert 1 < len(compactions) < len(chunks)
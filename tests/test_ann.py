@@ -0,0 +1,54 @@
+import numpy as np
+
+from gadvi.ann import IVFIndex
+from gadvi.recommenders import LightFMBased
+
+
+def _exact(vectors, ids, query, k, exclude):
+    scores = vectors @ query
+    scores[np.isin(ids, exclude)] = -np.inf
+    return ids[np.argsort(-scores, kind="stable")[:k]]
+
+
+def test_index_search_is_exact_when_every_cluster_is_probed():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, 9)).astype(np.float32)
+    ids = rng.permutation(1000)[:500].astype(np.int32)
+    index = IVFIndex(n_lists=20, n_probe=20).build(vectors, ids)
+    restored = IVFIndex.from_arrays(index.to_arrays())
+
+    for query in rng.normal(size=(10, 9)).astype(np.float32):
+        exclude = ids[rng.choice(500, 30, replace=False)]
+        expected = _exact(vectors, ids, query, 5, exclude)
+        np.testing.assert_array_equal(index.search(query, 5, exclude=exclude), expected)
+        np.testing.assert_array_equal(restored.search(query, 5, exclude=exclude), expected)
+
+
+def test_index_probes_more_clusters_until_enough_candidates_survive_the_exclusions():
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(200, 4)).astype(np.float32)
+    ids = np.arange(200, dtype=np.int32)
+    index = IVFIndex(n_lists=10, n_probe=1, overfetch=2).build(vectors, ids)
+
+    # the best cluster of the query is excluded as a whole
+    query = index.centroids[0]
+    exclude = ids[index.clusters == np.argmax(index.centroids @ query)]
+    top = index.search(query, 5, exclude=exclude)
+    assert (top >= 0).all() and not np.isin(top, exclude).any()
+
+
+def test_approximate_recommendations_have_the_recall_of_the_exact_ones(model):
+    # probing every cluster, the approximate search is the exact one, but for the order of float ties
+    model.build_ann(n_lists=6, n_probe=6)
+    recall, exact_ms, ann_ms = model.evaluate_ann(n_players=100, k=5)
+    assert recall >= 0.99 and exact_ms > 0 and ann_ms > 0
+
+    model.build_ann(n_lists=6, n_probe=1)
+    assert 0 < model.evaluate_ann(n_players=100, k=5)[0] <= 1.0
+
+    # the index is exported with the model, and answers the same
+    players = [str(p) for p in model.user_names[:10]]
+    served = LightFMBased(dataset="test")
+    served.load_serving(model.export())
+    assert served.ann is not None
+    assert served.predict_batch(players, k=5) == model.predict_batch(players, k=5)
@@ -0,0 +1,67 @@
+import json
+import asyncio
+import importlib
+
+import pytest
+
+
+@pytest.fixture
+def asgi(server):
+    """ The ASGI server module, serving the same model as the Flask one """
+    return importlib.import_module("asgi")
+
+
+def _call(asgi, method, path, headers=(), body=b""):
+    """ Send a request to the ASGI app, the status and the json of its response """
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": b"",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers],
+    }
+    asyncio.run(asgi.app(scope, receive, send))
+    return messages[0]["status"], json.loads(messages[1]["body"])
+
+
+def test_reload_needs_the_admin_token(asgi, monkeypatch):
+    calls = []
+    monkeypatch.setattr(asgi.holder, "reload", lambda *args, **kwargs: calls.append(args) or True)
+
+    monkeypatch.setattr(asgi, "admin_token", None)
+    assert _call(asgi, "POST", "/reload")[0] == 403
+    assert _call(asgi, "POST", "/reload", headers=[("X-Admin-Token", "")])[0] == 403
+
+    monkeypatch.setattr(asgi, "admin_token", "secret")
+    assert _call(asgi, "POST", "/reload", headers=[("X-Admin-Token", "wrong")])[0] == 403
+    status, response = _call(asgi, "POST", "/reload", headers=[("X-Admin-Token", "secret")], body=b'{"path": "/x"}')
+    assert status == 202
+    assert response["data"]["path"] == asgi.holder.path
+    assert calls == [()]
+
+
+def test_info_reports_the_last_reload_error(asgi, monkeypatch):
+    monkeypatch.setattr(asgi.holder, "last_error", "broken model")
+    status, response = _call(asgi, "GET", "/")
+    assert status == 200
+    assert response["data"]["last_reload_error"] == "broken model"
+
+
+def test_batch_predict_validates_k(asgi):
+    player = str(asgi.holder.model.user_names[0])
+    for k in ["abc", 0, -1, 1.5, True, 1000]:
+        body = json.dumps({"playerids": [player], "k": k}).encode()
+        status, response = _call(asgi, "POST", "/predict/batch", body=body)
+        assert status == 400, k
+        assert "k must be" in response["message"]
+    status, response = _call(asgi, "POST", "/predict/batch", body=json.dumps({"playerids": [player], "k": 2}).encode())
+    assert status == 200
+    assert len(response["data"][player]) == 2
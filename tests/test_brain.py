@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import pytest
+import numpy as np
+import pandas as pd
+
+from gadvi import DATA_DIR
+from gadvi.brain import BUCKETS, DATASETS, SUBSETS, WATERMARKS, DataBrain
+from gadvi.synthetic import sqlite_connector
+from gadvi.utils import DBConnector, load_dataset
+
+
+def _brain(database: str, incremental: bool = False, chunksize: int = 1000) -> DataBrain:
+    return DataBrain(
+        os.devnull,
+        True,
+        "full",
+        chunksize=chunksize,
+        connector=sqlite_connector(database),
+        connections=2,
+        incremental=incremental,
+        plots=False,
+    )
+
+
+def _watermarks() -> dict:
+    with open(f"{DATA_DIR}/{WATERMARKS}") as f:
+        return json.load(f)
+
+
+def test_incremental_refresh_without_new_facts_keeps_the_partitions(database):
+    _brain(database).start_analysis()
+    rows = load_dataset(f"{DATA_DIR}/full_simplified").shape[0]
+
+    # a day of new facts after the watermark
+    connection = sqlite3.connect(database)
+    delta = pd.read_sql_query("SELECT * FROM FactTablePlayer LIMIT 500", connection)
+    delta["BeginDate_DWID"] = 20210105
+    delta.to_sql("FactTablePlayer", connection, index=False, if_exists="append")
+    connection.commit()
+    connection.close()
+
+    _brain(database, incremental=True).start_analysis()
+    parts = sorted(os.listdir(f"{DATA_DIR}/full_simplified.parts"))
+    watermarks = _watermarks()
+    assert load_dataset(f"{DATA_DIR}/full_simplified").shape[0] == rows + 500
+    assert load_dataset(f"{DATA_DIR}/full").shape[0] == rows + 500
+    assert watermarks["full_simplified"] == 20210105
+
+    # nothing after the watermark: the datasets, their partitions and the watermarks are kept
+    _brain(database, incremental=True).start_analysis()
+    assert load_dataset(f"{DATA_DIR}/full_simplified").shape[0] == rows + 500
+    assert load_dataset(f"{DATA_DIR}/full").shape[0] == rows + 500
+    assert sorted(os.listdir(f"{DATA_DIR}/full_simplified.parts")) == parts
+    assert _watermarks() == watermarks
+
+
+def test_extraction_streams_the_join_in_chunks(database, monkeypatch):
+    pages, queries = [], []
+    iter_query = DBConnector.iter_query
+
+    def spy_iter_query(query, connection, chunksize):
+        for chunk in iter_query(query, connection, chunksize):
+            pages.append(len(chunk))
+            yield chunk
+
+    def spy_get_table(dbc, connection, t_query, params):
+        queries.append((t_query, params))
+        return get_table(dbc, connection, t_query, params)
+
+    get_table = DataBrain._get_table
+    monkeypatch.setattr(DBConnector, "iter_query", staticmethod(spy_iter_query))
+    monkeypatch.setattr(DataBrain, "_get_table", staticmethod(spy_get_table))
+    brain = _brain(database, chunksize=500)
+    report = brain.start_analysis()
+
+    # the join is paged, and the fact table is never fetched on its own
+    assert len(pages) > 1 and max(pages) <= 500
+    assert "FactTablePlayer" not in report["data"]
+    assert sorted(params[0] for t_query, params in queries if t_query == "get_all") == sorted(brain.tables)
+    assert {t_query for t_query, _ in queries} == {"get_all"}
+
+    # the streamed dataset is the join fetched at once
+    dbc = DBConnector(os.devnull, connector=sqlite_connector(database))
+    connection = dbc.connect()
+    expected = pd.read_sql_query(dbc.query_templates["join_and_get"], connection)
+    connection.close()
+    expected.columns = DataBrain._deduplicate_columns(expected.columns.tolist())
+    stored = load_dataset(f"{DATA_DIR}/full")
+    assert sum(pages) == stored.shape[0] == expected.shape[0]
+
+    columns = sorted(expected.columns)
+    stored = stored[columns].astype(str).sort_values(columns).reset_index(drop=True)
+    expected = expected[columns].astype(str).sort_values(columns).reset_index(drop=True)
+    pd.testing.assert_frame_equal(stored, expected)
+
+
+def test_full_extraction_without_facts_removes_the_previous_dataset(database):
+    _brain(database).start_analysis()
+
+    connection = sqlite3.connect(database)
+    connection.execute("DELETE FROM FactTablePlayer")
+    connection.commit()
+    connection.close()
+
+    with pytest.raises(ValueError):
+        _brain(database).start_analysis()
+    assert not os.path.exists(f"{DATA_DIR}/full.parquet")
+    assert not os.path.exists(f"{DATA_DIR}/full_simplified.parquet")
+
+
+def test_extraction_pulls_the_date_ranges_in_parallel_over_the_pool(database, monkeypatch):
+    opened, ranges, active, most = [], [], [0], [0]
+    lock = threading.Lock()
+    connect, date_ranges, iter_query = sqlite_connector(database), DataBrain._date_ranges, DBConnector.iter_query
+
+    def spy_date_ranges(dbc, pool, partitions, after=None):
+        ranges.extend(date_ranges(dbc, pool, partitions, after))
+        return list(ranges)
+
+    def spy_iter_query(query, connection, chunksize):
+        with lock:
+            active[0] += 1
+            most[0] = max(most[0], active[0])
+        # the first page waits for the other worker
+        time.sleep(0.1)
+        try:
+            yield from iter_query(query, connection, chunksize)
+        finally:
+            with lock:
+                active[0] -= 1
+
+    monkeypatch.setattr(DataBrain, "_date_ranges", staticmethod(spy_date_ranges))
+    monkeypatch.setattr(DBConnector, "iter_query", staticmethod(spy_iter_query))
+    brain = DataBrain(
+        os.devnull,
+        True,
+        "full",
+        chunksize=1000,
+        connector=lambda: opened.append(1) or connect(),
+        connections=2,
+        partitions=4,
+        plots=False,
+    )
+    brain.start_analysis()
+
+    # contiguous ranges of the dates, pulled by two workers at once over at most two connections
+    assert len(ranges) == 4
+    assert all(hi == lo for (_, hi), (lo, _) in zip(ranges[:-1], ranges[1:]))
+    assert most[0] == 2 and len(opened) <= 2
+
+    # every fact is fetched once
+    connection = sqlite3.connect(database)
+    dates = pd.read_sql_query("SELECT BeginDate_DWID FROM FactTablePlayer", connection)["BeginDate_DWID"]
+    connection.close()
+    assert ranges[0][0] == dates.min() and ranges[-1][1] > dates.max()
+    stored = load_dataset(f"{DATA_DIR}/full_simplified", columns=["BeginDate_DWID"])["BeginDate_DWID"]
+    assert sorted(stored.astype(int)) == sorted(dates)
+
+
+def test_subsets_are_nested_and_materialized_when_requested(database, monkeypatch):
+    monkeypatch.setitem(SUBSETS, "sample_big", 200)
+    monkeypatch.setitem(SUBSETS, "sample_small", 100)
+    monkeypatch.setitem(SUBSETS, "sample_tiny", 20)
+    _brain(database).start_analysis()
+    full = load_dataset(f"{DATA_DIR}/full_simplified")
+    assert not any(os.path.exists(f"{DATA_DIR}/{DATASETS[name]}.parquet") for name in SUBSETS)
+
+    players = dict()
+    for name in ["sample_small", "sample_tiny", "sample_big"]:
+        DataBrain(os.devnull, False, name, plots=False).start_analysis()
+        # only the requested subset is materialized
+        assert [n for n in SUBSETS if os.path.exists(f"{DATA_DIR}/{DATASETS[n]}.parquet")] == [
+            n for n in SUBSETS if n in players or n == name
+        ]
+        subset = load_dataset(f"{DATA_DIR}/{DATASETS[name]}")
+        players[name] = set(subset["playerid"].astype(str))
+        assert len(players[name]) == SUBSETS[name]
+        # with every row of its players
+        assert subset.shape[0] == full["playerid"].astype(str).isin(players[name]).sum()
+
+    assert players["sample_tiny"] < players["sample_small"] < players["sample_big"]
+
+    # the permutation is seeded, drawing the buckets again gives the same subsets
+    buckets = load_dataset(f"{DATA_DIR}/{BUCKETS}")
+    again = DataBrain._assign_buckets(full["playerid"])
+    np.testing.assert_array_equal(again["bucket"].to_numpy(), buckets["bucket"].to_numpy())
@@ -0,0 +1,110 @@
+import os
+import numpy as np
+from lightfm.data import Dataset
+
+from gadvi.recommenders import LightFMBased
+from gadvi.utils import is_first_party
+
+
+def _entries(matrix):
+    """ The (row, column, value) entries of a matrix, the repeated ones included, sorted """
+    matrix = matrix.tocoo()
+    return sorted(zip(matrix.row.tolist(), matrix.col.tolist(), matrix.data.astype(float).tolist()))
+
+
+def _baseline(rows):
+    """ The matrices of the rows built by Dataset.build_interactions, one entry per row """
+    dataset = Dataset()
+    dataset.fit(rows["playerid"], rows["GameName"])
+    content = is_first_party(rows["IsSGDContent"])
+    return dataset, dataset.build_interactions(zip(rows["playerid"], rows["GameName"], content))
+
+
+def test_matrices_are_the_ones_of_build_interactions(workspace, rows):
+    dataset, (interactions, weights) = _baseline(rows)
+    model = LightFMBased(dataset="test", dimensions=8, epochs=1)
+
+    built = model.build_matrices(rows)
+    cached = model.build_matrices(rows)
+    for matrices in [built, cached]:
+        assert matrices["dataset"].mapping()[0] == dataset.mapping()[0]
+        assert matrices["dataset"].mapping()[2] == dataset.mapping()[2]
+        assert matrices["interactions"].nnz == interactions.nnz == rows.shape[0]
+        assert _entries(matrices["interactions"]) == _entries(interactions)
+        assert _entries(matrices["weights"]) == _entries(weights)
+    # the entries are aligned in both matrices, as the sample weights of fit need
+    np.testing.assert_array_equal(cached["interactions"].row, cached["weights"].row)
+    np.testing.assert_array_equal(cached["interactions"].col, cached["weights"].col)
+
+
+def test_saved_matrices_are_loaded_until_the_train_data_changes(workspace, rows, monkeypatch):
+    model = LightFMBased(dataset="test", dimensions=8, epochs=1)
+    built, loaded = [], []
+    build_features, load_matrices = LightFMBased._build_features, LightFMBased._load_matrices
+    monkeypatch.setattr(
+        LightFMBased, "_build_features", staticmethod(lambda *args: built.append(1) or build_features(*args))
+    )
+    monkeypatch.setattr(
+        LightFMBased, "_load_matrices", staticmethod(lambda path: loaded.append(path) or load_matrices(path))
+    )
+
+    # the second train on the same rows loads the matrices of the first one
+    model.train(rows.iloc[:5000])
+    assert len(built) == 2 and loaded == []
+    saved = os.listdir(f"{model.path}/matrices")
+    model.train(rows.iloc[:5000])
+    assert len(built) == 2 and len(loaded) == 1
+    assert os.listdir(f"{model.path}/matrices") == saved
+
+    # an update changes the train data, the retrain on it builds and saves new matrices
+    new = rows.iloc[5000:].copy()
+    new["playerid"] = "New_" + new["playerid"].astype(str)
+    model.update(new, epochs=1)
+    del built[:]
+    model.train(model.train_data)
+    assert len(built) == 2 and len(loaded) == 1
+    assert len(os.listdir(f"{model.path}/matrices")) == 2
+
+    # so does a train with other weights
+    model.round_weights = True
+    model.train(rows.iloc[:5000])
+    assert len(built) == 4 and len(loaded) == 1
+    assert len(os.listdir(f"{model.path}/matrices")) == 3
+
+
+def test_feature_matrices_are_the_ones_of_build_features(workspace, rows):
+    dataset = Dataset()
+    dataset.fit(
+        rows["playerid"],
+        rows["GameName"],
+        user_features=rows["CountryPlayer"].unique(),
+        item_features=rows["IsSGDContent"].unique(),
+    )
+    # the features of every row, the way train used to build them
+    user_features = dataset.build_user_features(
+        [(x[0], [x[1]]) for x in rows[["playerid", "CountryPlayer"]].values], normalize=False
+    )
+    item_features = dataset.build_item_features(
+        [(x[0], [x[1]]) for x in rows[["GameName", "IsSGDContent"]].values], normalize=False
+    )
+    model = LightFMBased(dataset="test", dimensions=8, epochs=1)
+
+    built = model.build_matrices(rows)
+    cached = model.build_matrices(rows)
+    (saved,) = os.listdir(f"{model.path}/matrices")
+    assert sorted(os.listdir(f"{model.path}/matrices/{saved}")) == [
+        "interactions.npz",
+        "item_features.npz",
+        "mappings.npz",
+        "user_features.npz",
+        "weights.npz",
+    ]
+    for matrices in [built, cached]:
+        assert matrices["dataset"].mapping() == dataset.mapping()
+        np.testing.assert_allclose(matrices["user_features"].toarray(), user_features.toarray())
+        np.testing.assert_allclose(matrices["item_features"].toarray(), item_features.toarray())
+
+    # the matrices without the features are saved apart
+    without = model.build_matrices(rows, user_features=False, item_features=False)
+    assert without["user_features"] is None and without["item_features"] is None
+    assert len(os.listdir(f"{model.path}/matrices")) == 2
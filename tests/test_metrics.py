@@ -0,0 +1,42 @@
+import os
+import multiprocessing
+
+from gadvi.utils import MetricsRegistry
+
+
+def _registry():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "The requests", ["route"])
+    latency = registry.histogram("request_seconds", "The latency", ["route"], buckets=[0.1, 1.0])
+    registry.gauge("pid", "The pid of the process", lambda: float(os.getpid()))
+    return registry, requests, latency
+
+
+def _worker(directory):
+    registry, requests, latency = _registry()
+    registry.share(directory, interval=60)
+    requests.inc("/predict", amount=2)
+    latency.observe(0.5, "/predict")
+    registry.save()
+
+
+def test_shared_registry_sums_the_workers(tmp_path):
+    directory = str(tmp_path / "metrics")
+    registry, requests, latency = _registry()
+    # the values observed before the fork are not counted by the workers
+    requests.inc("/predict", amount=100)
+
+    worker = multiprocessing.get_context("fork").Process(target=_worker, args=(directory,))
+    worker.start()
+    worker.join()
+    registry.share(directory, interval=60)
+    requests.inc("/predict")
+    latency.observe(0.05, "/predict")
+
+    lines = registry.render().splitlines()
+    assert 'requests_total{route="/predict"} 3.0' in lines
+    assert 'request_seconds_bucket{route="/predict",le="0.1"} 1' in lines
+    assert 'request_seconds_bucket{route="/predict",le="1.0"} 2' in lines
+    assert 'request_seconds_count{route="/predict"} 2' in lines
+    # the gauges of the live processes only
+    assert [line for line in lines if line.startswith("pid{")] == [f'pid{{pid="{os.getpid()}"}} {float(os.getpid())}']
@@ -0,0 +1,25 @@
+import os
+import matplotlib.pyplot as plt
+
+from gadvi import PLOTS_DIR, STATISTICS_DIR
+from gadvi.brain import DataBrain
+from gadvi.plots import FIGURES, TOP, load_statistics, render_plots
+from gadvi.synthetic import sqlite_connector
+
+
+def test_plots_are_rendered_from_the_saved_statistics(database):
+    brain = DataBrain(os.devnull, True, "full", chunksize=1000, connector=sqlite_connector(database), plots=False)
+    brain.start_analysis()
+
+    # the analysis saves the statistics without rendering them
+    assert sorted(os.listdir(f"{STATISTICS_DIR}/full")) == ["games.parquet", "players.parquet"]
+    assert not os.path.exists(f"{PLOTS_DIR}/full") or not os.listdir(f"{PLOTS_DIR}/full")
+    games, players = load_statistics("full")
+    assert games.shape[0] == brain.analysis_report["data"]["full"]["GameName"].nunique()
+    assert players.shape[0] == TOP
+
+    # the plots stage renders one figure per plot, in worker processes, and leaves no figure open
+    paths = render_plots("full", workers=2)
+    assert sorted(paths) == sorted(f"{PLOTS_DIR}/full/{name}.png" for name in FIGURES)
+    assert all(os.path.getsize(path) > 0 for path in paths)
+    assert plt.get_fignums() == []
@@ -0,0 +1,275 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+import pytest
+from lightfm import LightFM
+
+from gadvi import recommenders
+from gadvi.recommenders import LightFMBased
+
+
+def test_update_with_stored_rows_then_popularity_fallback(model, rows):
+    # new rows in the stored format: YYYYMMDD integer dates, new players
+    new = rows.head(500).copy()
+    new["playerid"] = "New_" + new["playerid"].astype(str)
+    new["BeginDate_DWID"] = 20210105
+
+    model.update(new, epochs=1)
+
+    assert pd.api.types.is_datetime64_any_dtype(model.train_data["BeginDate_DWID"])
+    assert model.source(new["playerid"].iloc[0]) == "model"
+    country, operator = str(rows["CountryPlayer"].iloc[0]), str(rows["OperatorName"].iloc[0])
+    recommendations = model.predict("Unknown_player", k=3, country=country, operator=operator)["Unknown_player"]
+    assert model.source("Unknown_player") == "popularity"
+    assert len(recommendations) == 3
+    assert model.first_party[[model.train_dataset._item_id_mapping[g] for g in recommendations]].all()
+
+
+def test_popularity_is_saved_with_the_model(model):
+    model.save()
+    prefix = f"{model.path}/model_{model.name}_{model.d}_{model.loss}"
+    loaded = LightFMBased(dataset="test")
+    loaded.load(f"{prefix}.pickle", f"{prefix}_dataset.pickle", f"{prefix}_data.pickle")
+
+    np.testing.assert_array_equal(loaded.popular_segments, model.popular_segments)
+    np.testing.assert_array_equal(loaded.popular_top, model.popular_top)
+    assert loaded.predict("Unknown_player")["Unknown_player"] == model.popular(3)
+
+
+def test_missing_feature_values(workspace, rows):
+    # some players without a country and some games without a party
+    rows["CountryPlayer"] = rows["CountryPlayer"].where(rows["playerid"].cat.codes % 7 != 0)
+    rows["IsSGDContent"] = rows["IsSGDContent"].where(rows["GameName"].cat.codes % 5 != 0)
+    train, test = rows.iloc[:5000], rows.iloc[5000:]
+    test = test[test["playerid"].isin(train["playerid"]) & test["GameName"].isin(train["GameName"])]
+
+    model = LightFMBased(dataset="test", dimensions=8, epochs=2)
+    model.train(train)
+
+    # the missing values are not features, so the matrices have the columns of the mappings
+    user_ids, user_feature_ids, item_ids, item_feature_ids = model.train_dataset.mapping()
+    assert len(user_feature_ids) == len(user_ids) + rows["CountryPlayer"].nunique()
+    assert len(item_feature_ids) == len(item_ids) + rows["IsSGDContent"].nunique()
+    model.evaluate(test)
+    assert len(model.predict(str(train["playerid"].iloc[0]))[str(train["playerid"].iloc[0])]) == 3
+
+    new = rows.iloc[5000:].copy()
+    new["playerid"] = "New_" + new["playerid"].astype(str)
+    model.update(new, epochs=1)
+    _, user_feature_ids, _, item_feature_ids = model.train_dataset.mapping()
+    assert not any(pd.isnull(f) for f in [*user_feature_ids, *item_feature_ids])
+    model.evaluate(test)
+
+
+def test_predict_searches_the_ann_index_beyond_the_top_n(model, monkeypatch):
+    model.materialize(k=3)
+    model.build_ann()
+    calls = []
+    ann_top_k = model._ann_top_k
+    monkeypatch.setattr(model, "_ann_top_k", lambda player_id, k: calls.append(player_id) or ann_top_k(player_id, k))
+    players = [str(p) for p in model.user_names[:5]] + ["Unknown_player"]
+
+    # the materialized index answers up to its k
+    batch = model.predict_batch(players, k=3)
+    assert calls == []
+    assert batch[players[0]] == model.predict(players[0], k=3)[players[0]]
+
+    # beyond it, the single and the batch predictions search the approximate index, for the known players only
+    batch = model.predict_batch(players, k=5)
+    assert len(calls) == 5
+    assert all(batch[p] == model.predict(p, k=5)[p] for p in players[:5])
+    assert len(calls) == 10
+    assert batch["Unknown_player"] == model.popular(5)
+
+
+def test_load_a_model_saved_before_the_popularity_fallback(model):
+    # the older models have no popularity file, and the dates of their train data are the strings of the tsv files
+    model.save()
+    prefix = f"{model.path}/model_{model.name}_{model.d}_{model.loss}"
+    os.remove(f"{prefix}_popular.npz")
+    data = model.train_data.assign(BeginDate_DWID=model.train_data["BeginDate_DWID"].dt.strftime("%Y-%m-%d"))
+    with open(f"{prefix}_data.pickle", "wb") as fle:
+        pickle.dump(data, fle)
+
+    loaded = LightFMBased(dataset="test")
+    loaded.load(f"{prefix}.pickle", f"{prefix}_dataset.pickle", f"{prefix}_data.pickle")
+    assert pd.api.types.is_datetime64_any_dtype(loaded.train_data["BeginDate_DWID"])
+    np.testing.assert_array_equal(loaded.popular_top, model.popular_top)
+    assert loaded.predict("Unknown_player")["Unknown_player"] == model.popular(3)
+
+
+def _baseline(model, rows, player, k):
+    """
+        The top-k of a player by LightFM's own predict, without the games they played and the 3rd party games, and
+        the scores of all the games
+    """
+    games = model.item_names
+    users = np.full(games.shape[0], model.user_ids[player], dtype=np.int32)
+    scores = model.model.predict(users, np.arange(games.shape[0], dtype=np.int32))
+    third_party = set(rows.loc[rows["IsSGDContent"].astype(str) != "1st Party", "GameName"].astype(str))
+    seen = set(rows.loc[rows["playerid"].astype(str) == player, "GameName"].astype(str))
+    candidates = [i for i in np.argsort(-scores, kind="stable") if games[i] not in seen | third_party]
+    return games[candidates[:k]].tolist(), dict(zip(games, scores))
+
+
+def _assert_baseline(recommendations, expected):
+    """ The recommendations are the baseline ones, up to the order of the games whose scores are float ties """
+    for player, (games, scores) in expected.items():
+        assert len(recommendations[player]) == len(games)
+        ties = {g for g, s in scores.items() if np.isclose(s, scores[games[-1]], rtol=1e-5)}
+        assert set(recommendations[player]) <= set(games) | ties
+        actual = [scores[g] for g in recommendations[player]]
+        np.testing.assert_allclose(actual, [scores[g] for g in games], rtol=1e-5, atol=1e-6)
+
+
+def test_materialized_exported_and_scored_recommendations_are_the_baseline_ones(model, rows):
+    players = [str(p) for p in model.user_names[:20]]
+    n_games = model.item_names.shape[0]
+
+    # k beyond the games a player can be recommended: the lists are shorter, and the matrices padded with -1
+    for k in [3, n_games]:
+        expected = {p: _baseline(model, rows, p, k) for p in players}
+        assert any(len(games) < k for games, _ in expected.values()) == (k == n_games)
+
+        top = model._top_k(np.array([model.user_ids[p] for p in players]), k)
+        _assert_baseline({p: model.item_names[row[row >= 0]].tolist() for p, row in zip(players, top)}, expected)
+        assert all((row[(row >= 0).sum():] == -1).all() for row in top)
+
+        model.materialize(k=k)
+        _assert_baseline(model.predict_batch(players, k=k), expected)
+
+        served = LightFMBased(dataset="test")
+        served.load_serving(model.export())
+        assert served.top_n.shape[1] == k
+        _assert_baseline({p: served.predict(p, k=k)[p] for p in players}, expected)
+
+
+def test_update_adds_the_new_players_and_games_and_keeps_the_old_ones(model, rows):
+    new = rows.tail(300).copy()
+    new["playerid"] = "New_" + new["playerid"].astype(str)
+    new["GameName"] = new["GameName"].astype(str).where(new.index % 2 == 0, "New_game")
+    new["IsSGDContent"] = new["IsSGDContent"].astype(str).where(new["GameName"] != "New_game", "1st Party")
+    n_players, n_games = new["playerid"].nunique(), 1
+
+    # the rows of the new features are added after the old ones, which are kept as they are
+    lightfm = model.model
+    old = {
+        name: getattr(lightfm, name).copy()
+        for prefix in ["user", "item"]
+        for name in [f"{prefix}_embeddings", f"{prefix}_biases", f"{prefix}_embedding_gradients"]
+    }
+    model.train_dataset.fit_partial(users=new["playerid"].unique(), items=new["GameName"].unique())
+    model._grow_model()
+    for name, before in old.items():
+        added = n_players if name.startswith("user") else n_games
+        assert getattr(lightfm, name).shape[0] == before.shape[0] + added
+        np.testing.assert_array_equal(getattr(lightfm, name)[: before.shape[0]], before)
+    n_user_features, n_item_features = lightfm.user_embeddings.shape[0], lightfm.item_embeddings.shape[0]
+
+    # the update itself adds nothing more, and the new player is answered by the model
+    model.update(new, epochs=1)
+    assert lightfm.user_embeddings.shape[0] == n_user_features
+    assert lightfm.item_embeddings.shape[0] == n_item_features
+    assert model.user_embeddings.shape[0] == model.user_names.shape[0] == len(model.train_dataset._user_id_mapping)
+    assert "New_game" in model.item_names
+
+    player = str(new["playerid"].iloc[0])
+    assert model.source(player) == "model"
+    recommendations = model.predict(player, k=3)[player]
+    assert len(recommendations) == 3
+    assert not set(recommendations) & set(new.loc[new["playerid"] == player, "GameName"])
+    assert model.first_party[[model.train_dataset._item_id_mapping[g] for g in recommendations]].all()
+
+
+def test_fit_and_metrics_run_with_the_threads_of_the_model_and_every_epoch_is_timed(workspace, rows, monkeypatch):
+    threads = []
+    fit_partial = LightFM.fit_partial
+
+    def spy_fit_partial(self, *args, **kwargs):
+        threads.append(("fit", kwargs["num_threads"]))
+        return fit_partial(self, *args, **kwargs)
+
+    monkeypatch.setattr(LightFM, "fit_partial", spy_fit_partial)
+    for name in ["precision_at_k", "recall_at_k", "auc_score"]:
+        metric = getattr(recommenders, name)
+        monkeypatch.setattr(
+            recommenders,
+            name,
+            lambda *args, name=name, metric=metric, **kwargs: threads.append((name, kwargs["num_threads"]))
+            or metric(*args, **kwargs),
+        )
+
+    model = LightFMBased(dataset="test", dimensions=8, epochs=3, num_threads=3)
+    model.train(rows.iloc[:5000])
+    assert threads == [("fit", 3)] * 3 + [("precision_at_k", 3), ("recall_at_k", 3), ("auc_score", 3)]
+    assert len(model.epoch_seconds) == 3 and all(seconds > 0 for seconds in model.epoch_seconds)
+
+    del threads[:]
+    model.evaluate(rows.iloc[5000:])
+    assert threads == [("precision_at_k", 3), ("recall_at_k", 3), ("auc_score", 3)]
+
+
+def test_update_continues_the_fit_on_the_new_rows_and_the_replayed_ones(model, rows, monkeypatch):
+    fitted = []
+    fit_partial = LightFM.fit_partial
+
+    def spy_fit_partial(self, interactions, **kwargs):
+        fitted.append((self, interactions.nnz, kwargs["epochs"]))
+        return fit_partial(self, interactions, **kwargs)
+
+    monkeypatch.setattr(LightFM, "fit_partial", spy_fit_partial)
+    lightfm, n_train = model.model, model.train_data.shape[0]
+    new = rows.head(200).copy()
+    new["playerid"] = "New_" + new["playerid"].astype(str)
+
+    # the same model is fitted further, one epoch at a time, on the new rows only
+    model.update(new, epochs=2)
+    assert model.model is lightfm
+    assert fitted == [(lightfm, 200, 1)] * 2
+    assert model.train_data.shape[0] == n_train + 200
+
+    # along with a sample of the old rows
+    del fitted[:]
+    model.update(new, epochs=1, replay=0.1)
+    assert fitted == [(lightfm, 200 + round((n_train + 200) * 0.1), 1)]
+    assert model.train_data.shape[0] == n_train + 400
+
+
+def test_update_needs_a_trained_model(rows):
+    with pytest.raises(ValueError):
+        LightFMBased(dataset="test").update(rows)
+
+
+def _popularity(rows, half_life, **segment):
+    """
+        The round counts of the 1st party games in the rows of a segment, where the round counts of a day weigh half
+        every half_life days before the latest day of all the rows
+    """
+    days = (rows["BeginDate_DWID"].max() - rows["BeginDate_DWID"]) / pd.Timedelta(days=1)
+    weights = rows["RoundCount"] * 0.5 ** (days / half_life)
+    kept = rows["IsSGDContent"].astype(str) == "1st Party"
+    for column, value in segment.items():
+        kept &= rows[column].astype(str) == value
+    return weights[kept].groupby(rows.loc[kept, "GameName"].astype(str)).sum()
+
+
+def test_popularity_fallback_answers_from_the_most_specific_segment(workspace, rows):
+    model = LightFMBased(dataset="test", dimensions=8, epochs=1, popularity_half_life=7)
+    model.train(rows)
+    country, operator = str(rows["CountryPlayer"].iloc[0]), str(rows["OperatorName"].iloc[0])
+
+    for answer, segment in [
+        (model.popular(5, country, operator), {"CountryPlayer": country, "OperatorName": operator}),
+        (model.popular(5, country, "Unknown_operator"), {"CountryPlayer": country}),
+        (model.popular(5, "Unknown_country", operator), {"OperatorName": operator}),
+        (model.popular(5), {}),
+        (model.predict("Unknown_player", k=5)["Unknown_player"], {}),
+    ]:
+        weights = _popularity(rows, 7, **segment)
+        expected = weights.sort_values(ascending=False).head(5)
+        assert len(answer) == expected.shape[0]
+        np.testing.assert_allclose(weights[answer].to_numpy(), expected.to_numpy(), rtol=1e-6)
+
+    # the segments differ
+    assert model.popular(20, country, operator) != model.popular(20)
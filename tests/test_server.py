@@ -0,0 +1,41 @@
+from gadvi.serving import MAX_K
+
+
+def test_reload_is_disabled_without_an_admin_token(server, monkeypatch):
+    monkeypatch.setattr(server, "admin_token", None)
+    calls = []
+    monkeypatch.setattr(server.holder, "reload", lambda *args, **kwargs: calls.append(args) or True)
+    client = server.app.test_client()
+
+    response = client.post("/reload", json={"path": "/etc/passwd"})
+    assert response.status_code == 403
+    response = client.post("/reload", headers={"X-Admin-Token": ""})
+    assert response.status_code == 403
+    assert calls == []
+
+
+def test_reload_needs_the_admin_token_and_ignores_a_path(server, monkeypatch):
+    monkeypatch.setattr(server, "admin_token", "secret")
+    calls = []
+    monkeypatch.setattr(server.holder, "reload", lambda *args, **kwargs: calls.append(args) or True)
+    client = server.app.test_client()
+
+    assert client.post("/reload", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    response = client.post("/reload", json={"path": "/etc/passwd"}, headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 202
+    assert response.json["data"]["path"] == server.holder.path
+    assert calls == [()]
+
+
+def test_batch_predict_validates_k(server):
+    client = server.app.test_client()
+    player = str(server.holder.model.user_names[0])
+
+    for k in ["abc", 0, -1, 1.5, True, MAX_K + 1]:
+        response = client.post("/predict/batch", json={"playerids": [player], "k": k})
+        assert response.status_code == 400, k
+        assert response.json["isError"] and "k must be" in response.json["message"]
+    response = client.post("/predict/batch", json={"playerids": [player], "k": 2})
+    assert response.status_code == 200
+    assert len(response.json["data"][player]) == 2
+    assert len(client.post("/predict/batch", json={"playerids": [player]}).json["data"][player]) == 3
@@ -0,0 +1,139 @@
+import os
+import time
+import asyncio
+import numpy as np
+
+from gadvi.recommenders import LightFMBased
+from gadvi.serving import MicroBatcher, ModelHolder, PredictionCache
+from gadvi.utils import LocalCache, cache
+
+
+def _serve(path: str) -> LightFMBased:
+    served = LightFMBased()
+    served.load_serving(path, mmap_mode="r")
+    return served
+
+
+def test_export_does_not_rewrite_the_served_files(model):
+    path = model.export()
+    served = _serve(path)
+    embeddings = np.array(served.user_embeddings)
+    stamp = ModelHolder._modified(path)
+
+    model.user_embeddings = model.user_embeddings + 1.0
+    assert model.export(path) == path
+
+    # the old version is still mapped and unchanged, the path points to the new one
+    assert os.path.islink(path)
+    np.testing.assert_array_equal(served.user_embeddings, embeddings)
+    np.testing.assert_array_equal(_serve(path).user_embeddings, embeddings + 1.0)
+    assert ModelHolder._modified(path) != stamp
+
+
+def test_export_replaces_an_artifact_written_in_place(model):
+    path = f"{model.path}/in_place_serving"
+    os.makedirs(path)
+    model.export(path)
+
+    assert os.path.islink(path)
+    np.testing.assert_array_equal(_serve(path).user_embeddings, model.user_embeddings)
+
+
+def test_export_keeps_the_latest_versions(model):
+    path = model.export()
+    for _ in range(4):
+        model.export(path)
+
+    assert len(os.listdir(f"{path}.versions")) == 3
+    assert os.path.realpath(path).startswith(os.path.realpath(f"{path}.versions"))
+
+
+def test_local_cache_evicts_the_least_recently_used_and_expires_entries(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    local = LocalCache(max_size=2, ttl=10)
+
+    local.set("a", 1)
+    local.set("b", 2)
+    assert local.get("a") == 1
+    # "b" is the least recently used
+    local.set("c", 3)
+    assert local.get("b") is None
+    assert local.get("a") == 1 and local.get("c") == 3
+
+    now[0] += 11
+    assert local.get("a") is None
+    assert local.stats() == {"size": 1, "hits": 3, "misses": 2, "evictions": 1, "expirations": 1}
+    local.clear()
+    assert local.stats()["size"] == 0
+
+
+def test_prediction_cache_is_cleared_when_a_new_model_is_served(model):
+    path = model.export()
+    holder = ModelHolder(path, loader=_serve)
+    local = LocalCache()
+    predictions = PredictionCache(holder, local)
+    player = str(holder.model.user_names[0])
+
+    assert predictions.predict(player) == holder.model.predict(player)
+    assert predictions.predict(player) == holder.model.predict(player)
+    assert predictions.predict("Unknown_player") == holder.model.predict("Unknown_player")
+    assert (local.hits, local.misses, local.stats()["size"]) == (1, 1, 1)
+
+    assert holder.reload(wait=True)
+    assert local.stats()["size"] == 0
+    assert predictions.predict(player) == holder.model.predict(player)
+    assert local.misses == 2
+
+
+def test_micro_batcher_answers_with_the_model_served_when_the_request_arrived(model):
+    path = model.export()
+    holder = ModelHolder(path, loader=_serve)
+    local = LocalCache()
+    batcher = MicroBatcher(holder, window=0.01, cache=PredictionCache(holder, local))
+    old, new = holder.model, _serve(path)
+    scored = []
+
+    def spy(served):
+        predict_batch = served.predict_batch
+        served.predict_batch = lambda players, k: scored.append((served, len(players))) or predict_batch(players, k)
+
+    spy(old)
+    spy(new)
+    players = [str(p) for p in old.user_names[:4]]
+
+    async def requests():
+        pending = [asyncio.ensure_future(batcher.predict(p)) for p in players]
+        await asyncio.sleep(0)
+        # the model is swapped before the batch is scored
+        holder.model = new
+        return await asyncio.gather(*pending)
+
+    answers = asyncio.run(requests())
+    assert answers == [old.predict(p) for p in players]
+    assert scored == [(old, 4)]
+    assert local.get(PredictionCache._key(old, players[0], 3)) == answers[0][players[0]]
+
+
+def test_micro_batcher_scores_the_concurrent_requests_as_one_batch(model):
+    holder = ModelHolder(model.export(), loader=_serve)
+    served = holder.model
+    batches = []
+    predict_batch = served.predict_batch
+    served.predict_batch = lambda players, k: batches.append((sorted(players), k)) or predict_batch(players, k)
+    players = [str(p) for p in served.user_names[:6]]
+
+    async def requests(batcher, ks):
+        return await asyncio.gather(*[batcher.predict(p, k) for p, k in zip(players, ks)], batcher.predict("Unknown"))
+
+    # the requests of a window are scored together, one batch per k, and the unknown player is not batched
+    answers = asyncio.run(requests(MicroBatcher(holder, window=0.05), [3, 3, 3, 3, 5, 5]))
+    assert sorted(batches) == sorted([(sorted(players[:4]), 3), (sorted(players[4:]), 5)])
+    assert answers == [served.predict(p, k) for p, k in zip(players, [3, 3, 3, 3, 5, 5])] + [served.predict("Unknown")]
+
+    # a full batch is scored without waiting for the window to close
+    del batches[:]
+    start = time.monotonic()
+    asyncio.run(requests(MicroBatcher(holder, window=10, max_batch=6), [3] * 6))
+    assert time.monotonic() - start < 5
+    assert batches == [(sorted(players), 3)]
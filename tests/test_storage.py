@@ -0,0 +1,50 @@
+import os
+import pandas as pd
+import pyarrow as pa
+
+from gadvi.utils import DatasetWriter, load_dataset, save_dataset
+
+
+def test_a_column_without_values_in_the_first_chunk_takes_the_type_of_the_later_ones(tmp_path):
+    path = str(tmp_path / "full")
+    chunks = [
+        pd.DataFrame({"playerid": ["a", "b"], "GameProviderName": [None, None], "RoundCount": [1, 2]}),
+        pd.DataFrame({"playerid": ["c", "d"], "GameProviderName": ["x", None], "RoundCount": [3, 4]}),
+    ]
+    with DatasetWriter(path, tsv=True) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+    stored = load_dataset(f"{path}.parquet")
+    assert stored["GameProviderName"].isna().tolist() == [True, True, False, True]
+    assert stored["GameProviderName"].dropna().tolist() == ["x"]
+    assert stored["RoundCount"].tolist() == [1, 2, 3, 4]
+    assert load_dataset(f"{path}.tsv").shape[0] == writer.rows == 4
+
+
+def test_a_column_without_values_beyond_the_buffer_is_stored_as_strings(tmp_path):
+    path = str(tmp_path / "full")
+    with DatasetWriter(path, buffer_rows=2) as writer:
+        writer.write(pd.DataFrame({"playerid": ["a", "b"], "GameProviderName": [None, None]}))
+        writer.write(pd.DataFrame({"playerid": ["c"], "GameProviderName": [7]}))
+
+    stored = load_dataset(f"{path}.parquet")
+    assert stored["GameProviderName"].isna().tolist() == [True, True, False]
+    assert stored["GameProviderName"].dropna().tolist() == ["7"]
+
+
+def test_a_dataset_without_rows_replaces_the_previous_one(tmp_path):
+    path = str(tmp_path / "full")
+    save_dataset(pd.DataFrame({"playerid": ["a"]}), path, tsv=True)
+
+    # without a schema, the previous dataset is removed
+    with DatasetWriter(path, tsv=True):
+        pass
+    assert not os.path.exists(f"{path}.parquet") and not os.path.exists(f"{path}.tsv")
+
+    # with a schema, the dataset is empty
+    schema = pa.schema([("playerid", pa.string()), ("RoundCount", pa.int64())])
+    with DatasetWriter(path, schema=schema):
+        pass
+    stored = load_dataset(f"{path}.parquet")
+    assert stored.shape[0] == 0 and stored.columns.tolist() == ["playerid", "RoundCount"]
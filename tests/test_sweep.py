@@ -0,0 +1,97 @@
+import os
+import importlib.util
+
+import yaml
+import numpy as np
+
+from gadvi.recommenders import TEST_COLUMNS, TRAIN_COLUMNS, LightFMBased
+from gadvi.utils import load_dataset, save_dataset
+
+CONFIG = {
+    "dataset": "test",
+    "name": "sweep",
+    "dimensions": 8,
+    "loss": "warp",
+    "epochs": 1,
+    "user_features": False,
+    "item_featres": False,
+    "num_threads": 1,
+    "round_weights": False,
+    "popularity_half_life": 7,
+}
+
+
+def _main():
+    """ The module of the command line interface """
+    path = os.path.join(os.path.dirname(__file__), "..", "scripts", "main.py")
+    spec = importlib.util.spec_from_file_location("gadvi_main", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_sweep_saves_the_best_model_like_train(workspace, rows):
+    save_dataset(rows.iloc[:5000], str(workspace / "train"))
+    save_dataset(rows.iloc[5000:], str(workspace / "test"))
+    with open(workspace / "config.yml", "w") as f:
+        yaml.safe_dump(CONFIG, f)
+    with open(workspace / "sweep.yml", "w") as f:
+        yaml.safe_dump({"search": "grid", "space": {"dimensions": [4, 8]}}, f)
+
+    _main().model_sweep(
+        str(workspace / "config.yml"),
+        str(workspace / "sweep.yml"),
+        str(workspace / "train.parquet"),
+        str(workspace / "test.parquet"),
+        workers=1,
+    )
+
+    # the top-n index and the serving artifact are saved with the best model
+    best = LightFMBased(dataset="test", name="sweep")
+    prefixes = [f for f in os.listdir(best.path) if f.startswith("model_sweep_") and f.endswith("_topn.npz")]
+    assert len(prefixes) == 1
+    prefix = f"{best.path}/{prefixes[0][: -len('_topn.npz')]}"
+    assert os.path.isdir(f"{prefix}_serving")
+    served = LightFMBased(dataset="test")
+    served.load_serving(f"{prefix}_serving")
+    assert served.top_n is not None
+
+    # the popularity fallback of the best model weighs the days with the configured half-life
+    reference = LightFMBased(dataset="test", dimensions=4, epochs=1, popularity_half_life=7)
+    reference.train(rows.iloc[:5000])
+    np.testing.assert_array_equal(served.popular_top, reference.popular_top)
+
+
+def test_train_and_update_read_only_the_columns_they_use(workspace, rows, monkeypatch):
+    save_dataset(rows.iloc[:4000], str(workspace / "train"))
+    save_dataset(rows.iloc[4000:5000], str(workspace / "new"))
+    save_dataset(rows.iloc[5000:], str(workspace / "test"))
+    with open(workspace / "config.yml", "w") as f:
+        yaml.safe_dump(CONFIG, f)
+
+    main = _main()
+    loaded = []
+
+    def spy_load_dataset(path, columns=None):
+        data = load_dataset(path, columns=columns)
+        loaded.append((os.path.basename(path), list(data.columns)))
+        return data
+
+    monkeypatch.setattr(main, "load_dataset", spy_load_dataset)
+    main.model_train_evaluate(str(workspace / "config.yml"), str(workspace / "train"), str(workspace / "test"))
+    main.model_update(str(workspace / "config.yml"), str(workspace / "new"), str(workspace / "test"))
+
+    assert loaded == [
+        ("train", TRAIN_COLUMNS),
+        ("test", TEST_COLUMNS),
+        ("new", TRAIN_COLUMNS),
+        ("test", TEST_COLUMNS),
+    ]
+    # the popularity fallback of the updated model is still segmented by country and operator
+    updated = LightFMBased(dataset="test", name="sweep", dimensions=8)
+    prefix = f"{updated.path}/model_sweep_8_warp"
+    updated.load(f"{prefix}.pickle", f"{prefix}_dataset.pickle", f"{prefix}_data.pickle")
+    assert sorted(updated.train_data.columns) == sorted(TRAIN_COLUMNS)
+    reference = LightFMBased(dataset="test", dimensions=4, epochs=1)
+    reference.train(rows.iloc[:5000])
+    np.testing.assert_array_equal(updated.popular_segments, reference.popular_segments)